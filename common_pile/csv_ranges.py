@@ -0,0 +1,120 @@
+"""Process large csv files in parallel by splitting them into byte ranges.
+
+Some of our scrapes are a single csv with the html of every page, so reading
+it row by row in one process, and running html extraction on each, is slow.
+`split_csv` finds byte offsets that split the file into ~`chunk_size` byte
+ranges on row boundaries (newlines in quoted fields, which html has plenty of,
+are skipped), so each range can be read on its own by a worker with
+`read_csv_range`. `csv_to_dolma` runs a row function over all the ranges in
+parallel and writes one dolma shard per range.
+"""
+
+import csv
+import functools
+import os
+import sys
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from common_pile.write import to_dolma_parallel
+
+csv.field_size_limit(sys.maxsize)
+
+QUOTE = b'"'
+NEWLINE = b"\n"
+
+
+def _next_row_start(f, offset: int, quoted: bool, block_size: int) -> int:
+    """The offset after the first newline at or past `offset` that ends a row.
+
+    `quoted` is if `offset` is inside a quoted field. As quotes in a field are
+    escaped by doubling them, we are outside of a quoted field whenever we have
+    seen an even number of quotes.
+    """
+    f.seek(offset)
+    while block := f.read(block_size):
+        start = 0
+        while (newline := block.find(NEWLINE, start)) != -1:
+            quoted ^= block.count(QUOTE, start, newline) % 2 == 1
+            if not quoted:
+                return offset + newline + 1
+            start = newline + 1
+        quoted ^= block.count(QUOTE, start) % 2 == 1
+        offset += len(block)
+    return offset
+
+
+def split_csv(
+    path: str, chunk_size: int, header: bool = True, block_size: int = 2**20
+) -> List[Tuple[int, int]]:
+    """Split the csv at `path` into (start, end) byte ranges of about `chunk_size` bytes.
+
+    Each range starts at the beginning of a row and ends after the last byte of
+    a row. When `header=True` the first row isn't included in any range.
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, "rb") as f:
+        start = _next_row_start(f, 0, False, block_size) if header else 0
+        while start < size:
+            # Count the quotes up to the split point to know if it is in a
+            # quoted field, rows always start outside of one.
+            target, quoted = start + chunk_size, False
+            f.seek(start)
+            remaining = chunk_size
+            while remaining > 0 and (block := f.read(min(block_size, remaining))):
+                quoted ^= block.count(QUOTE) % 2 == 1
+                remaining -= len(block)
+            end = min(_next_row_start(f, target, quoted, block_size), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def read_csv_range(
+    path: str, start: int, end: int, encoding: str = "utf-8"
+) -> Iterator[List[str]]:
+    """Read the csv rows in the byte range [start, end)."""
+
+    def lines():
+        with open(path, "rb") as f:
+            f.seek(start)
+            while f.tell() < end and (line := f.readline()):
+                yield line.decode(encoding)
+
+    yield from csv.reader(lines())
+
+
+def _process_range(
+    process_row: Callable[[List[str]], Optional[Dict]], csv_range: Tuple[str, int, int]
+) -> Iterator[Dict]:
+    for row in read_csv_range(*csv_range):
+        if (example := process_row(row)) is not None:
+            yield example
+
+
+def csv_to_dolma(
+    path: str,
+    process_row: Callable[[List[str]], Optional[Dict]],
+    output_path: str,
+    filename: str,
+    chunk_size: int = 256 * 1000 * 1000,
+    processes: int = 1,
+    header: bool = True,
+    quiet: bool = False,
+) -> int:
+    """Convert each row of the csv at `path` into a dolma example in parallel.
+
+    `process_row` is called (in a worker process, so it must be picklable,
+    i.e. a module level function) with the list of fields in a row and
+    returns an example, or `None` to skip the row. Each `chunk_size` byte
+    range of the csv becomes one shard. Returns the number of examples written.
+    """
+    ranges = [(path, start, end) for start, end in split_csv(path, chunk_size, header)]
+    return to_dolma_parallel(
+        ranges,
+        functools.partial(_process_range, process_row),
+        output_path,
+        filename,
+        processes=processes,
+        quiet=quiet,
+    )
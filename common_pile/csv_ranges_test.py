@@ -0,0 +1,80 @@
+"""Tests for splitting csv files into byte ranges on row boundaries."""
+
+import csv
+import gzip
+import json
+import os
+import random
+
+import pytest
+
+from common_pile.csv_ranges import csv_to_dolma, read_csv_range, split_csv
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "html"])
+        writer.writerows(rows)
+
+
+@pytest.fixture
+def rows():
+    r = random.Random(42)
+    return [
+        [
+            str(i),
+            # Html with newlines, quotes, and commas inside of quoted fields.
+            "\n".join(
+                f'<p class="x">{"é, " * r.randint(0, 20)}</p>\n""'
+                for _ in range(r.randint(0, 5))
+            ),
+        ]
+        for i in range(200)
+    ]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 50, 1000, 10**9])
+@pytest.mark.parametrize("block_size", [7, 2**20])
+def test_split_csv_on_row_boundaries(tmp_path, rows, chunk_size, block_size):
+    path = str(tmp_path / "pages.csv")
+    write_csv(path, rows)
+    ranges = split_csv(path, chunk_size, block_size=block_size)
+    assert ranges[-1][1] == os.path.getsize(path)
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    read = [row for start, end in ranges for row in read_csv_range(path, start, end)]
+    assert read == rows
+    if chunk_size == 1:
+        assert len(ranges) == len(rows)
+
+
+def test_split_csv_without_trailing_newline(tmp_path):
+    path = tmp_path / "pages.csv"
+    path.write_text('a,b\n1,"x\ny"\n2,z')
+    ranges = split_csv(str(path), 1)
+    assert [list(read_csv_range(str(path), *r)) for r in ranges] == [
+        [["1", "x\ny"]],
+        [["2", "z"]],
+    ]
+
+
+def to_example(row):
+    id, html = row
+    if int(id) % 2:
+        return None
+    return {"id": id, "text": html}
+
+
+def test_csv_to_dolma(tmp_path, rows):
+    path = str(tmp_path / "pages.csv")
+    write_csv(path, rows)
+    output = tmp_path / "output"
+    total = csv_to_dolma(
+        path, to_example, str(output), "pages.jsonl.gz", 2000, processes=2, quiet=True
+    )
+    assert total == 100
+    examples = []
+    for shard in sorted(os.listdir(output)):
+        with gzip.open(output / shard, "rt") as f:
+            examples.extend(json.loads(line) for line in f)
+    assert examples == [{"id": id, "text": html} for id, html in rows[::2]]
@@ -0,0 +1,250 @@
+"""A shared interface for pulling text, elements, and links out of html.
+
+Many sources use `BeautifulSoup(html, "html.parser")` for this, which is often
+the slowest part of their processing. `parse` returns a `Node` with the parts
+of the bs4 api we use (`get_text`, `find`, `find_all`, ...) that can be
+backed by bs4 or by lxml, which is much faster, i.e.,
+
+    doc = html.parse(page, backend="lxml")
+    title = doc.find("h1", class_="title").get_text(strip=True)
+    links = doc.links(base_url)
+
+The lxml backend follows bs4's semantics (`class_` matches any single class
+or the whole class attribute, `script`/`style` text isn't included in
+`get_text`, ...), `html_test.py` checks they agree on fixture pages. As lxml
+fixes broken markup differently than `html.parser`, whitespace in the
+extracted text can differ.
+"""
+
+import abc
+import re
+from typing import Dict, Iterator, List, Optional, Set, Union
+from urllib.parse import urljoin
+
+import lxml.etree
+import lxml.html
+
+BACKENDS = ("bs4", "lxml")
+# bs4 doesn't include the text in these tags in `get_text`.
+NON_TEXT_TAGS = ("script", "style", "template")
+
+Pattern = Union[None, bool, str, re.Pattern, List, tuple]
+
+
+def matches(value: Optional[str], pattern: Pattern, multi_valued: bool = False) -> bool:
+    """Check an attribute value against a bs4 style filter.
+
+    `True` matches any value, strings must match exactly, regexes use
+    `search`, and lists match if any item does. For multi-valued
+    attributes (class) each value is checked, then the whole attribute.
+    """
+    if pattern is None:
+        return True
+    if isinstance(pattern, bool):
+        return (value is not None) == pattern
+    if value is None:
+        return False
+    if isinstance(pattern, (list, tuple)):
+        return any(matches(value, p, multi_valued) for p in pattern)
+    candidates = value.split() + [value] if multi_valued else [value]
+    if isinstance(pattern, re.Pattern):
+        return any(pattern.search(c) for c in candidates)
+    return pattern in candidates
+
+
+class Node(abc.ABC):
+    """An html element (or the whole document) from any backend."""
+
+    @property
+    @abc.abstractmethod
+    def name(self) -> str:
+        """The tag name of the element."""
+
+    @abc.abstractmethod
+    def get(self, attr: str, default: Optional[str] = None) -> Optional[str]:
+        """An attribute of the element, multi-valued attributes are a single string."""
+
+    @abc.abstractmethod
+    def strings(self) -> Iterator[str]:
+        """All text in the element, in document order, like bs4's `_all_strings`."""
+
+    @property
+    @abc.abstractmethod
+    def children(self) -> Iterator[Union[str, "Node"]]:
+        """Direct children, text is `str` and elements are `Node`s."""
+
+    @abc.abstractmethod
+    def find_all(
+        self,
+        name: Pattern = None,
+        attrs: Optional[Dict[str, Pattern]] = None,
+        class_: Pattern = None,
+        limit: Optional[int] = None,
+        **kwargs: Pattern,
+    ) -> List["Node"]:
+        """Elements below this one that match, `kwargs` are more `attrs`."""
+
+    def find(
+        self,
+        name: Pattern = None,
+        attrs: Optional[Dict[str, Pattern]] = None,
+        class_: Pattern = None,
+        **kwargs: Pattern,
+    ) -> Optional["Node"]:
+        found = self.find_all(name, attrs, class_, limit=1, **kwargs)
+        return found[0] if found else None
+
+    def get_text(self, separator: str = "", strip: bool = False) -> str:
+        strings = self.strings()
+        if strip:
+            strings = (s.strip() for s in strings)
+            strings = (s for s in strings if s)
+        return separator.join(strings)
+
+    @property
+    def text(self) -> str:
+        return self.get_text()
+
+    def links(self, base_url: str = "") -> Set[str]:
+        """The targets of all `<a href=...>`, relative links are joined to `base_url`."""
+        return {
+            urljoin(base_url, href)
+            for a in self.find_all("a")
+            if (href := a.get("href"))
+        }
+
+
+class BS4Node(Node):
+    """The reference backend, this is just a thin wrapper around bs4."""
+
+    def __init__(self, node):
+        self.node = node
+
+    @property
+    def name(self) -> str:
+        return self.node.name
+
+    def get(self, attr: str, default: Optional[str] = None) -> Optional[str]:
+        value = self.node.get(attr, default)
+        return " ".join(value) if isinstance(value, list) else value
+
+    def strings(self) -> Iterator[str]:
+        return self.node._all_strings()
+
+    @property
+    def children(self) -> Iterator[Union[str, Node]]:
+        import bs4
+
+        for child in self.node.children:
+            if isinstance(child, bs4.Tag):
+                yield BS4Node(child)
+            elif type(child) is bs4.NavigableString:
+                yield str(child)
+
+    def find_all(self, name=None, attrs=None, class_=None, limit=None, **kwargs):
+        if class_ is not None:
+            kwargs["class_"] = class_
+        return [
+            BS4Node(n)
+            for n in self.node.find_all(name, attrs or {}, limit=limit, **kwargs)
+        ]
+
+
+class LxmlNode(Node):
+    def __init__(self, node, document: bool = False):
+        self.node = node
+        # The whole document is a level above the root <html>, so it is
+        # included when searching.
+        self.document = document
+
+    @property
+    def name(self) -> str:
+        return "[document]" if self.document else self.node.tag
+
+    def get(self, attr: str, default: Optional[str] = None) -> Optional[str]:
+        return self.node.get(attr, default)
+
+    def strings(self) -> Iterator[str]:
+        return _lxml_strings(self.node)
+
+    @property
+    def children(self) -> Iterator[Union[str, Node]]:
+        if self.node.text and self.node.tag not in NON_TEXT_TAGS:
+            yield self.node.text
+        for child in self.node:
+            if isinstance(child.tag, str):
+                yield LxmlNode(child)
+            if child.tail:
+                yield child.tail
+
+    def find_all(self, name=None, attrs=None, class_=None, limit=None, **kwargs):
+        attrs = {**(attrs or {}), **kwargs}
+        if class_ is not None:
+            attrs["class"] = class_
+        tag = name if isinstance(name, str) else None
+        if self.document:
+            elements = self.node.iter(tag)
+        else:
+            elements = self.node.iterdescendants(tag)
+        found = []
+        for element in elements:
+            # Skip comments and processing instructions.
+            if not isinstance(element.tag, str):
+                continue
+            if tag is None and not matches(element.tag, name):
+                continue
+            if all(
+                matches(element.get(k), v, multi_valued=k == "class")
+                for k, v in attrs.items()
+            ):
+                found.append(LxmlNode(element))
+                if limit and len(found) >= limit:
+                    break
+        return found
+
+
+def _lxml_strings(element) -> Iterator[str]:
+    if element.tag in NON_TEXT_TAGS:
+        return
+    if element.text and isinstance(element.tag, str):
+        yield element.text
+    for child in element:
+        if isinstance(child.tag, str):
+            yield from _lxml_strings(child)
+        if child.tail:
+            yield child.tail
+
+
+def parse(html: Union[str, bytes], backend: str = "lxml") -> Node:
+    """Parse an html document (or fragment) with `backend`."""
+    if backend == "bs4":
+        import bs4
+
+        return BS4Node(bs4.BeautifulSoup(html, "html.parser"))
+    if backend != "lxml":
+        raise ValueError(f"Unknown html backend {backend}, expected one of {BACKENDS}")
+    if isinstance(html, bytes):
+        # Without a <meta charset> lxml assumes latin-1, most of our pages are utf-8.
+        try:
+            html = html.decode("utf-8")
+        except UnicodeDecodeError:
+            pass
+    if isinstance(html, str):
+        # lxml won't parse strings with an xml encoding declaration.
+        html = html.encode("utf-8")
+        parser = UTF8_PARSER
+    else:
+        parser = None
+    try:
+        return LxmlNode(lxml.html.document_fromstring(html, parser=parser), True)
+    except lxml.etree.ParserError:
+        # An empty document.
+        return LxmlNode(lxml.html.Element("html"), True)
+
+
+UTF8_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+
+
+def get_text(html: Union[str, bytes], backend: str = "lxml", **kwargs) -> str:
+    """The text of an html document, like `BeautifulSoup(html).get_text()`."""
+    return parse(html, backend).get_text(**kwargs)
@@ -0,0 +1,141 @@
+"""Check that the lxml html backend extracts the same things as bs4."""
+
+import re
+
+import pytest
+from bs4 import BeautifulSoup
+
+from common_pile import html
+
+# Small versions of pages from our sources.
+PAGES = {
+    "essay": """<!DOCTYPE html>
+<html lang="en">
+<head>
+  <title>An Essay | The Public Domain Review</title>
+  <meta property="og:title" content="An Essay">
+  <style>.essay { color: black; }</style>
+  <script>window.dataLayer = [];</script>
+</head>
+<body>
+  <nav><a href="/">Home</a> <a href="/essays/">Essays</a> <a href="https://example.com/x?a=1&amp;b=2">Out</a></nav>
+  <div class="essay-view">
+    <span class="title">An Essay</span>
+    <span class="subtitle">On things &mdash; and more</span>
+    <p class="byline">By Someone</p>
+    <p class="date">June 1, 2020</p>
+    <div class="essay__text-block">
+      <p>First paragraph with <em>emphasis</em>, a <a href="../notes#1">note</a>.</p>
+      <!-- a comment that isn't text -->
+      <p>Second&nbsp;paragraph &amp; more.</p>
+    </div>
+    <div class="essay__text-block extra"><p>Another block.</p></div>
+  </div>
+  <div class="essay-license essay__content">Text is CC BY-SA.</div>
+  <a name="anchor">No href</a>
+</body>
+</html>""",
+    "recipe": """<html><body>
+<h1 id="page-title" class="title">Spiced Apples</h1>
+<div class="field-name-body"><div class="field-item">
+  <p>Peel the apples.<br>Slice them.</p>
+  <ul class="ingredients"><li>4 apples</li><li>1 tsp cinnamon</li></ul>
+</div></div>
+<div class="step"><span class="step-number">1</span> Mix.</div>
+<div class="step"><span class="step-number">2</span> Bake.</div>
+<time class="published-date" datetime="2020-01-01">Jan 1, 2020</time>
+<dl><dt>Subject:</dt><dd>Cooking</dd><dt>Level:</dt><dd>Easy</dd></dl>
+</body></html>""",
+    "fragment": "<p>Is <code>a &lt; b</code> true?</p>\n<pre><code>if a < b:\n    pass\n</code></pre>\nThanks &amp; regards",
+    "table": "<table>\n<tr><th>Name</th><th>Value</th></tr>\n<tr><td>x</td><td>1</td></tr>\n</table>",
+    "answer": "<p>I have a question.</p>\n\n<pre><code>def f():\n    return 1\n</code></pre>\n\n<blockquote>\n  <p>quoted</p>\n</blockquote>\n",
+    "text": "Just some text, no tags.",
+    "empty": "",
+}
+
+
+def parse(page):
+    return html.parse(page, "bs4"), html.parse(page, "lxml")
+
+
+def normalize(text):
+    return " ".join(text.split())
+
+
+@pytest.mark.parametrize("page", PAGES.values(), ids=PAGES.keys())
+def test_get_text(page):
+    bs4, lxml = parse(page)
+    assert normalize(lxml.get_text()) == normalize(bs4.get_text())
+    assert lxml.get_text("\n", strip=True) == bs4.get_text("\n", strip=True)
+
+
+@pytest.mark.parametrize("page", PAGES.values(), ids=PAGES.keys())
+def test_bs4_get_text_is_unchanged(page):
+    # Sources that emit raw `get_text()` use the bs4 backend, it must give
+    # exactly what BeautifulSoup did before, whitespace included.
+    assert (
+        html.parse(page, "bs4").get_text()
+        == BeautifulSoup(page, "html.parser").get_text()
+    )
+
+
+@pytest.mark.parametrize("page", PAGES.values(), ids=PAGES.keys())
+def test_links(page):
+    bs4, lxml = parse(page)
+    base = "https://publicdomainreview.org/essay/an-essay/"
+    assert lxml.links(base) == bs4.links(base)
+
+
+@pytest.mark.parametrize(
+    "args,kwargs",
+    [
+        (("p",), {}),
+        (("div",), {"class_": "essay__text-block"}),
+        (("div",), {"class_": "essay-license essay__content"}),
+        ((), {"class_": re.compile("step")}),
+        (("span", {"class": "step-number"}), {}),
+        (("h1",), {"id": "page-title"}),
+        (("meta",), {"property": "og:title"}),
+        ((["dt", "dd"],), {}),
+        ((re.compile("^h[1-6]$"),), {}),
+        (("time",), {"class_": re.compile("date"), "datetime": True}),
+        (("a",), {"href": False}),
+        (("li",), {"limit": 1}),
+        (("title",), {}),
+    ],
+)
+def test_find_all(args, kwargs):
+    for page in PAGES.values():
+        bs4, lxml = parse(page)
+        expected = bs4.find_all(*args, **kwargs)
+        found = lxml.find_all(*args, **kwargs)
+        assert [n.name for n in found] == [n.name for n in expected]
+        assert [n.get_text(strip=True) for n in found] == [
+            n.get_text(strip=True) for n in expected
+        ]
+        assert [n.get("class") for n in found] == [n.get("class") for n in expected]
+
+
+def test_find_within_element():
+    for node in parse(PAGES["essay"]):
+        essay = node.find("div", class_="essay-view")
+        assert essay.find("span", class_="title").get_text() == "An Essay"
+        assert essay.find("div", class_="essay-license") is None
+        assert node.find("div", class_="missing") is None
+
+
+def test_children():
+    page = "<p>one<br>two <b>three</b></p>"
+    bs4, lxml = (node.find("p") for node in parse(page))
+    expected = [c if isinstance(c, str) else c.name for c in bs4.children]
+    assert [c if isinstance(c, str) else c.name for c in lxml.children] == expected
+
+
+def test_bytes_are_utf8():
+    bs4, lxml = parse("<p>Café – naïve</p>".encode("utf-8"))
+    assert lxml.get_text() == bs4.get_text() == "Café – naïve"
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        html.parse("<p>hi</p>", backend="html5")
@@ -2,8 +2,12 @@
 
 import functools
 import logging
+import multiprocessing.util
+import queue
 import sys
-from typing import Protocol, Sequence
+import threading
+import time
+from typing import List, Protocol, Sequence
 
 import contextual_logger
 from logging_json import JSONFormatter
@@ -40,6 +44,139 @@ def get_file_handler(log_file: str) -> logging.Handler:
     return file_handler
 
 
+class BatchedAsyncHandler(logging.Handler):
+    """Hand records off to a background thread that emits them in batches.
+
+    Logging from the processing code is then just a queue put, the formatting
+    and I/O happen in the background. Stream handlers (including file handlers)
+    are only flushed once per batch instead of once per record. If the queue
+    fills up, records are dropped instead of blocking the caller, how many is
+    logged every `report_interval` seconds.
+
+    The background thread doesn't survive a fork, so worker processes (i.e.,
+    from dolma or `to_dolma_parallel`) start their own and flush it when they
+    exit. Workers that are killed (i.e., by `Pool.terminate`) can still lose
+    up to `flush_interval` seconds of records.
+    """
+
+    def __init__(
+        self,
+        handlers: Sequence[logging.Handler],
+        batch_size: int = 1024,
+        flush_interval: float = 1.0,
+        max_queue: int = 100_000,
+        report_interval: float = 60.0,
+    ):
+        super().__init__()
+        self.handlers = list(handlers)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.report_interval = report_interval
+        self._start()
+        multiprocessing.util.register_after_fork(self, BatchedAsyncHandler._after_fork)
+
+    def _start(self):
+        self.queue = queue.Queue(maxsize=self.max_queue)
+        self.dropped = 0
+        self.reported = 0
+        self._last_report = time.monotonic()
+        self._closed = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _after_fork(self):
+        # Records queued in the parent are written by the parent, start over
+        # with a new queue (its locks may have been held during the fork).
+        self._start()
+        # Pool workers exit with os._exit, so atexit (and logging.shutdown)
+        # never run, but multiprocessing finalizers do.
+        multiprocessing.util.Finalize(None, self.close, exitpriority=100)
+
+    def emit(self, record: logging.LogRecord):
+        # Resolve the message now in case the args are changed before the
+        # record is formatted.
+        try:
+            record.msg = record.getMessage()
+            record.args = None
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _report_dropped(self):
+        self._last_report = time.monotonic()
+        dropped = self.dropped
+        if dropped == self.reported:
+            return
+        record = logging.makeLogRecord(
+            {
+                "name": "common-pile",
+                "levelno": logging.WARNING,
+                "levelname": "WARNING",
+                "msg": f"Dropped {dropped - self.reported} log records, the queue was full.",
+            }
+        )
+        self.reported = dropped
+        self._emit_batch([record])
+
+    def _emit_batch(self, records: List[logging.LogRecord]):
+        for handler in self.handlers:
+            records_for_handler = [r for r in records if r.levelno >= handler.level]
+            if not records_for_handler:
+                continue
+            if isinstance(handler, logging.StreamHandler):
+                with handler.lock:
+                    for record in records_for_handler:
+                        try:
+                            handler.stream.write(
+                                handler.format(record) + handler.terminator
+                            )
+                        except Exception:
+                            handler.handleError(record)
+                    handler.flush()
+            else:
+                for record in records_for_handler:
+                    handler.handle(record)
+
+    def _run(self):
+        while not (self._stop.is_set() and self.queue.empty()):
+            if time.monotonic() - self._last_report >= self.report_interval:
+                self._report_dropped()
+            try:
+                records = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(records) < self.batch_size:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            # `close` sends a None to wake us up.
+            records = [r for r in records if r is not None]
+            if records:
+                self._emit_batch(records)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._stop.set()
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            # The thread has plenty to do, it isn't waiting on the queue.
+            pass
+        if self._thread.is_alive():
+            self._thread.join()
+        self._report_dropped()
+        for handler in self.handlers:
+            handler.close()
+        super().close()
+
+
 # TODO: Add logging formatters that go to centralized places like
 # datadog or watch tower.
 DEFAULT_HANDLERS = (
@@ -53,17 +190,31 @@ def configure_logging(
     level: str = "INFO",
     get_formatter_fn: GetFormatter = get_json_formatter,
     handler_fns: Sequence[GetHandler] = DEFAULT_HANDLERS,
+    asynchronous: bool = False,
 ) -> logging.Logger:
+    """Configure the shared logger.
+
+    When `asynchronous` is set, the handlers are run in a background thread in
+    batches (see `BatchedAsyncHandler`), which helps when logging at high
+    volume, i.e. logging every removed span at DEBUG.
+    """
     logger = logging.getLogger(name)
     level = getattr(logging, level.upper(), logging.INFO)
     logger.setLevel(level)
 
     formatter = get_formatter_fn()
 
+    handlers = []
     for handler_fn in handler_fns:
         handler = handler_fn()
         handler.setLevel(level)
         handler.setFormatter(formatter)
+        handlers.append(handler)
+
+    if asynchronous:
+        handlers = [BatchedAsyncHandler(handlers)]
+
+    for handler in handlers:
         logger.addHandler(handler)
 
     return logger
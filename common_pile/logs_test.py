@@ -0,0 +1,87 @@
+"""Tests for logging setup."""
+
+import io
+import logging
+import multiprocessing as mp
+import threading
+
+from common_pile.logs import BatchedAsyncHandler
+
+
+def test_batched_async_handler_writes_all_records():
+    stream = io.StringIO()
+    target = logging.StreamHandler(stream)
+    target.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+    handler = BatchedAsyncHandler([target], batch_size=4, flush_interval=0.01)
+    logger = logging.getLogger("common-pile-test-async")
+    logger.addHandler(handler)
+    try:
+        for i in range(10):
+            logger.warning("record %d", i)
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+    assert stream.getvalue().splitlines() == [f"WARNING record {i}" for i in range(10)]
+
+
+class BlockingHandler(logging.StreamHandler):
+    """Holds up the background thread until `unblock` is set."""
+
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.unblock = threading.Event()
+
+    def flush(self):
+        self.unblock.wait()
+        super().flush()
+
+
+def test_batched_async_handler_reports_dropped_records():
+    stream = io.StringIO()
+    target = BlockingHandler(stream)
+    handler = BatchedAsyncHandler(
+        [target], batch_size=1, flush_interval=0.01, max_queue=2, report_interval=0
+    )
+    logger = logging.getLogger("common-pile-test-dropped")
+    logger.addHandler(handler)
+    try:
+        for i in range(10):
+            logger.warning("record %d", i)
+    finally:
+        logger.removeHandler(handler)
+        target.unblock.set()
+        handler.close()
+    dropped = sum(
+        int(line.split()[1])
+        for line in stream.getvalue().splitlines()
+        if line.startswith("Dropped")
+    )
+    assert dropped == handler.dropped > 0
+
+
+def _log_in_worker(i):
+    logging.getLogger("common-pile-test-fork").warning("worker record %d", i)
+
+
+def test_batched_async_handler_flushes_in_forked_workers(tmp_path):
+    path = tmp_path / "log.txt"
+    target = logging.FileHandler(path)
+    target.setFormatter(logging.Formatter("%(message)s"))
+    handler = BatchedAsyncHandler([target], flush_interval=10)
+    logger = logging.getLogger("common-pile-test-fork")
+    logger.addHandler(handler)
+    try:
+        ctx = mp.get_context("fork")
+        workers = [ctx.Process(target=_log_in_worker, args=(i,)) for i in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+    # Without the flush when the worker exits, these would still be queued.
+    assert sorted(path.read_text().splitlines()) == [
+        "worker record 0",
+        "worker record 1",
+    ]
@@ -0,0 +1,220 @@
+"""Shared metrics for long running jobs.
+
+Counters and gauges are collected in-process and periodically flushed, along
+with their per-second rates, to one or more sinks. This mirrors how logging is
+configured, call `configure_metrics` once in the main process and then use
+`get_metrics` wherever something should be counted.
+"""
+
+import collections
+import http.server
+import json
+import socket
+import threading
+import time
+from typing import Dict, Optional, Protocol, Sequence
+
+from common_pile.logs import get_logger
+
+
+class MetricsSink(Protocol):
+    def __call__(self, snapshot: Dict) -> None:
+        ...
+
+
+class JSONLSink:
+    """Append each snapshot to a local jsonl file."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __call__(self, snapshot: Dict):
+        with open(self.path, "a") as wf:
+            wf.write(json.dumps(snapshot) + "\n")
+
+
+class StatsDSink:
+    """Send counters and gauges to a StatsD server over UDP."""
+
+    def __init__(self, host: str = "localhost", port: int = 8125, prefix: str = ""):
+        self.address = (host, port)
+        self.prefix = f"{prefix}." if prefix else ""
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __call__(self, snapshot: Dict):
+        lines = [f"{self.prefix}{k}:{v}|c" for k, v in snapshot["delta"].items()]
+        lines.extend(f"{self.prefix}{k}:{v}|g" for k, v in snapshot["gauges"].items())
+        if lines:
+            try:
+                self.socket.sendto("\n".join(lines).encode("utf-8"), self.address)
+            except OSError:
+                get_logger().debug("Failed to send metrics to statsd", exc_info=True)
+
+
+class PrometheusSink:
+    """Serve the latest snapshot in the Prometheus text format on a local port."""
+
+    def __init__(self, port: int = 9100, host: str = "localhost", prefix="common_pile"):
+        self.prefix = prefix
+        self.body = b""
+        sink = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.end_headers()
+                self.wfile.write(sink.body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def __call__(self, snapshot: Dict):
+        lines = []
+        for kind, key in (("counter", "counters"), ("gauge", "gauges")):
+            for name, value in snapshot[key].items():
+                name = f"{self.prefix}_{name}"
+                if kind == "counter":
+                    name = f"{name}_total"
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {value}")
+        self.body = ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def get_sink(spec: str) -> MetricsSink:
+    """Create a sink from a string, `jsonl:${path}`, `statsd:${host}:${port}`, or `prometheus:${port}`."""
+    kind, _, arg = spec.partition(":")
+    if kind == "jsonl":
+        return JSONLSink(arg)
+    if kind == "statsd":
+        host, _, port = arg.rpartition(":")
+        return StatsDSink(host or "localhost", int(port))
+    if kind == "prometheus":
+        return PrometheusSink(int(arg))
+    raise ValueError(f"Unknown metrics sink {spec}")
+
+
+class Metrics:
+    """Thread-safe counters and gauges that are flushed to sinks every `interval` seconds."""
+
+    def __init__(self, sinks: Sequence[MetricsSink] = (), interval: float = 10.0):
+        self.sinks = list(sinks)
+        self.interval = interval
+        self.counters = collections.Counter()
+        self.gauges = {}
+        self._lock = threading.Lock()
+        self._last_counters = collections.Counter()
+        self._last_flush = time.time()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def increment(self, **counts: int):
+        with self._lock:
+            self.counters.update(counts)
+
+    def gauge(self, **values: float):
+        with self._lock:
+            self.gauges.update(values)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            now = time.time()
+            elapsed = max(now - self._last_flush, 1e-9)
+            counters = dict(self.counters)
+            delta = {
+                k: v - self._last_counters[k]
+                for k, v in counters.items()
+                if v != self._last_counters[k]
+            }
+            self._last_counters = collections.Counter(counters)
+            self._last_flush = now
+            return {
+                "timestamp": now,
+                "counters": counters,
+                "delta": delta,
+                "rates": {f"{k}_per_second": v / elapsed for k, v in delta.items()},
+                "gauges": dict(self.gauges),
+            }
+
+    def flush(self):
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            try:
+                sink(snapshot)
+            except Exception:
+                get_logger().warning("Failed to flush metrics", exc_info=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+_METRICS: Optional[Metrics] = None
+
+
+def configure_metrics(
+    sinks: Sequence[MetricsSink] = (), interval: float = 10.0
+) -> Metrics:
+    """Create the process-wide metrics and start flushing them in the background."""
+    global _METRICS
+    if _METRICS is not None:
+        _METRICS.stop()
+    _METRICS = Metrics(sinks, interval).start()
+    return _METRICS
+
+
+def get_metrics() -> Optional[Metrics]:
+    return _METRICS
+
+
+class MetricsQueue:
+    """Wrap a dolma progress bar queue so updates are also counted as metrics.
+
+    Workers can also put dictionaries of counts on the queue (see
+    `ShardParallelProcessor.report_metrics`), these are recorded and never
+    reach the progress bars.
+    """
+
+    def __init__(self, queue, keys: Sequence[str], metrics: Metrics):
+        self.queue = queue
+        self.keys = keys
+        self.metrics = metrics
+
+    def put(self, item):
+        self.queue.put(item)
+
+    def qsize(self):
+        return self.queue.qsize()
+
+    def get(self):
+        while True:
+            item = self.queue.get()
+            self.metrics.gauge(queue_depth=self.queue.qsize())
+            if isinstance(item, dict):
+                self.metrics.increment(**item)
+                continue
+            if item is not None:
+                self.metrics.increment(**dict(zip(self.keys, item)))
+            return item
@@ -0,0 +1,35 @@
+"""Tests for metrics collection."""
+
+from queue import Queue
+
+from common_pile.metrics import Metrics, MetricsQueue
+
+
+def test_snapshot_tracks_deltas_and_rates():
+    metrics = Metrics()
+    metrics.increment(documents=10, bytes=100)
+    first = metrics.snapshot()
+    assert first["counters"] == {"documents": 10, "bytes": 100}
+    assert first["delta"] == {"documents": 10, "bytes": 100}
+    metrics.increment(documents=5)
+    second = metrics.snapshot()
+    assert second["counters"] == {"documents": 15, "bytes": 100}
+    assert second["delta"] == {"documents": 5}
+    assert set(second["rates"]) == {"documents_per_second"}
+
+
+def test_metrics_queue_records_progress_and_hides_metric_only_updates():
+    metrics = Metrics()
+    queue = MetricsQueue(Queue(), ["shards", "documents"], metrics)
+    queue.put({"bytes": 1024, "errors": 1})
+    queue.put((0, 20))
+    queue.put(None)
+    assert queue.get() == (0, 20)
+    assert queue.get() is None
+    assert metrics.counters == {
+        "shards": 0,
+        "documents": 20,
+        "bytes": 1024,
+        "errors": 1,
+    }
+    assert metrics.gauges == {"queue_depth": 0}
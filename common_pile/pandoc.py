@@ -0,0 +1,200 @@
+"""Convert documents with long lived pandoc workers instead of a pandoc process per document.
+
+Most of our documents are small, so starting pandoc costs more than the
+conversion itself. Each worker is a `pandoc lua` process running a loop that
+reads a request from stdin, converts it with `pandoc.read`/`pandoc.write`,
+and writes the result to stdout. A `PandocPool` keeps `processes` of these
+around for the whole run, i.e.,
+
+    with PandocPool(processes=8) as pool:
+        texts = pool.convert_batch(htmls, "plain", "html")
+
+As each document is still read and written on its own, the output is the
+same as running pandoc on each document (`pandoc lua` requires pandoc >= 3.1.1).
+"""
+
+import atexit
+import functools
+import json
+import queue
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+from common_pile import logs
+
+# Requests are a json header line with the byte length of the document,
+# followed by the document. Responses have the same format.
+WORKER = """
+while true do
+  local header = io.stdin:read("l")
+  if header == nil then break end
+  local request = pandoc.json.decode(header, false)
+  local text = request.length > 0 and io.stdin:read(request.length) or ""
+  local ok, result = pcall(function()
+    local doc = pandoc.read(text, request.from)
+    return pandoc.write(doc, request.to, request.options)
+  end)
+  local response = {length = 0}
+  if ok then
+    response.length = #result
+  else
+    response.error = tostring(result)
+    result = ""
+  end
+  io.stdout:write(pandoc.json.encode(response), "\\n", result)
+  io.stdout:flush()
+end
+"""
+
+
+class PandocError(RuntimeError):
+    """pandoc failed to convert a document."""
+
+
+@functools.cache
+def pandoc_path() -> str:
+    """Use the pandoc that pypandoc finds (i.e. from `pypandoc_binary`), then the one on $PATH."""
+    try:
+        import pypandoc
+
+        return pypandoc.get_pandoc_path()
+    except (ImportError, OSError):
+        if path := shutil.which("pandoc"):
+            return path
+        raise PandocError("pandoc not found, install it or `pypandoc_binary`.")
+
+
+@functools.cache
+def pandoc_version(path: Optional[str] = None) -> str:
+    """The version of pandoc, record this in the metadata of converted documents."""
+    output = subprocess.run(
+        [path or pandoc_path(), "--version"], capture_output=True, text=True
+    )
+    return output.stdout.split()[1]
+
+
+class PandocWorker:
+    """A single `pandoc lua` process, started lazily and restarted if it dies."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or pandoc_path()
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [self.path, "lua", "-e", WORKER],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process = None
+
+    def convert(
+        self, text: str, to: str, format: str, options: Optional[Dict] = None
+    ) -> str:
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+        data = text.encode("utf-8")
+        header = {"from": format, "to": to, "options": options or {}}
+        header["length"] = len(data)
+        try:
+            self.process.stdin.write(json.dumps(header).encode("utf-8") + b"\n")
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+            response = json.loads(self.process.stdout.readline())
+            result = self.process.stdout.read(response["length"])
+        except (BrokenPipeError, json.JSONDecodeError) as e:
+            self.process.kill()
+            self.process = None
+            raise PandocError(
+                "pandoc worker died, `pandoc lua` requires pandoc >= 3.1.1"
+            ) from e
+        if "error" in response:
+            raise PandocError(response["error"])
+        result = result.decode("utf-8")
+        # Match the pandoc cli, which always ends the output with a newline.
+        return result if result.endswith("\n") else result + "\n"
+
+
+class PandocPool:
+    """Convert documents in parallel with `processes` long lived pandoc workers.
+
+    Threads hand documents to the workers, the conversion happens in the
+    pandoc processes so the GIL isn't a bottleneck. The pool can be shared
+    by the whole run, workers are started as needed.
+    """
+
+    def __init__(self, processes: int = 1, path: Optional[str] = None):
+        self.processes = max(processes, 1)
+        self.workers = queue.Queue()
+        for _ in range(self.processes):
+            self.workers.put(PandocWorker(path))
+        self.executor = ThreadPoolExecutor(self.processes)
+        self.closed = False
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.executor.shutdown()
+        while not self.workers.empty():
+            self.workers.get().close()
+
+    def convert(
+        self, text: str, to: str, format: str, options: Optional[Dict] = None
+    ) -> str:
+        """Convert a single document, `options` are pandoc writer options, i.e. `{"wrap_text": "none"}`."""
+        worker = self.workers.get()
+        try:
+            return worker.convert(text, to, format, options)
+        finally:
+            self.workers.put(worker)
+
+    def convert_batch(
+        self,
+        texts: Sequence[str],
+        to: str,
+        format: str,
+        options: Optional[Dict] = None,
+        raise_errors: bool = True,
+    ) -> List[Optional[str]]:
+        """Convert many documents in parallel, results are in the same order.
+
+        When `raise_errors=False`, documents that fail to convert are logged
+        and their result is `None` instead of failing the whole batch.
+        """
+
+        def convert(text):
+            try:
+                return self.convert(text, to, format, options)
+            except PandocError:
+                if raise_errors:
+                    raise
+                logs.get_logger().warning(
+                    f"pandoc failed to convert from {format} to {to}", exc_info=True
+                )
+                return None
+
+        return list(self.executor.map(convert, texts))
+
+
+@functools.cache
+def get_pool(processes: int = 1) -> PandocPool:
+    """A pool shared by everything in this process, i.e. one per dolma worker."""
+    return PandocPool(processes)
@@ -0,0 +1,54 @@
+"""Tests for converting documents with long lived pandoc workers."""
+
+import subprocess
+
+import pytest
+
+from common_pile import pandoc
+
+
+@pytest.fixture(scope="module")
+def pool():
+    try:
+        pandoc.pandoc_path()
+    except pandoc.PandocError:
+        pytest.skip("pandoc isn't installed.")
+    with pandoc.PandocPool(processes=2) as pool:
+        yield pool
+
+
+DOCUMENTS = [
+    ("html", "<p>a <b>bold</b> &amp; <i>é</i></p><ul><li>one</li><li>two</li></ul>"),
+    ("html", ""),
+    ("rst", "Title\n=====\n\nSee [#]_ and *this*.\n\n.. [#] A footnote."),
+    ("rst", "Title\n=====\n\n" + "word " * 100),
+]
+
+
+@pytest.mark.parametrize("format,text", DOCUMENTS)
+def test_convert_matches_pandoc_cli(pool, format, text):
+    cli = subprocess.run(
+        [pandoc.pandoc_path(), "--from", format, "--to", "plain"],
+        input=text.encode("utf-8"),
+        capture_output=True,
+        check=True,
+    )
+    assert pool.convert(text, "plain", format) == cli.stdout.decode("utf-8")
+
+
+def test_convert_batch_keeps_order_and_options(pool):
+    texts = [f"<p>{i} " + "word " * 30 + "</p>" for i in range(20)]
+    results = pool.convert_batch(texts, "markdown", "html", {"wrap_text": "none"})
+    assert [r.split()[0] for r in results] == [str(i) for i in range(20)]
+    assert all(r.count("\n") == 1 for r in results)
+
+
+def test_convert_batch_errors(pool):
+    with pytest.raises(pandoc.PandocError):
+        pool.convert_batch(["*a*"], "plain", "not-a-format")
+    results = pool.convert_batch(
+        ["*a*", "*b*"], "plain", "not-a-format", raise_errors=False
+    )
+    assert results == [None, None]
+    # The workers are still usable.
+    assert pool.convert("*a*", "plain", "rst") == "a\n"
@@ -0,0 +1,177 @@
+"""Fuse multiple ShardParallelProcessor stages into a single pass over the data."""
+
+import collections
+import glob
+import importlib
+import json
+import os
+import sys
+from contextlib import ExitStack
+from queue import Queue
+from typing import Dict, Optional, Sequence, Type
+
+import smart_open
+
+from common_pile.utils import dolma_relative
+from common_pile.write import ShardParallelProcessor
+
+
+def stage_name(stage: Type[ShardParallelProcessor]) -> str:
+    return stage.__name__
+
+
+def load_stage(spec: str) -> Type[ShardParallelProcessor]:
+    """Load a processor class from `module:Class` or `path/to/file.py:Class`.
+
+    When a file is given, its directory is added to `sys.path` and the file is
+    imported by module name so that spawned workers can unpickle the class.
+    """
+    module_name, _, class_name = spec.rpartition(":")
+    if not module_name or not class_name:
+        raise ValueError(f"Stage {spec} must be formatted as `module:Class`.")
+    if module_name.endswith(".py"):
+        path, filename = os.path.split(os.path.abspath(module_name))
+        if path not in sys.path:
+            sys.path.insert(0, path)
+        module_name = filename[: -len(".py")]
+    stage = getattr(importlib.import_module(module_name), class_name)
+    if not hasattr(stage, "process_example"):
+        raise ValueError(f"Stage {spec} doesn't define a `process_example` method.")
+    return stage
+
+
+class StageTracker:
+    """Per-shard record of how many examples each stage dropped.
+
+    Optionally writes the output of each stage to its own dolma directory,
+    files are only created once the first example is written so shards that
+    are skipped don't leave empty files behind.
+    """
+
+    def __init__(
+        self,
+        stages: Sequence[Type[ShardParallelProcessor]],
+        relative_path: str,
+        stage_outputs: Optional[str] = None,
+    ):
+        self.stages = stages
+        self.relative_path = relative_path
+        self.stage_outputs = stage_outputs
+        self.documents = 0
+        self.dropped = collections.Counter()
+        self._stack = ExitStack()
+        self._writers = {}
+
+    def stage_path(self, i: int) -> str:
+        return os.path.join(
+            self.stage_outputs,
+            f"{i:02d}-{stage_name(self.stages[i])}",
+            "documents",
+            self.relative_path,
+        )
+
+    def write(self, i: int, example: Dict):
+        if self.stage_outputs is None:
+            return
+        if i not in self._writers:
+            path = self.stage_path(i)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._writers[i] = self._stack.enter_context(smart_open.open(path, "w"))
+        self._writers[i].write(json.dumps(example) + "\n")
+
+    def stats(self) -> Dict:
+        dropped = {stage_name(s): self.dropped[stage_name(s)] for s in self.stages}
+        return {
+            "shard": self.relative_path,
+            "documents": self.documents,
+            "dropped": dropped,
+            "kept": self.documents - sum(dropped.values()),
+        }
+
+    def close(self):
+        self._stack.close()
+
+
+class PipelineParallel(ShardParallelProcessor):
+    """Run the `process_example` of each stage in order while reading/writing each shard once.
+
+    The stages are passed when the processor is called, i.e.,
+    `processor(stages=[RegexRemoveHTMLParallel, FilterLyricParallel])`, and
+    each stage gets the same kwargs it would if it was run on its own.
+    """
+
+    @classmethod
+    def increment_progressbar(
+        cls,
+        queue: Queue,
+        /,
+        shards: int = 0,
+        documents: int = 0,
+        dropped: int = 0,
+    ):
+        return super(ShardParallelProcessor, cls).increment_progressbar(
+            queue, shards=shards, documents=documents, dropped=dropped
+        )
+
+    @classmethod
+    def process_example(cls, example, stages=(), tracker=None, **kwargs):
+        tracker.documents += 1
+        for i, stage in enumerate(stages):
+            example = stage.process_example(example, **kwargs)
+            if example is None:
+                tracker.dropped[stage_name(stage)] += 1
+                return None
+            tracker.write(i, example)
+        return example
+
+    @classmethod
+    def process_single(
+        cls,
+        source_path: str,
+        destination_path: str,
+        queue: Queue,
+        **kwargs,
+    ):
+        logger = cls.get_logger()
+        stages = kwargs.pop("stages")
+        stats_dir = kwargs.pop("stats_dir", None)
+        tracker = StageTracker(
+            stages,
+            dolma_relative(destination_path),
+            stage_outputs=kwargs.pop("stage_outputs", None),
+        )
+        try:
+            super().process_single(
+                source_path,
+                destination_path,
+                queue,
+                stages=stages,
+                tracker=tracker,
+                **kwargs,
+            )
+        finally:
+            tracker.close()
+        stats = tracker.stats()
+        with logger(file=source_path):
+            logger.info("Finished pipeline for shard", extra=dict(stats))
+        cls.increment_progressbar(queue, dropped=sum(stats["dropped"].values()))
+        # Shards that were skipped as they already exist don't overwrite old stats.
+        if stats_dir is not None and tracker.documents:
+            stats_path = os.path.join(stats_dir, f"{tracker.relative_path}.json")
+            os.makedirs(os.path.dirname(stats_path), exist_ok=True)
+            with smart_open.open(stats_path, "w") as wf:
+                json.dump(stats, wf)
+
+
+def summarize_stats(stats_dir: str) -> Dict:
+    """Combine the per-shard stage stats written by PipelineParallel."""
+    summary = {"shards": 0, "documents": 0, "dropped": collections.Counter()}
+    for path in glob.glob(os.path.join(stats_dir, "**", "*.json"), recursive=True):
+        with open(path) as f:
+            stats = json.load(f)
+        summary["shards"] += 1
+        summary["documents"] += stats["documents"]
+        summary["dropped"].update(stats["dropped"])
+    summary["dropped"] = dict(summary["dropped"])
+    summary["kept"] = summary["documents"] - sum(summary["dropped"].values())
+    return summary
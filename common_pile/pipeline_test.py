@@ -0,0 +1,48 @@
+"""Tests for fusing processors into a pipeline."""
+
+from common_pile.pipeline import PipelineParallel, StageTracker
+from common_pile.write import ShardParallelProcessor
+
+
+class Upper(ShardParallelProcessor):
+    @classmethod
+    def process_example(cls, example, **kwargs):
+        example["text"] = example["text"].upper()
+        return example
+
+
+class DropShort(ShardParallelProcessor):
+    @classmethod
+    def process_example(cls, example, **kwargs):
+        if len(example["text"]) < 5:
+            return None
+        return example
+
+
+class Exclaim(ShardParallelProcessor):
+    @classmethod
+    def process_example(cls, example, **kwargs):
+        example["text"] += "!"
+        return example
+
+
+def run(stages, texts):
+    tracker = StageTracker(stages, "00000_test.jsonl.gz")
+    outputs = [
+        PipelineParallel.process_example({"text": t}, stages=stages, tracker=tracker)
+        for t in texts
+    ]
+    return outputs, tracker.stats()
+
+
+def test_pipeline_applies_stages_in_order():
+    outputs, _ = run([Upper, Exclaim], ["hello world"])
+    assert outputs == [{"text": "HELLO WORLD!"}]
+
+
+def test_pipeline_counts_drops_per_stage():
+    outputs, stats = run([Upper, DropShort, Exclaim], ["hi", "hello world", "yo"])
+    assert outputs == [None, {"text": "HELLO WORLD!"}, None]
+    assert stats["documents"] == 3
+    assert stats["dropped"] == {"Upper": 0, "DropShort": 2, "Exclaim": 0}
+    assert stats["kept"] == 1
@@ -0,0 +1,246 @@
+"""Tools for finding out where time goes when processing dolma shards."""
+
+import collections
+import glob
+import heapq
+import io
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Dict, List, Optional
+
+import smart_open
+from smart_open.compression import compression_wrapper
+
+# The order phases happen in when a single example is processed.
+PHASES = (
+    "read",
+    "inflate",
+    "parse",
+    "process",
+    "serialize",
+    "deflate",
+    "write",
+    "progress",
+)
+
+
+class NullProfile:
+    """Stand-in used when profiling is off so the processing loop doesn't need branches."""
+
+    def __bool__(self):
+        return False
+
+    def lap(self, phase: str) -> float:
+        return 0.0
+
+    def document(self, example_id: str, size: int, seconds: float):
+        pass
+
+
+class ShardProfile:
+    """Accumulate the time spent in each phase while processing a single shard.
+
+    Time is tracked with laps, each call to `lap` attributes all the time since
+    the last call to that phase. Raw file I/O is timed separately (see
+    `TimedFile`) so that time spent reading/writing bytes can be split from
+    the time spent (de)compressing them.
+    """
+
+    def __init__(self, shard: str, slowest: int = 10):
+        self.shard = shard
+        self.worker = os.getpid()
+        self.slowest = slowest
+        self.seconds = collections.defaultdict(float)
+        self.io_bytes = collections.defaultdict(int)
+        self.documents = 0
+        self._slowest_documents = []
+        self._start = self._last = time.perf_counter()
+
+    def __bool__(self):
+        return True
+
+    def lap(self, phase: str) -> float:
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self.seconds[phase] += elapsed
+        self._last = now
+        return elapsed
+
+    def io(self, phase: str, seconds: float, size: int):
+        self.seconds[f"{phase}_io"] += seconds
+        self.io_bytes[phase] += size
+
+    def document(self, example_id: str, size: int, seconds: float):
+        self.documents += 1
+        item = (seconds, self.documents, {"id": example_id, "bytes": size})
+        if len(self._slowest_documents) < self.slowest:
+            heapq.heappush(self._slowest_documents, item)
+        elif self.slowest:
+            heapq.heappushpop(self._slowest_documents, item)
+
+    def report(self) -> Dict:
+        # Reading lines from the text stream includes the raw I/O, everything
+        # else is decompression and decoding. The same is true for writes.
+        read = self.seconds["read"]
+        write = self.seconds["write"]
+        phases = {
+            "read": self.seconds["read_io"],
+            "inflate": max(read - self.seconds["read_io"], 0.0),
+            "parse": self.seconds["parse"],
+            "process": self.seconds["process"],
+            "serialize": self.seconds["serialize"],
+            "deflate": max(write - self.seconds["write_io"], 0.0),
+            "write": self.seconds["write_io"],
+            "progress": self.seconds["progress"],
+        }
+        return {
+            "shard": self.shard,
+            "worker": self.worker,
+            "documents": self.documents,
+            "bytes_read": self.io_bytes["read"],
+            "bytes_written": self.io_bytes["write"],
+            "total_seconds": time.perf_counter() - self._start,
+            "phases": phases,
+            "slowest": [
+                {**doc, "seconds": seconds}
+                for seconds, _, doc in sorted(self._slowest_documents, reverse=True)
+            ],
+        }
+
+
+class TimedFile:
+    """Wrap a binary file object and record how long reads and writes take."""
+
+    def __init__(self, f, profile: ShardProfile):
+        self._f = f
+        self._profile = profile
+
+    def read(self, *args):
+        start = time.perf_counter()
+        data = self._f.read(*args)
+        self._profile.io("read", time.perf_counter() - start, len(data))
+        return data
+
+    def readinto(self, b):
+        start = time.perf_counter()
+        size = self._f.readinto(b)
+        self._profile.io("read", time.perf_counter() - start, size or 0)
+        return size
+
+    def write(self, b):
+        start = time.perf_counter()
+        size = self._f.write(b)
+        self._profile.io("write", time.perf_counter() - start, len(b))
+        return size
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+
+@contextmanager
+def open_shard(path: str, mode: str = "r", profile=NullProfile()):
+    """Open a (compressed) text file, timing the raw I/O if we are profiling."""
+    if not profile:
+        with smart_open.open(path, mode) as f:
+            yield f
+        return
+    binary_mode = mode.replace("t", "").replace("b", "") + "b"
+    with ExitStack() as stack:
+        raw = stack.enter_context(
+            smart_open.open(path, binary_mode, compression="disable")
+        )
+        f = compression_wrapper(TimedFile(raw, profile), binary_mode, filename=path)
+        # Registered after raw so it is closed (and flushed) before raw is.
+        yield stack.enter_context(io.TextIOWrapper(f, encoding="utf-8"))
+
+
+class SamplingProfiler:
+    """Periodically record the call stack of a thread from a background thread.
+
+    Stacks are saved in the collapsed format (`outer;inner count`) used by
+    flamegraph tools. Sampling adds a little overhead, so it is opt-in.
+    """
+
+    def __init__(self, interval: float = 0.01, thread_id: Optional[int] = None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{s} {c}\n" for s, c in self.stacks.most_common())
+
+
+def save_profile(
+    profile: ShardProfile,
+    profile_dir: str,
+    sampler: Optional[SamplingProfiler] = None,
+):
+    """Save the profile report (and sampled stacks) for a shard into `profile_dir`."""
+    base = os.path.join(profile_dir, profile.shard)
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    with smart_open.open(f"{base}.profile.json", "w") as wf:
+        json.dump(profile.report(), wf)
+    if sampler is not None:
+        with smart_open.open(f"{base}.stacks.txt", "w") as wf:
+            wf.write(sampler.collapsed())
+
+
+def summarize_profiles(profile_dir: str, slowest: int = 10) -> Dict:
+    """Combine the per-shard profiles into per-phase and per-worker totals."""
+    phases = collections.Counter()
+    workers = collections.defaultdict(collections.Counter)
+    documents: List[Dict] = []
+    summary = collections.Counter()
+    paths = glob.glob(os.path.join(profile_dir, "**", "*.profile.json"), recursive=True)
+    for path in paths:
+        with open(path) as f:
+            report = json.load(f)
+        summary["shards"] += 1
+        for key in ("documents", "bytes_read", "bytes_written"):
+            summary[key] += report[key]
+        phases.update(report["phases"])
+        worker = workers[str(report["worker"])]
+        worker.update(report["phases"])
+        worker["shards"] += 1
+        worker["documents"] += report["documents"]
+        documents.extend({**d, "shard": report["shard"]} for d in report["slowest"])
+    total = sum(phases.values())
+    return {
+        **summary,
+        "phases": {
+            p: {
+                "seconds": phases[p],
+                "fraction": phases[p] / total if total else 0.0,
+            }
+            for p in PHASES
+        },
+        "workers": {w: dict(counts) for w, counts in workers.items()},
+        "slowest": heapq.nlargest(slowest, documents, key=lambda d: d["seconds"]),
+    }
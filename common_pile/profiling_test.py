@@ -0,0 +1,30 @@
+"""Tests for shard profiling."""
+
+import gzip
+import os
+
+from common_pile.profiling import PHASES, ShardProfile, open_shard
+
+
+def test_open_shard_round_trip_with_profile(tmp_path):
+    path = os.path.join(tmp_path, "00000_test.jsonl.gz")
+    profile = ShardProfile("00000_test.jsonl.gz")
+    with open_shard(path, "w", profile) as wf:
+        wf.write("hello\nworld\n")
+    with gzip.open(path, "rt") as f:
+        assert f.read() == "hello\nworld\n"
+    with open_shard(path, "r", profile) as f:
+        assert list(f) == ["hello\n", "world\n"]
+    report = profile.report()
+    assert report["bytes_written"] == os.path.getsize(path)
+    assert report["bytes_read"] == os.path.getsize(path)
+    assert set(report["phases"]) == set(PHASES)
+
+
+def test_slowest_documents_are_kept():
+    profile = ShardProfile("00000_test.jsonl.gz", slowest=2)
+    for i, seconds in enumerate([0.1, 0.5, 0.2, 0.9]):
+        profile.document(str(i), 10, seconds)
+    slowest = profile.report()["slowest"]
+    assert [d["id"] for d in slowest] == ["3", "1"]
+    assert profile.documents == 4
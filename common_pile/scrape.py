@@ -1,11 +1,37 @@
 """Shared Utilities related to scraping."""
 
+import asyncio
+import concurrent.futures
+import dataclasses
+import datetime
+import email.utils
+import hashlib
+import json
 import logging
-from typing import Dict, Optional
+import os
+import random
+import threading
+import time
+import urllib.parse
+import urllib.robotparser
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Set,
+    Tuple,
+)
 
+import aiohttp
 import requests
 from tenacity import retry, stop_after_attempt, wait_random_exponential
 
+from common_pile.logs import get_logger
+
 # A user agent that says we are compatible with most websites (most browsers
 # start with Mozilla/5.0) and also tells that we are a bot and includes a link
 # for context on why we are scraping. We hope this fosters good will with site
@@ -14,19 +40,40 @@ USER_AGENT = "Mozilla/5.0 (compatible; Common-Pile-bot/0.1; +http://www.github.c
 
 DEFAULT_HEADERS = {"User-Agent": USER_AGENT}
 
+# Status codes that are worth trying again after waiting a bit.
+RETRY_STATUSES = frozenset((408, 429, 500, 502, 503, 504))
+
+_SESSIONS = threading.local()
+
+
+def get_session() -> requests.Session:
+    """Get a requests session for the current thread so connections are reused."""
+    if not hasattr(_SESSIONS, "session"):
+        _SESSIONS.session = requests.Session()
+    return _SESSIONS.session
+
 
 @retry(stop=stop_after_attempt(5), wait=wait_random_exponential(multiplier=1, max=30))
 def get_page(
     url: str,
     params: Optional[Dict[str, str]] = None,
     headers: Optional[Dict[str, str]] = None,
+    limiter: Optional["RateLimiter"] = None,
 ):
-    """GET page with retries, uses our common-pile default user-agent string."""
+    """GET page with retries, uses our common-pile default user-agent string.
+
+    When a `limiter` is given, requests wait on it and report back to it, so
+    threads sharing the limiter back off together when we are rate limited.
+    """
     params = params if params is not None else {}
     headers = headers if headers is not None else {}
     # Unpack the defaults first so the user provided ones can override them.
     headers = {**DEFAULT_HEADERS, **headers}
-    resp = requests.get(url, params=params, headers=headers)
+    if limiter is not None:
+        limiter.acquire()
+    resp = get_session().get(url, params=params, headers=headers)
+    if limiter is not None:
+        limiter.update(resp.status_code, resp.headers)
     logging.debug(f"Sending GET to {resp.url}")
     if resp.status_code != 200:
         # TODO: Update logger
@@ -35,3 +82,682 @@ def get_page(
         )
         raise RuntimeError(f"Failed request to {resp.url}")
     return resp
+
+
+def get_header(headers: Dict[str, str], name: str) -> Optional[str]:
+    """Case-insensitive header lookup that also works for plain dicts."""
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def retry_after_seconds(headers: Dict[str, str]) -> Optional[float]:
+    """Parse a Retry-After header, which is either a number of seconds or a date."""
+    value = get_header(headers, "Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(date.timestamp() - time.time(), 0.0)
+
+
+def bounded_map(
+    func: Callable[[Any], Any],
+    items: Iterable,
+    workers: int,
+    max_pending: Optional[int] = None,
+) -> Iterator[Tuple[Any, concurrent.futures.Future]]:
+    """Run `func` on `items` in a thread pool, yielding `(item, future)` as they finish.
+
+    Unlike submitting everything to an executor up front, `items` is read
+    lazily and at most `max_pending` (`2 * workers` by default) are in flight
+    at once, so memory is bounded by the window, not the number of items, and
+    results can be written out as they complete. Errors are left in the
+    future for the caller to handle.
+    """
+    max_pending = max_pending or 2 * workers
+    pending = {}
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        try:
+            for item in items:
+                while len(pending) >= max_pending:
+                    done, _ = concurrent.futures.wait(
+                        pending, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        yield pending.pop(future), future
+                pending[executor.submit(func, item)] = item
+            while pending:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    yield pending.pop(future), future
+        finally:
+            # If the caller stops early, don't start the rest of the window.
+            for future in pending:
+                future.cancel()
+
+
+@dataclasses.dataclass
+class CrawlResponse:
+    """The result of a crawl request.
+
+    `url` is the url that was requested (so results can be matched back to
+    their inputs), `final_url` is where we ended up after redirects. When the
+    crawl has a `CrawlManifest`, `changed` is False for pages that are the
+    same as last time, either a 304 or a 200 with the same content hash.
+    """
+
+    url: str
+    status: Optional[int]
+    headers: Dict[str, str] = dataclasses.field(default_factory=dict)
+    content: bytes = b""
+    final_url: Optional[str] = None
+    from_cache: bool = False
+    error: Optional[str] = None
+    # False when a manifest shows the content is the same as last time.
+    changed: bool = True
+
+    @property
+    def ok(self) -> bool:
+        return self.status is not None and 200 <= self.status < 300
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    @property
+    def etag(self) -> Optional[str]:
+        return get_header(self.headers, "ETag")
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return get_header(self.headers, "Last-Modified")
+
+
+class ResponseCache:
+    """Save successful responses on disk, keyed by url.
+
+    Cached responses are used to make conditional requests (with the ETag and
+    Last-Modified validators) and are returned as is when the server says that
+    the page hasn't changed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.path, hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+    def get(self, url: str) -> Optional[CrawlResponse]:
+        path = self._path(url)
+        try:
+            with open(f"{path}.json") as f:
+                meta = json.load(f)
+            with open(f"{path}.body", "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        return CrawlResponse(content=content, from_cache=True, **meta)
+
+    def put(self, response: CrawlResponse):
+        path = self._path(response.url)
+        meta = {
+            "url": response.url,
+            "status": response.status,
+            "headers": response.headers,
+            "final_url": response.final_url,
+        }
+        # Write the body first and swap files in place so that a crash never
+        # leaves metadata pointing at a partial body.
+        with open(f"{path}.body.tmp", "wb") as wf:
+            wf.write(response.content)
+        os.replace(f"{path}.body.tmp", f"{path}.body")
+        with open(f"{path}.json.tmp", "w") as wf:
+            json.dump(meta, wf)
+        os.replace(f"{path}.json.tmp", f"{path}.json")
+
+
+def utc_now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+
+
+class CrawlManifest:
+    """A per-source record of every url we have fetched and what it looked like.
+
+    Each entry has the url, the ETag and Last-Modified validators, the sha256
+    of the content, when it was last `fetched`, and when the content last
+    `changed`. Entries are appended to a jsonl file as they are recorded (the
+    last entry for a url wins) so an interrupted crawl loses nothing, and the
+    file is compacted to one line per url on close.
+
+    Refreshing a source then becomes: send conditional requests using the
+    validators, skip pages that come back 304 (or with the same hash), and
+    only pass urls that `changed_since` the refresh started downstream.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["url"]] = entry
+        self._wf = None
+
+    def __contains__(self, url: str) -> bool:
+        return url in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, url: str) -> Optional[Dict]:
+        return self.entries.get(url)
+
+    def discard(self, url: str):
+        """Forget `url`, i.e. when its saved copy is gone, so the next fetch isn't conditional."""
+        self.entries.pop(url, None)
+
+    def validators(self, url: str) -> Dict[str, str]:
+        """Headers that make a request for `url` conditional on it having changed."""
+        entry = self.entries.get(url)
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def _write(self, entry: Dict):
+        self.entries[entry["url"]] = entry
+        if self._wf is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._wf = open(self.path, "a")
+        self._wf.write(json.dumps(entry) + "\n")
+        self._wf.flush()
+
+    def record(self, response: CrawlResponse) -> bool:
+        """Record a successful response, returns whether its content changed."""
+        digest = hashlib.sha256(response.content).hexdigest()
+        previous = self.entries.get(response.url)
+        now = utc_now()
+        changed = previous is None or previous.get("sha256") != digest
+        self._write(
+            {
+                "url": response.url,
+                "status": response.status,
+                "etag": response.etag,
+                "last_modified": response.last_modified,
+                "sha256": digest,
+                "fetched": now,
+                "changed": now if changed else previous["changed"],
+            }
+        )
+        return changed
+
+    def touch(self, response: CrawlResponse):
+        """Record that the server said `response.url` is unchanged (a 304)."""
+        previous = self.entries.get(response.url)
+        if previous is None:
+            return
+        self._write(
+            {
+                **previous,
+                # Servers can send updated validators with a 304.
+                "etag": response.etag or previous.get("etag"),
+                "last_modified": response.last_modified
+                or previous.get("last_modified"),
+                "fetched": utc_now(),
+            }
+        )
+
+    def changed_since(self, since: Optional[str] = None) -> Set[str]:
+        """The urls whose content changed at, or after, the ISO timestamp `since`."""
+        if since is None:
+            return set(self.entries)
+        since = datetime.datetime.fromisoformat(since)
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=datetime.timezone.utc)
+        return {
+            url
+            for url, entry in self.entries.items()
+            if datetime.datetime.fromisoformat(entry["changed"]) >= since
+        }
+
+    def close(self):
+        # Read-only uses, i.e. finding what changed downstream, leave the file as is.
+        if self._wf is None:
+            return
+        self._wf.close()
+        self._wf = None
+        with open(f"{self.path}.tmp", "w") as wf:
+            for entry in self.entries.values():
+                wf.write(json.dumps(entry) + "\n")
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TokenBucket:
+    """Allow `rate` requests per second on average with bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def rate_limit_reset_seconds(headers: Dict[str, str]) -> Optional[float]:
+    """Parse the seconds until a rate limit resets from the RateLimit-Reset headers.
+
+    Servers send either the seconds to wait or, for X-RateLimit-Reset, an
+    epoch timestamp; any value that looks like a timestamp is treated as one.
+    """
+    for name in ("RateLimit-Reset", "X-RateLimit-Reset", "X-Rate-Limit-Reset"):
+        value = get_header(headers, name)
+        if value is None:
+            continue
+        try:
+            seconds = float(value)
+        except ValueError:
+            return None
+        if seconds > 1e9:
+            seconds -= time.time()
+        return max(seconds, 0.0)
+    return None
+
+
+def rate_limit_remaining(headers: Dict[str, str]) -> Optional[int]:
+    """Parse how many requests are left in the current rate limit window."""
+    for name in (
+        "RateLimit-Remaining",
+        "X-RateLimit-Remaining",
+        "X-Rate-Limit-Remaining",
+    ):
+        value = get_header(headers, name)
+        if value is None:
+            continue
+        try:
+            return int(float(value))
+        except ValueError:
+            return None
+    return None
+
+
+class RateLimiter:
+    """A token bucket shared between threads that backs off when the server says so.
+
+    Call `acquire` before each request and `update` with each response. When a
+    response is throttled (429/503) every thread is paused until the time the
+    server asked for, via Retry-After or a RateLimit-Reset header, or for an
+    exponential backoff when it didn't say, and the rate is halved. Successful
+    responses grow the rate back to `requests_per_second` a bit at a time, so
+    we probe for recovery instead of bursting straight back into the limit.
+    Responses that say no requests remain pause until the reset, without
+    being counted as throttled.
+    """
+
+    THROTTLE_STATUSES = frozenset((429, 503))
+
+    def __init__(
+        self,
+        requests_per_second: float,
+        capacity: Optional[float] = None,
+        min_rate: Optional[float] = None,
+        recovery: float = 0.1,
+        backoff: float = 1.0,
+        max_backoff: float = 600.0,
+    ):
+        self.max_rate = requests_per_second
+        self.rate = requests_per_second
+        self.capacity = capacity if capacity is not None else max(self.rate, 1.0)
+        self.min_rate = min_rate if min_rate is not None else self.rate / 64
+        self.recovery = recovery
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request can be made."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(
+                        self.capacity,
+                        self.tokens + max(now - self.updated, 0) * self.rate,
+                    )
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Stop all threads from making requests for `seconds`."""
+        with self._lock:
+            until = time.monotonic() + seconds
+            if until > self.paused_until:
+                self.paused_until = until
+                # Tokens don't build up while paused, so we don't burst after.
+                self.tokens = 0.0
+                self.updated = until
+
+    def update(self, status: Optional[int], headers: Dict[str, str]) -> Optional[float]:
+        """Adjust the rate based on a response, returns how long we are paused for."""
+        logger = get_logger()
+        if status in self.THROTTLE_STATUSES:
+            with self._lock:
+                self.throttled += 1
+                self.rate = max(self.rate / 2, self.min_rate)
+                backoff = random.uniform(0.5, 1.0) * min(
+                    self.max_backoff, self.backoff * 2**self.throttled
+                )
+            wait = retry_after_seconds(headers)
+            if wait is None:
+                wait = rate_limit_reset_seconds(headers)
+            if wait is None:
+                wait = backoff
+            logger.info(
+                "Rate limited (status: %s), pausing for %.1f seconds at %.2f requests/second",
+                status,
+                wait,
+                self.rate,
+            )
+            self.pause(wait)
+            return wait
+        if rate_limit_remaining(headers) == 0:
+            wait = rate_limit_reset_seconds(headers)
+            if wait is not None:
+                logger.info("Rate limit used up, pausing for %.1f seconds", wait)
+                self.pause(wait)
+                return wait
+        if status is not None and status < 400:
+            with self._lock:
+                self.throttled = 0
+                self.rate = min(
+                    self.rate + self.recovery * self.max_rate, self.max_rate
+                )
+        return None
+
+
+class RateLimitedSession(requests.Session):
+    """A requests session where every request goes through a shared `RateLimiter`."""
+
+    def __init__(self, limiter: RateLimiter):
+        super().__init__()
+        self.limiter = limiter
+
+    def request(self, *args, **kwargs) -> requests.Response:
+        self.limiter.acquire()
+        response = super().request(*args, **kwargs)
+        self.limiter.update(response.status_code, response.headers)
+        return response
+
+
+class Crawler:
+    """An asyncio crawler with per-host connection pools and rate limits.
+
+    Use it as an async context manager, i.e.,
+
+        async with Crawler(requests_per_second=2) as crawler:
+            async for response in crawler.fetch_all(urls):
+                ...
+
+    Each host gets its own token bucket, robots.txt is checked (and its
+    Crawl-delay respected) before a host is crawled, and failed requests are
+    retried with backoff as long as the crawl wide retry budget allows it. The
+    budget stops a site that is down from turning every request into
+    `max_attempts` requests.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: float = 1.0,
+        burst: Optional[float] = None,
+        connections_per_host: int = 4,
+        max_attempts: int = 5,
+        retry_budget: float = 0.2,
+        min_retries: int = 10,
+        max_backoff: float = 60.0,
+        respect_robots: bool = True,
+        cache: Optional[ResponseCache] = None,
+        manifest: Optional[CrawlManifest] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = 60.0,
+    ):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.connections_per_host = connections_per_host
+        self.max_attempts = max_attempts
+        self.retry_budget = retry_budget
+        self.min_retries = min_retries
+        self.max_backoff = max_backoff
+        self.respect_robots = respect_robots
+        self.cache = cache
+        self.manifest = manifest
+        self.headers = {**DEFAULT_HEADERS, **(headers or {})}
+        self.timeout = timeout
+        self.user_agent = self.headers["User-Agent"]
+        self.session = None
+        self.requests = 0
+        self.retries = 0
+        self._buckets = {}
+        self._robots = {}
+        self._robots_locks = {}
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=0, limit_per_host=self.connections_per_host
+            ),
+            headers=self.headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, *args):
+        await self.session.close()
+        self.session = None
+
+    def bucket(self, host: str) -> TokenBucket:
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.requests_per_second, self.burst)
+        return self._buckets[host]
+
+    async def robots(self, url: str) -> urllib.robotparser.RobotFileParser:
+        """Fetch (once per host) and parse the robots.txt for the host of `url`."""
+        parts = urllib.parse.urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        lock = self._robots_locks.setdefault(origin, asyncio.Lock())
+        async with lock:
+            if origin in self._robots:
+                return self._robots[origin]
+            robots = urllib.robotparser.RobotFileParser(f"{origin}/robots.txt")
+            try:
+                async with self.session.get(robots.url) as resp:
+                    # Follow the same rules as RobotFileParser.read
+                    if resp.status in (401, 403):
+                        robots.disallow_all = True
+                    elif resp.status >= 400:
+                        robots.allow_all = True
+                    else:
+                        robots.parse((await resp.text()).splitlines())
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                get_logger().warning("Failed to fetch %s", robots.url, exc_info=True)
+                robots.allow_all = True
+            delay = robots.crawl_delay(self.user_agent)
+            if delay:
+                bucket = self.bucket(parts.netloc)
+                bucket.rate = min(bucket.rate, 1 / float(delay))
+                bucket.capacity = 1.0
+                bucket.tokens = min(bucket.tokens, 1.0)
+            self._robots[origin] = robots
+            return robots
+
+    def _can_retry(self) -> bool:
+        return self.retries < self.min_retries + self.retry_budget * self.requests
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0.5, 1.0) * min(self.max_backoff, 2**attempt)
+
+    async def fetch(
+        self,
+        url: str,
+        params: Optional[Dict[str, str]] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> CrawlResponse:
+        """GET `url`, failures are returned as responses with `.error` set instead of raised."""
+        logger = get_logger()
+        if params:
+            url = f"{url}{'&' if '?' in url else '?'}{urllib.parse.urlencode(params)}"
+        if self.respect_robots:
+            robots = await self.robots(url)
+            if not robots.can_fetch(self.user_agent, url):
+                logger.info("Not fetching %s, it is disallowed by robots.txt", url)
+                return CrawlResponse(url, None, error="Disallowed by robots.txt")
+
+        headers = dict(headers or {})
+        cached = self.cache.get(url) if self.cache is not None else None
+        if cached is not None:
+            if cached.etag:
+                headers.setdefault("If-None-Match", cached.etag)
+            if cached.last_modified:
+                headers.setdefault("If-Modified-Since", cached.last_modified)
+        if self.manifest is not None:
+            for key, value in self.manifest.validators(url).items():
+                headers.setdefault(key, value)
+
+        host = urllib.parse.urlsplit(url).netloc
+        response = None
+        for attempt in range(self.max_attempts):
+            await self.bucket(host).acquire()
+            self.requests += 1
+            wait = None
+            try:
+                logger.debug("Sending GET to %s", url)
+                async with self.session.get(url, headers=headers) as resp:
+                    content = await resp.read()
+                    response = CrawlResponse(
+                        url,
+                        resp.status,
+                        dict(resp.headers),
+                        content,
+                        final_url=str(resp.url),
+                    )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                response = CrawlResponse(url, None, error=repr(e))
+            if response.status == 304:
+                if self.manifest is not None:
+                    self.manifest.touch(response)
+                if cached is not None:
+                    cached.changed = False
+                    return cached
+                if self.manifest is not None and url in self.manifest:
+                    response.changed = False
+                    return response
+            if response.ok:
+                if self.cache is not None:
+                    self.cache.put(response)
+                if self.manifest is not None:
+                    response.changed = self.manifest.record(response)
+                return response
+            if response.status is not None and response.status not in RETRY_STATUSES:
+                break
+            if response.status is not None:
+                wait = retry_after_seconds(response.headers)
+            if attempt + 1 == self.max_attempts or not self._can_retry():
+                break
+            self.retries += 1
+            wait = wait if wait is not None else self._backoff(attempt)
+            logger.info(
+                "Retrying %s in %.1f seconds (status: %s)", url, wait, response.status
+            )
+            await asyncio.sleep(wait)
+        logger.warning(
+            "Failed request to %s: %s", url, response.error or response.status
+        )
+        response.error = response.error or f"HTTP {response.status}"
+        return response
+
+    async def fetch_all(
+        self, urls: Iterable[str], concurrency: int = 32
+    ) -> AsyncIterator[CrawlResponse]:
+        """Fetch `urls` with at most `concurrency` requests in flight, yielded as they complete.
+
+        Only `concurrency` urls are pulled from `urls` at a time so it can be a
+        lazy iterator over a very large index.
+        """
+        urls = iter(urls)
+        pending = set()
+        while True:
+            for url in urls:
+                pending.add(asyncio.ensure_future(self.fetch(url)))
+                if len(pending) >= concurrency:
+                    break
+            if not pending:
+                return
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                yield task.result()
+
+
+def crawl(
+    urls: Iterable[str],
+    callback: Callable[[CrawlResponse], None],
+    concurrency: int = 32,
+    **kwargs,
+):
+    """Synchronous entry point, calls `callback` on each response as it completes.
+
+    `kwargs` are passed to `Crawler`.
+    """
+
+    async def _crawl():
+        async with Crawler(**kwargs) as crawler:
+            async for response in crawler.fetch_all(urls, concurrency=concurrency):
+                callback(response)
+
+    asyncio.run(_crawl())
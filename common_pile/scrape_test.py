@@ -0,0 +1,215 @@
+"""Tests for the crawler, run against a local HTTP server."""
+
+import asyncio
+import collections
+import http.server
+import threading
+import time
+
+import pytest
+
+from common_pile.scrape import (
+    Crawler,
+    CrawlManifest,
+    RateLimitedSession,
+    RateLimiter,
+    ResponseCache,
+    TokenBucket,
+    bounded_map,
+    rate_limit_remaining,
+    rate_limit_reset_seconds,
+    retry_after_seconds,
+)
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    counts = collections.Counter()
+
+    def do_GET(self):
+        self.counts[self.path] += 1
+        if self.path == "/robots.txt":
+            return self.reply(200, b"User-agent: *\nDisallow: /private\n")
+        if self.path == "/page":
+            if self.headers.get("If-None-Match") == '"v1"':
+                return self.reply(304, b"")
+            return self.reply(200, b"hello", {"ETag": '"v1"'})
+        if self.path == "/static":
+            return self.reply(200, b"no validators")
+        if self.path == "/flaky":
+            if self.counts[self.path] == 1:
+                return self.reply(429, b"", {"Retry-After": "0"})
+            return self.reply(200, b"finally")
+        return self.reply(404, b"")
+
+    def reply(self, status, body, headers=None):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    StandInHandler.counts.clear()
+    httpd = http.server.ThreadingHTTPServer(("localhost", 0), StandInHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://localhost:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def fetch(urls, **kwargs):
+    async def _fetch():
+        async with Crawler(requests_per_second=100, **kwargs) as crawler:
+            return {r.url: r async for r in crawler.fetch_all(urls)}
+
+    return asyncio.run(_fetch())
+
+
+def test_crawler_respects_robots(server):
+    responses = fetch([f"{server}/page", f"{server}/private"])
+    assert responses[f"{server}/page"].text == "hello"
+    assert responses[f"{server}/private"].error == "Disallowed by robots.txt"
+    assert StandInHandler.counts["/private"] == 0
+    assert StandInHandler.counts["/robots.txt"] == 1
+
+
+def test_crawler_retries_after_429(server):
+    response = fetch([f"{server}/flaky"])[f"{server}/flaky"]
+    assert response.ok
+    assert response.text == "finally"
+    assert StandInHandler.counts["/flaky"] == 2
+
+
+def test_crawler_does_not_retry_404(server):
+    response = fetch([f"{server}/missing"])[f"{server}/missing"]
+    assert response.status == 404
+    assert response.error == "HTTP 404"
+    assert StandInHandler.counts["/missing"] == 1
+
+
+def test_crawler_cache_uses_conditional_requests(server, tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    first = fetch([f"{server}/page"], cache=cache)[f"{server}/page"]
+    second = fetch([f"{server}/page"], cache=cache)[f"{server}/page"]
+    assert not first.from_cache
+    assert second.from_cache
+    assert second.text == "hello"
+    assert StandInHandler.counts["/page"] == 2
+
+
+def test_crawler_manifest_skips_unchanged(server, tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    urls = [f"{server}/page", f"{server}/static"]
+    with CrawlManifest(path) as manifest:
+        first = fetch(urls, manifest=manifest)
+    with CrawlManifest(path) as manifest:
+        start = manifest.get(f"{server}/page")["changed"]
+        second = fetch(urls, manifest=manifest)
+        assert manifest.get(f"{server}/page")["etag"] == '"v1"'
+    assert all(r.changed for r in first.values())
+    # The server said 304 to one and sent the same content for the other.
+    assert second[f"{server}/page"].status == 304
+    assert not any(r.changed for r in second.values())
+    with open(path) as f:
+        assert len(f.readlines()) == 2
+    assert CrawlManifest(path).changed_since(start) == set(urls)
+    assert CrawlManifest(path).changed_since("2999-01-01T00:00:00") == set()
+
+
+def test_token_bucket_limits_rate():
+    async def _acquire():
+        bucket = TokenBucket(rate=20, capacity=1)
+        start = asyncio.get_running_loop().time()
+        for _ in range(5):
+            await bucket.acquire()
+        return asyncio.get_running_loop().time() - start
+
+    # The first token is free, the next 4 need 1/20th of a second each.
+    assert asyncio.run(_acquire()) >= 0.19
+
+
+@pytest.mark.parametrize(
+    "headers,expected",
+    [({}, None), ({"Retry-After": "120"}, 120.0), ({"Retry-After": "soon"}, None)],
+)
+def test_retry_after_seconds(headers, expected):
+    assert retry_after_seconds(headers) == expected
+
+
+def test_bounded_map_limits_in_flight():
+    lock = threading.Lock()
+    state = {"read": 0, "running": 0, "most": 0}
+
+    def items():
+        for i in range(20):
+            state["read"] += 1
+            yield i
+
+    def work(i):
+        with lock:
+            state["running"] += 1
+            state["most"] = max(state["most"], state["running"])
+        time.sleep(0.01)
+        with lock:
+            state["running"] -= 1
+        if i == 3:
+            raise ValueError("bad item")
+        return i * 2
+
+    results = {}
+    for i, future in bounded_map(work, items(), workers=4, max_pending=3):
+        # Items are only read as earlier ones finish.
+        assert state["read"] <= len(results) + 1 + 3
+        results[i] = future.exception() or future.result()
+    assert state["most"] <= 3
+    assert isinstance(results.pop(3), ValueError)
+    assert results == {i: i * 2 for i in range(20) if i != 3}
+
+
+def test_rate_limit_headers():
+    assert rate_limit_reset_seconds({"X-RateLimit-Reset": "30"}) == 30
+    reset = rate_limit_reset_seconds({"x-ratelimit-reset": str(time.time() + 60)})
+    assert 55 < reset <= 60
+    assert rate_limit_reset_seconds({}) is None
+    assert rate_limit_remaining({"RateLimit-Remaining": "0"}) == 0
+    assert rate_limit_remaining({}) is None
+
+
+def test_rate_limiter_pauses_all_threads():
+    limiter = RateLimiter(requests_per_second=1000)
+    assert limiter.update(429, {"Retry-After": "0.3"}) == 0.3
+    assert limiter.rate == 500
+    started = time.monotonic()
+    threads = [threading.Thread(target=limiter.acquire) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.monotonic() - started >= 0.25
+    # Successful responses bring the rate back up.
+    for _ in range(10):
+        limiter.update(200, {})
+    assert limiter.rate == 1000
+
+
+def test_rate_limiter_pauses_when_none_remain():
+    limiter = RateLimiter(requests_per_second=1000)
+    wait = limiter.update(200, {"RateLimit-Remaining": "0", "RateLimit-Reset": "5"})
+    assert wait == 5
+    assert limiter.rate == 1000
+    assert limiter.paused_until > time.monotonic() + 4
+
+
+def test_rate_limited_session(server):
+    limiter = RateLimiter(requests_per_second=100)
+    session = RateLimitedSession(limiter)
+    assert session.get(f"{server}/flaky").status_code == 429
+    assert limiter.rate == 50
+    assert session.get(f"{server}/flaky").text == "finally"
+    assert limiter.rate == 60
@@ -0,0 +1,127 @@
+"""Run several ShardParallelProcessor steps as a single pass over dolma data."""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+
+from common_pile import logs, utils
+from common_pile.metrics import configure_metrics, get_sink
+from common_pile.pipeline import PipelineParallel, load_stage, summarize_stats
+
+
+def main():
+    mp.set_start_method("spawn")
+    parser = argparse.ArgumentParser(
+        description="Fuse multiple dolma processing steps into one pass."
+    )
+    parser.add_argument(
+        "--input",
+        required=True,
+        help="The input version, this directory should be where the `documents` dir lives.",
+    )
+    parser.add_argument(
+        "--output",
+        required=True,
+        help="The output version, this directory should be where the `documents` dir will live.",
+    )
+    parser.add_argument(
+        "--stage",
+        dest="stages",
+        action="append",
+        required=True,
+        help="A processor to run, either `module:Class` or `path/to/script.py:Class`. "
+        "Repeat the flag to add more stages, they are run in the order given.",
+    )
+    parser.add_argument(
+        "--filename",
+        default="*.jsonl.gz",
+        help="The filename to match with globs, probably needs to be escaped.",
+    )
+    parser.add_argument(
+        "--stage_outputs",
+        help="If set, the output of each stage is also written to a dolma dir here.",
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Should we overwrite previously processed examples?",
+    )
+    parser.add_argument(
+        "--debug",
+        action="store_true",
+        help="Should we log when documents are not changed by preprocessing.",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=mp.cpu_count(),
+        help="Number of processors for multicore.",
+    )
+    parser.add_argument("--meta", help="Location to save dolma processing metadata.")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Save a report of where time is spent to ${meta}/profile.",
+    )
+    parser.add_argument(
+        "--profile_sample_interval",
+        type=float,
+        help="If set, also sample the call stack every this many seconds while profiling.",
+    )
+    parser.add_argument("--log_level", default="INFO", help="The level to log at.")
+    parser.add_argument(
+        "--async_logging",
+        action="store_true",
+        help="Write logs from a background thread in batches.",
+    )
+    parser.add_argument(
+        "--metrics",
+        action="append",
+        default=[],
+        help="Where to export metrics, `jsonl:${path}`, `statsd:${host}:${port}`, "
+        "or `prometheus:${port}`. Can be repeated.",
+    )
+    parser.add_argument(
+        "--metrics_interval",
+        type=float,
+        default=10.0,
+        help="How often, in seconds, to export metrics.",
+    )
+    args = parser.parse_args()
+
+    stages = [load_stage(stage) for stage in args.stages]
+    # Most processing scripts configure logging when imported, reset it so we
+    # don't get duplicated handlers for each stage.
+    logs.get_logger().handlers.clear()
+    logs.configure_logging(level=args.log_level, asynchronous=args.async_logging)
+    metrics = None
+    if args.metrics:
+        metrics = configure_metrics(
+            [get_sink(m) for m in args.metrics], interval=args.metrics_interval
+        )
+
+    with utils.maybe_temp_dir(args.meta) as meta_dir:
+        stats_dir = os.path.join(meta_dir, "stages")
+        processor = PipelineParallel(
+            source_prefix=utils.dolma_input(args.input, args.filename),
+            destination_prefix=utils.dolma_output(args.output),
+            metadata_prefix=meta_dir,
+            num_processes=args.processes,
+        )
+        processor(
+            stages=stages,
+            stage_outputs=args.stage_outputs,
+            stats_dir=stats_dir,
+            debug=args.debug,
+            overwrite=args.overwrite,
+            profile=args.profile,
+            profile_sample_interval=args.profile_sample_interval,
+        )
+        print(json.dumps(summarize_stats(stats_dir), indent=2))
+    if metrics is not None:
+        metrics.stop()
+
+
+if __name__ == "__main__":
+    main()
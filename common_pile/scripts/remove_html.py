@@ -44,7 +44,7 @@ parser.add_argument(
     help="Number of processors for multicore.",
 )
 
-logs.configure_logging(level="DEBUG")
+logs.configure_logging(level="DEBUG", asynchronous=True)
 
 
 class CaptureMatches:
@@ -1,11 +1,13 @@
 """Shared utilities like string processing."""
 
 import glob
+import multiprocessing as mp
 import os
+import queue
 import re
 from contextlib import contextmanager
 from tempfile import TemporaryDirectory
-from typing import Optional
+from typing import Any, Optional, Sequence
 
 
 # We don't use snake case as the string methods added in PIP616 are named like this.
@@ -50,6 +52,13 @@ def dolma_output(output_path: str):
     return os.path.join(output_path, "documents")
 
 
+def dolma_relative(path: str) -> str:
+    """Get the path of a shard relative to the `documents` dir it lives in."""
+    if m := re.search(r"/documents/(.*)$", path):
+        return m.group(1)
+    return os.path.basename(path)
+
+
 @contextmanager
 def maybe_temp_dir(path: Optional[str] = None):
     if path is not None:
@@ -57,3 +66,31 @@ def maybe_temp_dir(path: Optional[str] = None):
     else:
         with TemporaryDirectory() as tmpdir:
             yield tmpdir
+
+
+def queue_get(
+    q: mp.Queue, processes: Sequence[mp.Process], timeout: float = 10.0
+) -> Any:
+    """Get the next item `processes` sent through `q`, raising if they died instead.
+
+    A worker that is OOM-killed or segfaults never sends its end of stream
+    marker, so a plain `q.get()` would block forever. Instead we wake up every
+    `timeout` seconds and check that the workers are still alive.
+    """
+    while True:
+        try:
+            return q.get(timeout=timeout)
+        except queue.Empty:
+            pass
+        failed = [p for p in processes if p.exitcode not in (None, 0)]
+        if failed:
+            raise RuntimeError(
+                f"Worker process {failed[0].pid} died with exit code {failed[0].exitcode}"
+            )
+        if not any(p.is_alive() for p in processes):
+            # Workers flush what they sent before exiting cleanly, so if there
+            # is still nothing, they exited without finishing.
+            try:
+                return q.get(timeout=timeout)
+            except queue.Empty:
+                raise RuntimeError("Worker processes exited without finishing")
@@ -0,0 +1,45 @@
+"""Tests for shared utilities."""
+
+import multiprocessing as mp
+import os
+
+import pytest
+
+from common_pile.utils import dolma_relative, queue_get
+
+
+@pytest.mark.parametrize(
+    "path,expected",
+    [
+        ("data/v1/documents/00000_a.jsonl.gz", "00000_a.jsonl.gz"),
+        ("data/v1/documents/sub/00000_a.jsonl.gz", "sub/00000_a.jsonl.gz"),
+        ("data/v1/00000_a.jsonl.gz", "00000_a.jsonl.gz"),
+    ],
+)
+def test_dolma_relative(path, expected):
+    assert dolma_relative(path) == expected
+
+
+def _send(q, crash):
+    if crash:
+        # Like an OOM kill, the worker never sends its end of stream marker.
+        os._exit(1)
+    q.put("hello")
+    q.put(None)
+
+
+def test_queue_get_raises_when_worker_dies():
+    q = mp.Queue()
+    worker = mp.Process(target=_send, args=(q, True), daemon=True)
+    worker.start()
+    with pytest.raises(RuntimeError, match="exit code 1"):
+        queue_get(q, [worker], timeout=0.1)
+
+
+def test_queue_get():
+    q = mp.Queue()
+    worker = mp.Process(target=_send, args=(q, False), daemon=True)
+    worker.start()
+    assert queue_get(q, [worker], timeout=0.1) == "hello"
+    assert queue_get(q, [worker], timeout=0.1) is None
+    worker.join()
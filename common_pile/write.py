@@ -1,15 +1,17 @@
 """Utilities that have to do with writing data."""
 
 import abc
+import collections
 import copy
 import datetime
+import inspect
 import json
 import logging
 import multiprocessing as mp
 import os
 from contextlib import ExitStack
 from queue import Queue
-from typing import Dict, Iterator
+from typing import Callable, Dict, Iterable, Iterator, Optional
 
 import contextual_logger
 import smart_open
@@ -17,6 +19,16 @@ import tqdm
 from dolma.core.parallel import BaseParallelProcessor
 
 from common_pile.logs import configure_logging, get_logger
+from common_pile.metrics import MetricsQueue, get_metrics
+from common_pile.profiling import (
+    NullProfile,
+    SamplingProfiler,
+    ShardProfile,
+    open_shard,
+    save_profile,
+    summarize_profiles,
+)
+from common_pile.utils import dolma_relative
 
 
 def shard_name(filename: str, shard: str, padding: int = 5):
@@ -66,6 +78,66 @@ def to_dolma(
             wf.write(data + "\n")
 
 
+def _write_shard(
+    process_batch: Callable[..., Iterable[Dict]],
+    batch,
+    path: str,
+    filename: str,
+    shard_idx: int,
+) -> int:
+    """Process a batch in a worker and write the results as a single shard."""
+    count = 0
+    shard_file = os.path.join(path, shard_name(filename, shard_idx))
+    with smart_open.open(shard_file, "w") as wf:
+        for example in process_batch(batch):
+            wf.write(json.dumps(example, default=serialize_datetime) + "\n")
+            count += 1
+    return count
+
+
+def to_dolma_parallel(
+    batches: Iterable,
+    process_batch: Callable[..., Iterable[Dict]],
+    path: str,
+    filename: str,
+    processes: int = 1,
+    max_pending: Optional[int] = None,
+    quiet: bool = False,
+) -> int:
+    """Process `batches` with a pool of workers, writing batch `i` to shard `i`.
+
+    `process_batch` (which must be picklable, i.e., a module level function)
+    turns a batch into dolma examples. The workers do the processing,
+    serialization, and compression, so throughput scales with `processes`.
+    As shards are named by their batch, the output is in the same order as
+    the input no matter which worker finishes first.
+
+    At most `max_pending` batches (`2 * processes` by default) are read ahead
+    of the workers, so memory is bounded by the batch size, not the size of
+    the input. Returns the number of examples written.
+    """
+    logger = get_logger()
+    logger.info("Writing Dolma Shards to %s", path)
+    os.makedirs(path, exist_ok=True)
+    max_pending = max_pending or 2 * processes
+    pending = collections.deque()
+    total = 0
+    with mp.Pool(processes) as pool, tqdm.tqdm(disable=quiet) as pbar:
+        for shard_idx, batch in enumerate(batches):
+            if len(pending) >= max_pending:
+                total += pending.popleft().get()
+                pbar.update(1)
+            pending.append(
+                pool.apply_async(
+                    _write_shard, (process_batch, batch, path, filename, shard_idx)
+                )
+            )
+        while pending:
+            total += pending.popleft().get()
+            pbar.update(1)
+    return total
+
+
 def smart_open_exists(path):
     try:
         with smart_open.open(path):
@@ -93,6 +165,38 @@ class ShardParallelProcessor(BaseParallelProcessor):
     ):
         return super().increment_progressbar(queue, shards=shards, documents=documents)
 
+    @classmethod
+    def report_metrics(cls, queue: Queue, /, **counts: int):
+        """Send counts that are only tracked as metrics, not progress bars, to the main process."""
+        queue.put(counts)
+
+    @classmethod
+    def _run_threaded_progressbar(cls, queue: Queue, timeout: float):
+        # When metrics are configured in the main process, record progress
+        # updates as they are pulled off the queue.
+        if (metrics := get_metrics()) is not None:
+            keys = list(inspect.signature(cls.increment_progressbar).parameters)[1:]
+            queue = MetricsQueue(queue, keys, metrics)
+        return super()._run_threaded_progressbar(queue, timeout)
+
+    def __call__(self, **process_single_kwargs):
+        """Run the processor, when `profile=True` a report is saved with the metadata."""
+        if get_metrics() is not None:
+            process_single_kwargs.setdefault("report_metrics", True)
+        profile_dir = None
+        if process_single_kwargs.get("profile"):
+            profile_dir = process_single_kwargs.setdefault(
+                "profile_dir", os.path.join(self.meta_prefixes[0], "profile")
+            )
+        super().__call__(**process_single_kwargs)
+        if profile_dir is not None:
+            summary = summarize_profiles(
+                profile_dir, slowest=process_single_kwargs.get("profile_slowest", 10)
+            )
+            with smart_open.open(os.path.join(profile_dir, "summary.json"), "w") as wf:
+                json.dump(summary, wf, indent=2)
+            get_logger().info("Saved profile summary to %s", profile_dir)
+
     @classmethod
     @abc.abstractmethod
     def process_example(cls, example, **kwargs):
@@ -122,30 +226,53 @@ class ShardParallelProcessor(BaseParallelProcessor):
             output_path = (
                 create_shadow(destination_path) if shadow else destination_path
             )
-            with smart_open.open(source_path) as f, smart_open.open(
-                output_path, "w"
-            ) as wf:
+            profile_dir = kwargs.pop("profile_dir", None)
+            profile_slowest = kwargs.pop("profile_slowest", 10)
+            sample_interval = kwargs.pop("profile_sample_interval", None)
+            profile = NullProfile()
+            sampler = None
+            if kwargs.pop("profile", False):
+                profile = ShardProfile(
+                    dolma_relative(destination_path), slowest=profile_slowest
+                )
+                if sample_interval:
+                    sampler = SamplingProfiler(sample_interval)
+            report_metrics = kwargs.pop("report_metrics", False)
+            with ExitStack() as stack:
+                if sampler is not None:
+                    stack.enter_context(sampler)
+                f = stack.enter_context(open_shard(source_path, "r", profile))
+                wf = stack.enter_context(open_shard(output_path, "w", profile))
                 document_count = 0
+                byte_count = 0
+                error_count = 0
                 update_interval = kwargs.pop("update_interval", 1)
                 debug = kwargs.pop("debug", False)
 
                 try:
                     for i, line in enumerate(f):
+                        profile.lap("read")
+                        byte_count += len(line)
                         with logger(line=i):
                             try:
                                 data = json.loads(line)
                             except json.JSONDecodeError as e:
+                                error_count += 1
                                 logger.warning(
                                     "Failed to parse JSON from `%s...`",
                                     line[:80],
                                     exc_info=True,
                                 )
                                 continue
+                            profile.lap("parse")
 
                             og = copy.deepcopy(data["text"]) if debug else None
                             processed = cls.process_example(
                                 data, source_file=source_path, line_number=i, **kwargs
                             )
+                            elapsed = profile.lap("process")
+                            if profile:
+                                profile.document(data.get("id"), len(line), elapsed)
                             if processed is None:
                                 logger.warning(
                                     "Preprocessing has reduced example to nothing, skipping"
@@ -156,16 +283,25 @@ class ShardParallelProcessor(BaseParallelProcessor):
                             if debug and og == processed["text"]:
                                 logger.warning("Text unchanged for example.")
 
-                            wf.write(json.dumps(processed) + "\n")
+                            processed = json.dumps(processed) + "\n"
+                            profile.lap("serialize")
+                            wf.write(processed)
+                            profile.lap("write")
                             document_count += 1
 
                             if document_count % update_interval == 0:
                                 cls.increment_progressbar(
                                     queue, documents=document_count
                                 )
+                                if report_metrics:
+                                    cls.report_metrics(
+                                        queue, bytes=byte_count, errors=error_count
+                                    )
+                                    byte_count = error_count = 0
                                 if queue.qsize() >= mp.cpu_count():
                                     update_interval *= 2
                                 document_count = 0
+                            profile.lap("progress")
                 except Exception as e:
                     e.add_note(f"Exception occured while processing {source_path}:{i}")
                     logger.warning(
@@ -173,8 +309,14 @@ class ShardParallelProcessor(BaseParallelProcessor):
                         exc_info=True,
                     )
                     raise
-                # Cloud Storage generally doesn't have a cheap way to rename files. So
-                # shadow paging should generally only be used for local data.
-                if shadow:
-                    os.rename(output_path, destination_path)
-                cls.increment_progressbar(queue, shards=1, documents=document_count)
+            # Closing the output flushes the last compressed block.
+            profile.lap("write")
+            # Cloud Storage generally doesn't have a cheap way to rename files. So
+            # shadow paging should generally only be used for local data.
+            if shadow:
+                os.rename(output_path, destination_path)
+            if profile and profile_dir is not None:
+                save_profile(profile, profile_dir, sampler)
+            if report_metrics:
+                cls.report_metrics(queue, bytes=byte_count, errors=error_count)
+            cls.increment_progressbar(queue, shards=1, documents=document_count)
@@ -0,0 +1,27 @@
+"""Tests for writing dolma shards."""
+
+import gzip
+import json
+import os
+
+from common_pile.write import to_dolma_parallel
+
+
+def double(batch):
+    for i in batch:
+        yield {"id": str(i), "text": str(2 * i)}
+
+
+def test_to_dolma_parallel_writes_ordered_shards(tmp_path):
+    batches = ([i, i + 1, i + 2] for i in range(0, 30, 3))
+    total = to_dolma_parallel(
+        batches, double, str(tmp_path), "test.jsonl.gz", processes=2, quiet=True
+    )
+    assert total == 30
+    shards = sorted(os.listdir(tmp_path))
+    assert shards == [f"{i:05}_test.jsonl.gz" for i in range(10)]
+    ids = []
+    for shard in shards:
+        with gzip.open(tmp_path / shard, "rt") as f:
+            ids.extend(json.loads(line)["id"] for line in f)
+    assert ids == [str(i) for i in range(30)]
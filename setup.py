@@ -59,6 +59,7 @@ setup(
     python_requires=">=3.8",
     license="MIT",
     install_requires=[
+        "aiohttp",
         "logging_json",
         "requests>=2.13",
         "tenacity",
@@ -68,6 +69,7 @@ setup(
         "console_scripts": [
             "size-stats-dolma = common_pile.scripts.stats:main",
             "remove-none-dolma = common_pile.scripts.remove_none:main",
+            "pipeline-dolma = common_pile.scripts.pipeline:main",
         ]
     },
 )
@@ -104,6 +104,36 @@ def is_new_id(article_id: str) -> bool:
     return bool(re.match(r"\d{4}\.\d{5}", article_id))
 
 
+def safe_member(member: tarfile.TarInfo, path: str) -> bool:
+    """Only extract regular files and directories that end up inside of `path`."""
+    if not (member.isfile() or member.isdir()):
+        return False
+    target = os.path.realpath(os.path.join(path, member.name))
+    return os.path.commonpath([target, os.path.realpath(path)]) == os.path.realpath(
+        path
+    )
+
+
+class HashingReader:
+    """Read a file in chunks, updating an md5 and copying each chunk to `wf`."""
+
+    def __init__(self, f, wf, chunk_size: int = 8 * 1024 * 1024):
+        self.f = f
+        self.wf = wf
+        self.chunk_size = chunk_size
+        self.md5 = hashlib.md5()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.f.read(self.chunk_size if size is None or size < 0 else size)
+        self.md5.update(data)
+        self.wf.write(data)
+        return data
+
+    def drain(self):
+        while self.read(self.chunk_size):
+            pass
+
+
 class BulkDownloader:
     def __init__(
         self,
@@ -112,6 +142,7 @@ class BulkDownloader:
         overwrite: bool = True,
         dry_run: bool = False,
         base_url: str = BASE_URL,
+        chunk_size: int = 8 * 1024 * 1024,
     ):
         self.manifest = manifest
         self.shards = sorted(
@@ -128,6 +159,7 @@ class BulkDownloader:
         self.base_url = base_url
         self.output_dir = output_dir
         self.dry_run = dry_run
+        self.chunk_size = chunk_size
 
     # To make testing easier.
     def find_shard(self, article_id: str) -> Shard:
@@ -151,7 +183,24 @@ class BulkDownloader:
         if shard := self.find_shard(article_id):
             self.download_shard(shard)
 
-    def download_shard(self, shard: Shard):
+    def open(self, url: str):
+        """Open a remote file, s3 urls are requester pays."""
+        transport_params = None
+        if url.startswith("s3://"):
+            transport_params = {
+                "client_kwargs": {"S3.Client.get_object": {"RequestPayer": "requester"}}
+            }
+        return smart_open.open(url, mode="rb", transport_params=transport_params)
+
+    def download_shard(self, shard: Shard) -> bool:
+        """Download, verify, and extract a shard, returns if it was successful.
+
+        The download is streamed in chunks. Each chunk updates the md5, is
+        saved to disk, and is fed to a streaming tar reader which extracts
+        members as soon as they are complete. That way memory use is fixed and
+        verification and extraction overlap with the download. If the md5 doesn't
+        match in the end, everything that was written is removed.
+        """
         url = f"{self.base_url}/{shard.file_name}"
         logger = logs.get_logger("arxiv")
         logger.info(f"Downloading {url}")
@@ -159,32 +208,45 @@ class BulkDownloader:
         output_file = os.path.join(self.output_dir, shard.file_name)
         if os.path.exists(output_file) and not self.overwrite:
             logger.info(f"Downloading of {url} skipped as the file already exists.")
-            return
+            return True
         if self.dry_run:
             logger.info(f"Downloading of {url} skipped as --dry_run was set.")
-            return
-        transport_params = {
-            "client_kwargs": {"S3.Client.get_object": {"RequestPayer": "requester"}}
-        }
-        with smart_open.open(url, mode="rb", transport_params=transport_params) as f:
-            data = f.read()
-        # Check that the download wasn't corrupted.
-        md5 = hashlib.md5(data).hexdigest()
-        if md5 != shard.md5:
-            logger.warning(f"md5 hash did not match for {shard.file_name}")
-            return
-        # Save the download compressed/unextracted (makes it easier to avoid
-        # duplicate downloads.)
-        logger.info(f"Saving shard to {output_file}")
-        with open(output_file, "wb") as wf:
-            wf.write(data)
+            return False
         # Extract the tarball. We extract it into the same dir that the tarball
         # is in, we use os.path.dirname instead of the output_dir parameter
         # as the shards have an extra `src/` directory in their names.
-        logger.info(f"Extracting shard at {output_file}")
-        with tarfile.open(output_file) as tar:
-            # TODO: If we move to python 3.12, add `filter="data"`
-            tar.extractall(os.path.dirname(output_file))
+        extract_dir = os.path.dirname(output_file)
+        os.makedirs(extract_dir, exist_ok=True)
+        extracted = []
+        # Save the download compressed/unextracted (makes it easier to avoid
+        # duplicate downloads.)
+        with self.open(url) as f, open(f"{output_file}.tmp", "wb") as wf:
+            reader = HashingReader(f, wf, self.chunk_size)
+            try:
+                with tarfile.open(fileobj=reader, mode="r|") as tar:
+                    for member in tar:
+                        if not safe_member(member, extract_dir):
+                            logger.warning(f"Not extracting unsafe path {member.name}")
+                            continue
+                        # TODO: If we move to python 3.12, add `filter="data"`
+                        tar.extract(member, extract_dir)
+                        if member.isfile():
+                            extracted.append(os.path.join(extract_dir, member.name))
+            except tarfile.TarError:
+                # A corrupted download will also fail the md5 check below.
+                logger.exception(f"Failed to extract {shard.file_name}")
+            # Read whatever is after the end of the archive so it is hashed too.
+            reader.drain()
+        # Check that the download wasn't corrupted.
+        if reader.md5.hexdigest() != shard.md5:
+            logger.warning(f"md5 hash did not match for {shard.file_name}")
+            for path in extracted:
+                os.remove(path)
+            os.remove(f"{output_file}.tmp")
+            return False
+        os.replace(f"{output_file}.tmp", output_file)
+        logger.info(f"Saved and extracted shard to {output_file}")
+        return True
 
     def download_all(self):
         for shard in self.shards:
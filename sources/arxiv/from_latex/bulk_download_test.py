@@ -0,0 +1,71 @@
+"""Tests for streaming arXiv bulk downloads, using a directory as the object store."""
+
+import hashlib
+import io
+import os
+import tarfile
+
+from bulk_download import BulkDownloader
+
+MANIFEST = """<arXivSRC>
+  <file>
+    <filename>src/arXiv_src_2301_001.tar</filename>
+    <first_item>2301.00001</first_item>
+    <last_item>2301.00002</last_item>
+    <md5sum>{md5}</md5sum>
+  </file>
+</arXivSRC>
+"""
+
+ARTICLES = {
+    "2301/2301.00001.gz": b"first article",
+    "2301/2301.00002.gz": b"second article" * 1000,
+}
+
+
+def make_store(tmp_path):
+    """Write a shard tarball into a local "bucket" and return its md5."""
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        for name, data in ARTICLES.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    data = buf.getvalue()
+    os.makedirs(tmp_path / "store" / "src")
+    with open(tmp_path / "store" / "src" / "arXiv_src_2301_001.tar", "wb") as wf:
+        wf.write(data)
+    return hashlib.md5(data).hexdigest()
+
+
+def make_downloader(tmp_path, md5):
+    manifest = tmp_path / "manifest.xml"
+    manifest.write_text(MANIFEST.format(md5=md5))
+    return BulkDownloader(
+        str(manifest),
+        str(tmp_path / "data"),
+        base_url=str(tmp_path / "store"),
+        # Small chunks so the tar is read across many of them.
+        chunk_size=1024,
+    )
+
+
+def test_download_shard_streams_and_extracts(tmp_path):
+    md5 = make_store(tmp_path)
+    downloader = make_downloader(tmp_path, md5)
+    (shard,) = downloader.shards
+    assert downloader.download_shard(shard)
+    output_file = tmp_path / "data" / "src" / "arXiv_src_2301_001.tar"
+    assert hashlib.md5(output_file.read_bytes()).hexdigest() == md5
+    assert not os.path.exists(f"{output_file}.tmp")
+    for name, data in ARTICLES.items():
+        assert (tmp_path / "data" / "src" / name).read_bytes() == data
+
+
+def test_download_shard_cleans_up_md5_mismatch(tmp_path):
+    make_store(tmp_path)
+    downloader = make_downloader(tmp_path, "0" * 32)
+    (shard,) = downloader.shards
+    assert not downloader.download_shard(shard)
+    assert os.listdir(tmp_path / "data" / "src") == ["2301"]
+    assert not os.listdir(tmp_path / "data" / "src" / "2301")
@@ -0,0 +1,257 @@
+"""Convert latex to text in a supervised subprocess with time and memory budgets.
+
+Some documents make pylatexenc run for minutes or use huge amounts of memory,
+which would stall the whole shard if run inline. Instead, each dolma worker
+sends documents to its own long lived converter process (`python
+latex_convert.py`, one json line per document over stdin/stdout). If a
+document goes over the wall-clock budget the converter is killed and
+restarted. The memory budget is enforced in the converter with `RLIMIT_AS`.
+Either way, the document is recorded as a failure and processing moves on.
+
+Results are cached by the hash of the latex, so reruns skip documents that
+were already converted (or that already failed with the same budget).
+"""
+
+import argparse
+import atexit
+import functools
+import gzip
+import hashlib
+import json
+import os
+import resource
+import selectors
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from common_pile import logs
+
+# Bump if the conversion changes so old cache entries aren't used.
+CACHE_VERSION = 1
+
+
+@functools.cache
+def latex_context():
+    import pylatexenc.latex2text
+
+    l2t_db = pylatexenc.latex2text.get_default_latex_context_db()
+    l2t_db.add_context_category(
+        "overrides",
+        prepend=True,
+        macros=[
+            pylatexenc.latex2text.MacroTextSpec("includegraphics"),
+            pylatexenc.latex2text.MacroTextSpec("maketitle"),
+        ],
+        environments=[
+            pylatexenc.latex2text.EnvironmentTextSpec("array"),
+            pylatexenc.latex2text.EnvironmentTextSpec("pmatrix"),
+            pylatexenc.latex2text.EnvironmentTextSpec("bmatrix"),
+            pylatexenc.latex2text.EnvironmentTextSpec("smallmatrix"),
+        ],
+    )
+    return l2t_db
+
+
+def latex_to_text(document: str) -> str:
+    import pylatexenc.latex2text
+
+    # TODO: Add better processing for citations and section references.
+    return pylatexenc.latex2text.LatexNodes2Text(
+        math_mode="verbatim", latex_context=latex_context()
+    ).latex_to_text(document)
+
+
+def content_hash(document: str) -> str:
+    return hashlib.sha256(f"{CACHE_VERSION}\n{document}".encode("utf-8")).hexdigest()
+
+
+class ConversionCache:
+    """Converted text (or failures) saved as `{path}/ab/abcd....json.gz` by hash."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f"{key}.json.gz")
+
+    def get(self, key: str) -> Optional[Dict]:
+        try:
+            with gzip.open(self._path(key), "rt") as f:
+                return json.load(f)
+        except (FileNotFoundError, EOFError, json.JSONDecodeError):
+            return None
+
+    def put(self, key: str, result: Dict):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so other workers never read a partial entry.
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp, "wt") as wf:
+            json.dump(result, wf)
+        os.replace(tmp, path)
+
+
+class LatexConverter:
+    """Send documents to a converter subprocess, restarting it when it goes over budget.
+
+    Results are dicts with either `text` or `error`, errors are one of
+    `timeout`, `memory`, `crash`, or the name of the exception pylatexenc
+    raised.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 60,
+        max_memory: Optional[int] = None,
+        cache_dir: Optional[str] = None,
+        failure_log: Optional[str] = None,
+        command: Optional[List[str]] = None,
+    ):
+        self.timeout = timeout
+        self.max_memory = max_memory
+        self.cache = ConversionCache(cache_dir) if cache_dir else None
+        self.failure_log = failure_log
+        if command is None:
+            command = [sys.executable, os.path.abspath(__file__)]
+            if max_memory:
+                command.extend(["--max_memory", str(max_memory)])
+        self.command = command
+        self.process = None
+        self.buffer = b""
+        atexit.register(self.close)
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        self.buffer = b""
+
+    def close(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+
+    def _read_line(self, deadline: float) -> Tuple[Optional[bytes], Optional[str]]:
+        """Read a line from the converter, or why it couldn't be read."""
+        fd = self.process.stdout.fileno()
+        with selectors.DefaultSelector() as selector:
+            selector.register(fd, selectors.EVENT_READ)
+            while b"\n" not in self.buffer:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not selector.select(remaining):
+                    return None, "timeout"
+                chunk = os.read(fd, 1024 * 1024)
+                if not chunk:
+                    return None, "crash"
+                self.buffer += chunk
+        line, _, self.buffer = self.buffer.partition(b"\n")
+        return line, None
+
+    def _convert(self, document: str) -> Dict:
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+        deadline = time.monotonic() + self.timeout
+        try:
+            self.process.stdin.write(json.dumps({"text": document}).encode() + b"\n")
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            self.close()
+            return {"error": "crash"}
+        line, error = self._read_line(deadline)
+        if error is not None:
+            self.close()
+            return {"error": error}
+        return json.loads(line)
+
+    def record_failure(self, doc_id: str, result: Dict, seconds: float, **kwargs):
+        logs.get_logger().warning(
+            f"Failed to parse latex for document {doc_id}: {result['error']}"
+        )
+        if self.failure_log:
+            record = {
+                "id": doc_id,
+                "seconds": seconds,
+                "timeout": self.timeout,
+                "max_memory": self.max_memory,
+                **result,
+                **kwargs,
+            }
+            # Short appends are atomic, so workers can share the log.
+            with open(self.failure_log, "a") as wf:
+                wf.write(json.dumps(record) + "\n")
+
+    def cached_failure(self, result: Dict) -> bool:
+        """Only skip documents that went over a budget at least as big as ours."""
+        if result["error"] not in ("timeout", "memory", "crash"):
+            # Parse errors will happen again.
+            return True
+        no_limit = float("inf")
+        return result["timeout"] >= self.timeout and (
+            result["max_memory"] or no_limit
+        ) >= (self.max_memory or no_limit)
+
+    def convert(self, document: str, doc_id: str = None, **kwargs) -> Dict:
+        """Convert a document, the result has `text` or an `error`.
+
+        `kwargs` are extra fields included when a failure is recorded.
+        """
+        key = content_hash(document)
+        if self.cache is not None:
+            result = self.cache.get(key)
+            if result is not None:
+                if "text" in result:
+                    return result
+                if self.cached_failure(result):
+                    self.record_failure(doc_id, result, 0, cached=True, **kwargs)
+                    return result
+        start = time.monotonic()
+        result = self._convert(document)
+        seconds = time.monotonic() - start
+        if "error" in result:
+            result = {
+                **result,
+                "timeout": self.timeout,
+                "max_memory": self.max_memory,
+            }
+            self.record_failure(doc_id, result, seconds, **kwargs)
+        if self.cache is not None:
+            self.cache.put(key, result)
+        return result
+
+
+@functools.cache
+def get_converter(
+    timeout: float,
+    max_memory: Optional[int],
+    cache_dir: Optional[str],
+    failure_log: Optional[str],
+) -> LatexConverter:
+    """One converter per dolma worker process."""
+    return LatexConverter(timeout, max_memory, cache_dir, failure_log)
+
+
+def serve(max_memory: Optional[int] = None):
+    """The converter process, convert json lines from stdin until it closes."""
+    if max_memory:
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+    latex_context()
+    for line in sys.stdin.buffer:
+        document = json.loads(line)["text"]
+        try:
+            result = {"text": latex_to_text(document)}
+        except MemoryError:
+            result = {"error": "memory"}
+        except Exception as e:
+            result = {"error": type(e).__name__}
+        sys.stdout.buffer.write(json.dumps(result).encode() + b"\n")
+        sys.stdout.buffer.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert latex from stdin.")
+    parser.add_argument("--max_memory", type=int, help="Address space limit in bytes.")
+    args = parser.parse_args()
+    serve(args.max_memory)
@@ -0,0 +1,76 @@
+"""Tests for converting latex in a supervised subprocess."""
+
+import json
+import sys
+
+import pytest
+from latex_convert import LatexConverter
+
+# Stands in for the converter, echos documents but hangs or dies on request.
+FAKE_CONVERTER = """
+import json, sys, time
+for line in sys.stdin:
+    text = json.loads(line)["text"]
+    if text == "slow":
+        time.sleep(60)
+    if text == "crash":
+        sys.exit(1)
+    print(json.dumps({"text": text.upper()}), flush=True)
+"""
+
+
+def fake_converter(tmp_path, timeout=1, **kwargs):
+    return LatexConverter(
+        timeout=timeout,
+        cache_dir=str(tmp_path / "cache"),
+        failure_log=str(tmp_path / "failures.jsonl"),
+        command=[sys.executable, "-c", FAKE_CONVERTER],
+        **kwargs,
+    )
+
+
+def read_failures(tmp_path):
+    with open(tmp_path / "failures.jsonl") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_converter_kills_slow_documents_and_moves_on(tmp_path):
+    converter = fake_converter(tmp_path)
+    assert converter.convert("fast", "a") == {"text": "FAST"}
+    result = converter.convert("slow", "b", source_file="shard.jsonl.gz")
+    assert result["error"] == "timeout"
+    assert converter.convert("crash", "c")["error"] == "crash"
+    # The converter is restarted for the next document.
+    assert converter.convert("after", "d") == {"text": "AFTER"}
+    converter.close()
+    failures = read_failures(tmp_path)
+    assert [(f["id"], f["error"]) for f in failures] == [
+        ("b", "timeout"),
+        ("c", "crash"),
+    ]
+    assert failures[0]["source_file"] == "shard.jsonl.gz"
+
+
+def test_converter_skips_cached_documents(tmp_path):
+    converter = fake_converter(tmp_path)
+    converter.convert("fast", "a")
+    converter.convert("slow", "b")
+    converter.close()
+
+    # Nothing should reach the converter, which would now crash on everything.
+    cached = fake_converter(tmp_path)
+    cached.command = [sys.executable, "-c", "import sys; sys.exit(1)"]
+    assert cached.convert("fast", "a") == {"text": "FAST"}
+    assert cached.convert("slow", "b")["error"] == "timeout"
+    # With a bigger budget the failure is retried.
+    retry = fake_converter(tmp_path, timeout=2)
+    retry.command = cached.command
+    assert retry.convert("slow", "b")["error"] == "crash"
+
+
+def test_converter_converts_latex(tmp_path):
+    pytest.importorskip("pylatexenc")
+    converter = LatexConverter(timeout=30)
+    result = converter.convert(r"\textbf{Hello} \emph{world}", "a")
+    converter.close()
+    assert result == {"text": "Hello world"}
@@ -7,7 +7,7 @@ import os
 import re
 from tempfile import TemporaryDirectory
 
-import pylatexenc.latex2text
+from latex_convert import get_converter
 
 from common_pile.write import ShardParallelProcessor
 
@@ -24,7 +24,6 @@ parser.add_argument(
     default="data/arxiv/v0",
     help="The output version, this directory should be where the `documents` dir will live.",
 )
-# TODO: Respect this flag
 parser.add_argument(
     "--overwrite",
     action="store_true",
@@ -41,38 +40,47 @@ parser.add_argument(
     default=mp.cpu_count(),
     help="Number of processors for multicore.",
 )
-
-
-l2t_db = pylatexenc.latex2text.get_default_latex_context_db()
-l2t_db.add_context_category(
-    "overrides",
-    prepend=True,
-    macros=[
-        pylatexenc.latex2text.MacroTextSpec("includegraphics"),
-        pylatexenc.latex2text.MacroTextSpec("maketitle"),
-    ],
-    environments=[
-        pylatexenc.latex2text.EnvironmentTextSpec("array"),
-        pylatexenc.latex2text.EnvironmentTextSpec("pmatrix"),
-        pylatexenc.latex2text.EnvironmentTextSpec("bmatrix"),
-        pylatexenc.latex2text.EnvironmentTextSpec("smallmatrix"),
-    ],
+parser.add_argument(
+    "--timeout",
+    type=float,
+    default=120,
+    help="Seconds a single document can take before its conversion is killed.",
+)
+parser.add_argument(
+    "--max_memory",
+    type=float,
+    help="GB of memory a single document's conversion can use.",
+)
+parser.add_argument(
+    "--cache_dir",
+    help="Where converted documents are cached by content hash, so reruns skip them.",
+)
+parser.add_argument(
+    "--failure_log",
+    help="A jsonl file where documents that failed to convert are recorded.",
 )
 
 
 class ArxivParallel(ShardParallelProcessor):
     @classmethod
-    def process_example(cls, example, **kwargs):
+    def process_example(
+        cls,
+        example,
+        timeout: float = 120,
+        max_memory: int = None,
+        cache_dir: str = None,
+        failure_log: str = None,
+        **kwargs,
+    ):
         latex = example["text"]
         document = latex.split(r"\begin{document}")[1]
-        # TODO: Add better processing for citations and section references.
-        try:
-            text = pylatexenc.latex2text.LatexNodes2Text(
-                math_mode="verbatim", latex_context=l2t_db
-            ).latex_to_text(document)
-        except Exception as e:
-            logger = cls.get_logger()
-            logger.warning(f"Failed to parse latex for document {example['id']}")
+        # Conversion happens in a separate process so a pathological document
+        # can be killed without stalling the whole shard.
+        converter = get_converter(timeout, max_memory, cache_dir, failure_log)
+        result = converter.convert(
+            document, example["id"], source_file=kwargs.get("source_file")
+        )
+        if (text := result.get("text")) is None:
             return None
         lines = [l.strip() for l in text.splitlines()]
         text = "\n".join(
@@ -91,7 +99,16 @@ def main(args):
             metadata_prefix=tempdir,
             num_processes=args.processes,
         )
-        processors(debug=args.debug)
+        processors(
+            debug=args.debug,
+            overwrite=args.overwrite,
+            timeout=args.timeout,
+            max_memory=(
+                int(args.max_memory * 1000 * 1000 * 1000) if args.max_memory else None
+            ),
+            cache_dir=args.cache_dir,
+            failure_log=args.failure_log,
+        )
 
 
 if __name__ == "__main__":
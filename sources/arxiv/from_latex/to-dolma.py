@@ -1,21 +1,24 @@
 """Convert Arxiv Dumps into the dolma format."""
 
 import argparse
+import collections
 import copy
 import datetime
 import functools
 import gzip
+import io
 import itertools
 import json
+import multiprocessing as mp
 import os
 import re
 import tarfile
-from typing import Dict, Optional, Sequence, Set, Tuple
+from typing import Dict, Iterator, Optional, Set, Tuple
 
-from bulk_download import BulkDownloader
+from bulk_download import BulkDownloader, Shard
 from charset_normalizer import from_bytes
 
-from common_pile import logs
+from common_pile import logs, utils
 from common_pile.licenses import PermissiveLicenses
 from common_pile.write import to_dolma
 
@@ -49,6 +52,16 @@ parser.add_argument(
 parser.add_argument(
     "--dry_run", action="store_true", help="Should we not actually download any files."
 )
+parser.add_argument(
+    "--processes",
+    type=int,
+    default=mp.cpu_count(),
+    help="Number of processes, each converts the articles from one bulk download shard at a time.",
+)
+parser.add_argument(
+    "--work_dir",
+    help="Where to save the metadata split by bulk download shard, defaults to a temp dir.",
+)
 
 
 LICENSES = {
@@ -139,20 +152,15 @@ def interpolate_document(
     return "".join(full_contents), skip
 
 
-def load_article_src(article_path: str, article_id: str) -> str:
-    """article_path should be a `.gz` file."""
+def load_article_data(data: bytes, article_id: str):
+    """Yield (contents, filename) for each document in the gzip'd source of an article."""
     logger = logs.get_logger("arxiv")
-    if not os.path.exists(article_path):
-        logger.warning(f"Article `{article_id}` source is missing.")
-        if not os.path.exists(f"{os.path.splitext(article_path)[0]}.pdf"):
-            logger.warning(f"Article `{article_id}` pdf is missing too.")
-        return []
     try:
         # If the src is a tar file, then we will emit one document for each
         # top-level .tex file.
-        if tarfile.is_tarfile(article_path):
+        if tarfile.is_tarfile(io.BytesIO(data)):
             skip = set()
-            with tarfile.open(article_path, "r:gz") as tar:
+            with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as tar:
                 for info in tar:
                     # If we interpolated this file into another, don't use it as
                     # a document.
@@ -177,18 +185,28 @@ def load_article_src(article_path: str, article_id: str) -> str:
         # If it isn't a tarfile, it is at least gzip compressed.
         else:
             logger.debug(f"Creating a document from single file for {article_id}")
-            with gzip.open(article_path) as f:
-                contents = f.read()
+            contents = str(from_bytes(gzip.decompress(data)).best())
             # If the file isn't a tarball, then it won't have any extra files
             # that are `\input`ed.
-            yield content, None
+            yield contents, None
     except Exception as e:
-        logger.warning(
-            f"Failed to load article [{article_id}] at `{article_path}`: {e}"
-        )
+        logger.warning(f"Failed to load article [{article_id}]: {e}")
         return []
 
 
+def load_article_src(article_path: str, article_id: str):
+    """article_path should be a `.gz` file."""
+    logger = logs.get_logger("arxiv")
+    if not os.path.exists(article_path):
+        logger.warning(f"Article `{article_id}` source is missing.")
+        if not os.path.exists(f"{os.path.splitext(article_path)[0]}.pdf"):
+            logger.warning(f"Article `{article_id}` pdf is missing too.")
+        return []
+    with open(article_path, "rb") as f:
+        data = f.read()
+    return load_article_data(data, article_id)
+
+
 def format_dolma(article, text: str, source: str = SOURCE_NAME):
     return {
         "id": article["id"],
@@ -205,30 +223,18 @@ def format_dolma(article, text: str, source: str = SOURCE_NAME):
     }
 
 
-def process_article(
-    article, dump_dir: str, bulk_downloader: BulkDownloader
-) -> Sequence[Tuple[Dict, str]]:
+def article_documents(article, contents_and_filename) -> Iterator[Tuple[Dict, str]]:
+    """Pair the article metadata with each document created from its source."""
     logger = logs.get_logger("arxiv")
-    # The bulk downloader is smart enough to only download dirs when it needs
-    # it so we can just call `.download` on all articles and know that it
-    # won't keep re-downloading things.
-    # The start and end fields of the shards use the same verions of ids as
-    # filenames, that is, without the `/`
-    bulk_downloader.download(id_to_filename(article["id"]))
-    article_path = os.path.join(
-        dump_dir,
-        id_to_directory(article["id"]),
-        f"{id_to_filename(article['id'])}.gz",
-    )
     # We can emit multiple documents if there are multiple top-level .tex files.
     # If this collection of all documents produced by a single article id has
     # only one document, don't include the filename in the dolma id.
-    contents_and_filename = list(load_article_src(article_path, article["id"]))
+    contents_and_filename = list(contents_and_filename)
     logger.debug(
         f"Article {article['id']} generated {len(contents_and_filename)} documents."
     )
     if not contents_and_filename:
-        return []
+        return
     if len(contents_and_filename) > 1:
         for contents, filename in contents_and_filename:
             updated_article = copy.deepcopy(article)
@@ -238,10 +244,165 @@ def process_article(
         yield article, contents_and_filename[0][0]
 
 
-def main(args):
-    with open(args.metadata) as f:
-        metadata = [json.loads(l) for l in f]
+def process_article(
+    article, dump_dir: str, bulk_downloader: Optional[BulkDownloader] = None
+) -> Iterator[Tuple[Dict, str]]:
+    """Create documents for an article from the extracted bulk download files."""
+    # The bulk downloader is smart enough to only download dirs when it needs
+    # it so we can just call `.download` on all articles and know that it
+    # won't keep re-downloading things.
+    # The start and end fields of the shards use the same verions of ids as
+    # filenames, that is, without the `/`
+    if bulk_downloader is not None:
+        bulk_downloader.download(id_to_filename(article["id"]))
+    article_path = os.path.join(
+        dump_dir,
+        id_to_directory(article["id"]),
+        f"{id_to_filename(article['id'])}.gz",
+    )
+    yield from article_documents(article, load_article_src(article_path, article["id"]))
+
+
+def process_shard(
+    shard: Shard,
+    articles: Dict[str, Dict],
+    dump_dir: str,
+    bulk_downloader: BulkDownloader,
+) -> Iterator[Tuple[Dict, str]]:
+    """Create documents for `articles` by reading their bulk download tar once.
+
+    `articles` maps the filename version of each id to its metadata, members
+    of the tar that aren't in it (i.e. they aren't CC licensed) are skipped
+    without being read.
+    """
+    logger = logs.get_logger("arxiv")
+    # Same quirk as in main, the shard file names include the `src/` dir.
+    tar_path = os.path.join(os.path.dirname(dump_dir), shard.file_name)
+    if not os.path.exists(tar_path):
+        bulk_downloader.download_shard(shard)
+    if not os.path.exists(tar_path):
+        # i.e. a --dry_run, the files may have been extracted already.
+        logger.warning(f"{tar_path} is missing, using the extracted files.")
+        for article in articles.values():
+            yield from process_article(article, dump_dir)
+        return
+    logger.info(f"Reading {len(articles)} articles from {tar_path}")
+    with tarfile.open(tar_path) as tar:
+        for info in tar:
+            name, ext = os.path.splitext(os.path.basename(info.name))
+            if ext != ".gz" or name not in articles:
+                continue
+            article = articles.pop(name)
+            data = tar.extractfile(info).read()
+            yield from article_documents(
+                article, load_article_data(data, article["id"])
+            )
+    for article in articles.values():
+        logger.warning(f"Article `{article['id']}` source is missing from {tar_path}.")
+
+
+def partition_metadata(
+    metadata_path: str,
+    bulk_downloader: BulkDownloader,
+    work_dir: str,
+    buffer_size: int = 10_000,
+) -> Dict[str, Optional[Shard]]:
+    """Split CC licensed articles into one file per bulk download shard.
 
+    The metadata is streamed and only `buffer_size` articles are held in
+    memory before they are flushed to their partition. Articles that can't be
+    matched to a shard (i.e. old style ids) go in the `unsharded` partition.
+    """
+    partitions = {}
+    buffers = collections.defaultdict(list)
+    buffered = 0
+    # Partitions are truncated the first time they are written to in this run,
+    # so rerunning doesn't append duplicates to the last run's partitions.
+    written = set()
+
+    def flush():
+        for partition, lines in buffers.items():
+            mode = "a" if partition in written else "w"
+            with open(os.path.join(work_dir, f"{partition}.jsonl"), mode) as wf:
+                wf.writelines(lines)
+            written.add(partition)
+        buffers.clear()
+
+    with open(metadata_path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            article = json.loads(line)
+            if article["license"] not in LICENSES:
+                continue
+            shard = bulk_downloader.find_shard(id_to_filename(article["id"]))
+            partition = (
+                os.path.splitext(os.path.basename(shard.file_name))[0]
+                if shard is not None
+                else "unsharded"
+            )
+            partitions[partition] = shard
+            buffers[partition].append(line if line.endswith("\n") else f"{line}\n")
+            buffered += 1
+            if buffered >= buffer_size:
+                flush()
+                buffered = 0
+    flush()
+    return partitions
+
+
+@functools.cache
+def get_bulk_downloader(manifest: str, output_dir: str, dry_run: bool):
+    return BulkDownloader(
+        manifest, output_dir=output_dir, overwrite=False, dry_run=dry_run
+    )
+
+
+def convert_partition(
+    partition: str,
+    shard: Optional[Shard],
+    work_dir: str,
+    dump_dir: str,
+    output_dir: str,
+    filename: str,
+    shard_size: int,
+    manifest: str,
+    dry_run: bool = False,
+) -> Tuple[str, int]:
+    """Convert every article in a partition and write them to its own dolma shards."""
+    logger = logs.get_logger("arxiv")
+    with open(os.path.join(work_dir, f"{partition}.jsonl")) as f:
+        articles = {
+            id_to_filename(a["id"]): a for a in (json.loads(line) for line in f)
+        }
+    logger.info(f"Converting {len(articles)} articles from {partition}")
+    if shard is None:
+        meta_and_content = itertools.chain.from_iterable(
+            process_article(a, dump_dir) for a in articles.values()
+        )
+    else:
+        bulk_downloader = get_bulk_downloader(
+            manifest, os.path.dirname(dump_dir), dry_run
+        )
+        meta_and_content = process_shard(shard, articles, dump_dir, bulk_downloader)
+    documents = 0
+
+    def count(x):
+        nonlocal documents
+        documents += 1
+        return format_dolma(*x)
+
+    to_dolma(
+        map(count, meta_and_content),
+        output_dir,
+        f"{partition}_{filename}",
+        shard_size,
+        quiet=True,
+    )
+    return partition, documents
+
+
+def main(args):
     bulk_downloader = BulkDownloader(
         args.manifest,
         # Having to grab the dir for this is ugly, but it is a quirk of the
@@ -251,15 +412,24 @@ def main(args):
         overwrite=False,
         dry_run=args.dry_run,
     )
-
-    # Use iterators so we don't load the whole dataset into memory.
-    cc_articles = (a for a in metadata if a["license"] in LICENSES)
-    process = functools.partial(
-        process_article, dump_dir=args.dump_dir, bulk_downloader=bulk_downloader
-    )
-    meta_and_content = itertools.chain(*map(process, cc_articles))
-    dolma = map(lambda x: format_dolma(*x), meta_and_content)
-    to_dolma(dolma, args.output_dir, args.filename, args.shard_size)
+    logger = logs.get_logger("arxiv")
+    with utils.maybe_temp_dir(args.work_dir) as work_dir:
+        os.makedirs(work_dir, exist_ok=True)
+        partitions = partition_metadata(args.metadata, bulk_downloader, work_dir)
+        logger.info(f"Split the CC licensed articles into {len(partitions)} partitions")
+        convert = functools.partial(
+            convert_partition,
+            work_dir=work_dir,
+            dump_dir=args.dump_dir,
+            output_dir=args.output_dir,
+            filename=args.filename,
+            shard_size=args.shard_size,
+            manifest=args.manifest,
+            dry_run=args.dry_run,
+        )
+        with mp.Pool(args.processes) as pool:
+            results = pool.starmap(convert, sorted(partitions.items()), chunksize=1)
+    logger.info(f"Converted {sum(d for _, d in results)} documents")
 
 
 if __name__ == "__main__":
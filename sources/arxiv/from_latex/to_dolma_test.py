@@ -0,0 +1,38 @@
+"""Tests for splitting the arXiv metadata into per shard partitions."""
+
+import importlib.util
+import json
+import os
+
+# The script's name has a dash in it, so load it by path.
+_spec = importlib.util.spec_from_file_location(
+    "arxiv_to_dolma", os.path.join(os.path.dirname(__file__), "to-dolma.py")
+)
+to_dolma = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(to_dolma)
+
+LICENSE = "http://creativecommons.org/licenses/by/4.0/"
+
+
+class NoShards:
+    def find_shard(self, file_name):
+        return None
+
+
+def test_partition_metadata_rerun_does_not_duplicate(tmp_path):
+    metadata = tmp_path / "metadata.jsonl"
+    with open(metadata, "w") as wf:
+        for i in range(5):
+            wf.write(json.dumps({"id": f"math/92120{i}", "license": LICENSE}) + "\n")
+        wf.write(json.dumps({"id": "math/9212999", "license": "all rights"}) + "\n")
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+
+    for _ in range(2):
+        partitions = to_dolma.partition_metadata(
+            str(metadata), NoShards(), str(work_dir), buffer_size=2
+        )
+        assert partitions == {"unsharded": None}
+        with open(work_dir / "unsharded.jsonl") as f:
+            ids = [json.loads(line)["id"] for line in f]
+        assert ids == [f"math/92120{i}" for i in range(5)]
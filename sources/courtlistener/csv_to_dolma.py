@@ -4,14 +4,17 @@ Created by zhenlinx on 01/19/2024
 """
 import argparse
 import csv
+import itertools
 import logging
+import multiprocessing as mp
 import os
 import sys
 from datetime import datetime
+from typing import Dict, Iterator, List
 
 from common_pile.licenses import PermissiveLicenses
 from common_pile.logs import configure_logging
-from common_pile.write import to_dolma
+from common_pile.write import to_dolma_parallel
 
 SOURCE_NAME = "CourtListenerOpinion"
 
@@ -20,37 +23,54 @@ csv.field_size_limit(sys.maxsize)
 logger = configure_logging("court-listener-opinion")
 
 
-def make_record_generator(file_path):
-    with open(file_path, "r") as csvfile:
+# The columns `make_records` uses, the rest (i.e., every html version of the
+# opinion) are dropped before batches are queued for the workers.
+FIELDS = ("id", "plain_text", "data_created", "download_url")
+
+
+def read_batches(file_path: str, batch_size: int) -> Iterator[List[Dict]]:
+    """Read the csv in fixed size batches of rows, so the whole file is never in memory."""
+    with open(file_path, "r", newline="") as csvfile:
         # Create a CSV reader object
         reader = csv.DictReader(csvfile)
+        rows = ({k: row[k] for k in FIELDS} for row in reader)
+        while batch := list(itertools.islice(rows, batch_size)):
+            yield batch
+
 
-        # Yield a dictionary for each row
-        for row in reader:
-            # 'row' is a dictionary with column headers as keys
+def make_records(rows: List[Dict]) -> Iterator[Dict]:
+    # Yield a dictionary for each row
+    for row in rows:
+        # 'row' is a dictionary with column headers as keys
 
-            if not row["plain_text"]:
-                pass  # TODO load from row["download_url"] if not null
-            else:
-                yield {
-                    "id": row["id"],
-                    "text": row["plain_text"],
-                    "source": SOURCE_NAME,
-                    "added": datetime.utcnow().isoformat(),
-                    "created": row["data_created"],
-                    "metadata": {
-                        "license": str(PermissiveLicenses.PD),
-                        "url": row["download_url"],
-                    },
-                }
+        if not row["plain_text"]:
+            pass  # TODO load from row["download_url"] if not null
+        else:
+            yield {
+                "id": row["id"],
+                "text": row["plain_text"],
+                "source": SOURCE_NAME,
+                "added": datetime.utcnow().isoformat(),
+                "created": row["data_created"],
+                "metadata": {
+                    "license": str(PermissiveLicenses.PD),
+                    "url": row["download_url"],
+                },
+            }
 
 
 def main(args):
-    example_generator = make_record_generator(args.input_file)
     output_file_base_name = os.path.basename(args.input_file).replace(
         ".csv", ".jsonl.gz"
     )
-    to_dolma(example_generator, args.output_dir, output_file_base_name, args.shard_size)
+    # Each batch of rows is converted and written as its own shard by a worker.
+    to_dolma_parallel(
+        read_batches(args.input_file, args.batch_size),
+        make_records,
+        args.output_dir,
+        output_file_base_name,
+        processes=args.processes,
+    )
     logger.info(f"Saved {args.input_file} as dolma shared files at {args.output_dir}")
 
 
@@ -67,7 +87,16 @@ if __name__ == "__main__":
         help="The base filename stores data",
     )
     parser.add_argument(
-        "--shard_size", type=int, default=1, help="Size, in GB, for each shard."
+        "--batch_size",
+        type=int,
+        default=1_000,
+        help="The number of csv rows in each shard.",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=mp.cpu_count(),
+        help="Number of processes converting batches of rows.",
     )
     args = parser.parse_args()
     main(args)
@@ -1,15 +1,17 @@
 import argparse
 import csv
 import logging
+import multiprocessing as mp
 import os
 import re
 import sys
+from typing import Dict, List
 
 import pandas as pd
 
 from common_pile.licenses import PermissiveLicenses
 from common_pile.logs import configure_logging
-from common_pile.write import to_dolma
+from common_pile.write import to_dolma_parallel
 
 SOURCE_NAME = "CourtListenerOpinion"
 
@@ -18,8 +20,8 @@ csv.field_size_limit(sys.maxsize)
 logger = configure_logging("court-listener-opinion")
 
 
-def process_court_listener(file_path):
-    df = pd.read_csv(file_path)
+def process_court_listener(df: pd.DataFrame) -> List[Dict]:
+    """Convert a chunk of rows from the bulk opinion csv to dolma."""
 
     # add metadata column
     df["metadata"] = str(PermissiveLicenses.PD)
@@ -103,11 +105,18 @@ def process_court_listener(file_path):
 
 
 def main(args):
-    example = process_court_listener(args.input_file)
     output_file_base_name = os.path.basename(args.input_file).replace(
         ".csv", ".jsonl.gz"
     )
-    to_dolma(example, args.output_dir, output_file_base_name, args.shard_size)
+    # The csv is read in chunks, which workers convert and write as their own
+    # shards, so memory doesn't grow with the size of the dump.
+    to_dolma_parallel(
+        pd.read_csv(args.input_file, chunksize=args.shard_size),
+        process_court_listener,
+        args.output_dir,
+        output_file_base_name,
+        processes=args.processes,
+    )
     logger.info(f"Saved {args.input_file} as dolma shared files at {args.output_dir}")
 
 
@@ -120,8 +129,15 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         "--shard_size",
+        type=int,
         default=1000,
-        help="The number of documents to store in each shard.",
+        help="The number of csv rows (documents) to store in each shard.",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=mp.cpu_count(),
+        help="Number of processes converting chunks of the csv.",
     )
     parser.add_argument(
         "--input_file",
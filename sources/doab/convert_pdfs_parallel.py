@@ -1,4 +1,3 @@
-import atexit
 import os
 
 os.environ["GRPC_VERBOSITY"] = "ERROR"
@@ -13,47 +12,21 @@ import argparse
 import gc
 import glob
 import hashlib
-import math
-import traceback
-
-import magic
-import torch.multiprocessing as mp
-from marker.config.parser import ConfigParser
-from marker.config.printer import CustomClickPrinter
-from marker.logger import configure_logging
-from marker.models import create_model_dict
-from marker.output import output_exists, save_output
-from marker.settings import settings
-from tqdm import tqdm
-
-configure_logging()
 
+from scheduler import Job, Scheduler, is_pdf, mock_converter
+from tqdm import tqdm
 
-def is_pdf(filepath):
-    mime = magic.Magic(mime=True)
-    return mime.from_file(filepath) == "application/pdf"
 
+def marker_converter(model_dict=None, device=None):
+    """Make a function that converts a PDF to markdown with marker, this runs in each worker."""
+    from marker.config.parser import ConfigParser
+    from marker.models import create_model_dict
 
-def worker_init(model_dict):
     if model_dict is None:
-        model_dict = create_model_dict()
-
-    global model_refs
-    model_refs = model_dict
-
-    # Ensure we clean up the model references on exit
-    atexit.register(worker_exit)
-
-
-def worker_exit():
-    global model_refs
-    try:
-        del model_refs
-    except Exception:
-        pass
-
+        model_dict = (
+            create_model_dict() if device is None else create_model_dict(device=device)
+        )
 
-def process_single_pdf(fpath):
     config = {
         "output_format": "markdown",
         "disable_image_extraction": True,
@@ -66,27 +39,21 @@ def process_single_pdf(fpath):
     config_dict = config_parser.generate_config_dict()
     config_dict["disable_tqdm"] = True
 
-    try:
-        converter = converter_cls(
-            config=config_dict,
-            artifact_dict=model_refs,
-            processor_list=config_parser.get_processors(),
-            renderer=config_parser.get_renderer(),
-            llm_service=config_parser.get_llm_service(),
-        )
-        rendered = converter(fpath)
-        markdown = rendered.markdown
-
-        del rendered
-        del converter
-    except Exception as e:
-        print(f"Error converting {fpath}: {e}")
-        print(traceback.format_exc())
-        markdown = None
-    finally:
-        gc.collect()
+    def convert(fpath):
+        try:
+            converter = converter_cls(
+                config=config_dict,
+                artifact_dict=model_dict,
+                processor_list=config_parser.get_processors(),
+                renderer=config_parser.get_renderer(),
+                llm_service=config_parser.get_llm_service(),
+            )
+            rendered = converter(fpath)
+            return rendered.markdown
+        finally:
+            gc.collect()
 
-    return markdown, fpath
+    return convert
 
 
 def get_output_path(fpath, output_dir):
@@ -106,64 +73,79 @@ def get_slice(f, num_slices):
 def main(
     input_glob,
     output_dir,
-    slice_idx,
-    num_slices,
-    device="cuda:0",
+    slice_idx=0,
+    num_slices=1,
+    device="cpu",
     num_workers=5,
+    memory_budget=None,
+    max_worker_memory=None,
+    memory_per_page=50,
+    mock=False,
     **kwargs,
 ):
     os.makedirs(output_dir, exist_ok=True)
-    files_to_convert = filter(
-        lambda f: get_slice(os.path.basename(f), num_slices) == slice_idx
+    files_to_convert = [
+        f
+        for f in glob.glob(input_glob)
+        if get_slice(os.path.basename(f), num_slices) == slice_idx
+        and not output_exists(f, output_dir)
         and is_pdf(f)
-        and not output_exists(f, output_dir),
-        glob.glob(input_glob),
-    )
-
-    try:
-        mp.set_start_method("spawn")  # Required for CUDA, forkserver doesn't work
-    except RuntimeError:
-        raise RuntimeError(
-            "Set start method to spawn twice. This may be a temporary issue with the script. Please try running it again."
-        )
+    ]
+    # Books are converted largest first, so count their pages up front.
+    jobs = [Job.from_path(f) for f in tqdm(files_to_convert, desc="Counting pages")]
 
-    if settings.TORCH_DEVICE == "mps" or settings.TORCH_DEVICE_MODEL == "mps":
-        model_dict = None
+    if mock:
+        make_converter, converter_kwargs, context = mock_converter, {}, None
     else:
-        model_dict = create_model_dict(device=device)
-        for k, v in model_dict.items():
-            v.model.share_memory()
+        import torch.multiprocessing as mp
+        from marker.logger import configure_logging
+        from marker.models import create_model_dict
+        from marker.settings import settings
+
+        configure_logging()
+        context = mp.get_context("spawn")  # Required for CUDA, forkserver doesn't work
+        if settings.TORCH_DEVICE == "mps" or settings.TORCH_DEVICE_MODEL == "mps":
+            model_dict = None
+        else:
+            model_dict = create_model_dict(device=device)
+            for k, v in model_dict.items():
+                v.model.share_memory()
+        make_converter = marker_converter
+        converter_kwargs = {"model_dict": model_dict}
+
+    scheduler = Scheduler(
+        make_converter,
+        num_workers=num_workers,
+        memory_budget=memory_budget and int(memory_budget * 2**30),
+        max_worker_memory=max_worker_memory and int(max_worker_memory * 2**30),
+        memory_per_page=int(memory_per_page * 2**20),
+        max_tasks_per_worker=10,
+        converter_kwargs=converter_kwargs,
+        context=context,
+    )
 
     print(f"Converting with {num_workers} processes and saving to {output_dir}")
     total_bytes_written = 0
     num_errors = 0
-    with mp.Pool(
-        processes=num_workers,
-        initializer=worker_init,
-        initargs=(model_dict,),
-        maxtasksperchild=10,
-    ) as pool:
-        pbar = tqdm(desc="Processing PDFs", unit=" files")
-        for markdown, fpath in pool.imap_unordered(
-            process_single_pdf, files_to_convert
-        ):
-            if markdown is None:
-                pbar.update(1)
-                num_errors += 1
-                continue
-
-            total_bytes_written += len(markdown)
-            output_path = get_output_path(fpath, output_dir)
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            with open(output_path, "w", encoding="utf-8") as f:
-                f.write(markdown)
-            pbar.update(1)
-
-            pbar.set_postfix(
-                {"Errors": num_errors, "MB Written": f"{total_bytes_written/1e6:.3E}"}
-            )
+    pbar = tqdm(desc="Processing PDFs", unit=" files", total=len(jobs))
+    for job, markdown, error in scheduler.run(jobs):
+        pbar.update(1)
+        if markdown is None:
+            print(f"Error converting {job.path}: {error}")
+            num_errors += 1
+            continue
+
+        total_bytes_written += len(markdown)
+        output_path = get_output_path(job.path, output_dir)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(markdown)
+
+        pbar.set_postfix(
+            {"Errors": num_errors, "MB Written": f"{total_bytes_written/1e6:.3E}"}
+        )
 
-        pbar.close()
+    pbar.close()
 
 
 if __name__ == "__main__":
@@ -176,12 +158,39 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         "--device",
-        default="cuda:0",
+        default="cpu",
         help="Device to run the marker model on (e.g., 'cuda:0' or 'cpu')",
     )
     parser.add_argument("--num-workers", type=int, default=5)
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        help="GB of memory all workers can use, defaults to 80%% of the system memory.",
+    )
+    parser.add_argument(
+        "--max-worker-memory",
+        type=float,
+        help="GB of memory a worker can use before it is restarted.",
+    )
+    parser.add_argument(
+        "--memory-per-page",
+        type=float,
+        default=50,
+        help="MB of memory a book is expected to need per page, used to decide "
+        "which books can be converted at the same time.",
+    )
+    parser.add_argument(
+        "--mock",
+        action="store_true",
+        help="Use a mock converter instead of marker, to test the scheduling.",
+    )
     parser.add_argument("--slice-idx", type=int, default=0)
-    parser.add_argument("--num-slices", type=int, default=5)
+    parser.add_argument(
+        "--num-slices",
+        type=int,
+        default=1,
+        help="Split the books between multiple runs, i.e., on different machines.",
+    )
     args = parser.parse_args()
 
     main(
@@ -191,4 +200,8 @@ if __name__ == "__main__":
         args.num_slices,
         device=args.device,
         num_workers=args.num_workers,
+        memory_budget=args.memory_budget,
+        max_worker_memory=args.max_worker_memory,
+        memory_per_page=args.memory_per_page,
+        mock=args.mock,
     )
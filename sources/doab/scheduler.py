@@ -0,0 +1,319 @@
+"""Schedule PDF conversions across worker processes under a memory budget.
+
+Book PDFs vary from a few pages to thousands, so splitting the files between
+workers up front leaves some workers idle while others work through a few huge
+books, or run out of memory. Instead, idle workers pull the next job from a
+shared list that is sorted by page count (or size), so the biggest books start
+first and the small ones fill in around them.
+
+A job only starts if the memory used by the workers, plus an estimate for the
+job, fits in `memory_budget`. The memory of each worker is checked as it runs,
+workers that go over `max_worker_memory` (or the largest one, when the total is
+over budget) are killed and restarted, and their job is retried once with
+nothing else running. The converter is created in each worker by
+`make_converter`, `mock_converter` stands in for marker when testing.
+"""
+
+import dataclasses
+import multiprocessing as mp
+import os
+import re
+import time
+from multiprocessing.connection import wait
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from common_pile import logs
+
+# A rough size of a page, used to order (and estimate the memory of) PDFs whose
+# pages we can't count.
+BYTES_PER_PAGE = 100_000
+PAGE = re.compile(rb"/Type\s*/Page\b")
+
+
+def is_pdf(path: str) -> bool:
+    """Check for the PDF magic number, this is the same check libmagic does."""
+    with open(path, "rb") as f:
+        return f.read(5) == b"%PDF-"
+
+
+def count_page_objects(path: str) -> int:
+    """Count /Page objects, this misses pages in compressed object streams."""
+    with open(path, "rb") as f:
+        return len(PAGE.findall(f.read()))
+
+
+def count_pages(path: str) -> Optional[int]:
+    """The number of pages in a PDF, None if it can't be opened."""
+    try:
+        import pypdfium2
+
+        try:
+            with pypdfium2.PdfDocument(path) as pdf:
+                return len(pdf)
+        except pypdfium2.PdfiumError:
+            return None
+    except ImportError:
+        return count_page_objects(path) or None
+
+
+@dataclasses.dataclass
+class Job:
+    path: str
+    size: int
+    pages: Optional[int] = None
+    attempts: int = 0
+    # Set after the job used too much memory, so it is retried on its own.
+    alone: bool = False
+
+    @classmethod
+    def from_path(cls, path: str) -> "Job":
+        return cls(path, os.path.getsize(path), count_pages(path))
+
+    @property
+    def cost(self) -> float:
+        return self.pages if self.pages is not None else self.size / BYTES_PER_PAGE
+
+
+class Result(NamedTuple):
+    job: Job
+    text: Optional[str]
+    # "memory" if the job used too much memory, "crash" if the worker died,
+    # otherwise the exception raised by the converter.
+    error: Optional[str] = None
+
+
+def memory_usage(pid: int) -> int:
+    """The memory of a process in bytes, 0 if it can't be read.
+
+    This is the PSS, so memory shared between workers (i.e., the models) is
+    split between them instead of being counted for each. Only works on linux.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+
+def total_memory() -> int:
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+def _worker(conn, make_converter: Callable, converter_kwargs: Dict):
+    convert = make_converter(**converter_kwargs)
+    while True:
+        try:
+            path = conn.recv()
+        except EOFError:
+            break
+        if path is None:
+            break
+        try:
+            conn.send((convert(path), None))
+        except Exception as e:
+            conn.send((None, f"{type(e).__name__}: {e}"))
+
+
+class Worker:
+    def __init__(self, context, make_converter: Callable, converter_kwargs: Dict):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=_worker,
+            args=(child, make_converter, converter_kwargs),
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+        self.job = None
+        self.tasks = 0
+        # The memory of the worker when the current job started.
+        self.baseline = 0
+
+    def memory(self) -> int:
+        return memory_usage(self.process.pid)
+
+    def start(self, job: Job, memory: int):
+        self.job, self.baseline = job, memory
+        job.attempts += 1
+        try:
+            self.conn.send(job.path)
+        except (BrokenPipeError, OSError):
+            # The worker died, this is handled as a crash when we read the result.
+            pass
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def close(self, timeout: float = 5):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.kill()
+        self.conn.close()
+
+
+class Scheduler:
+    """Convert PDFs with `num_workers` processes, largest first, under a memory budget.
+
+    Args:
+      make_converter: Called (with `converter_kwargs`) in each worker to make
+        a function that converts the PDF at a path to text. Must be picklable.
+      num_workers: The number of worker processes.
+      memory_budget: Bytes of memory all workers can use together.
+      max_worker_memory: Bytes of memory a single worker can use.
+      memory_per_page: Bytes a conversion is expected to need per page, used
+        to decide if a job fits in the budget before it starts.
+      max_tasks_per_worker: Restart workers after this many jobs, in case the
+        converter leaks memory.
+      context: The multiprocessing context, i.e., from `torch.multiprocessing`.
+    """
+
+    def __init__(
+        self,
+        make_converter: Callable,
+        num_workers: int = 1,
+        memory_budget: Optional[int] = None,
+        max_worker_memory: Optional[int] = None,
+        memory_per_page: int = 50 * 2**20,
+        max_tasks_per_worker: Optional[int] = None,
+        max_retries: int = 1,
+        poll_interval: float = 1.0,
+        converter_kwargs: Optional[Dict] = None,
+        context=None,
+    ):
+        self.make_converter = make_converter
+        self.converter_kwargs = converter_kwargs or {}
+        self.num_workers = max(num_workers, 1)
+        self.memory_budget = memory_budget or int(0.8 * total_memory())
+        self.max_worker_memory = max_worker_memory
+        self.memory_per_page = memory_per_page
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.max_retries = max_retries
+        self.poll_interval = poll_interval
+        self.context = context or mp.get_context()
+        self.logger = logs.get_logger("doab")
+
+    def estimate_memory(self, job: Job) -> int:
+        return int(job.cost * self.memory_per_page)
+
+    def _start_worker(self) -> Worker:
+        return Worker(self.context, self.make_converter, self.converter_kwargs)
+
+    def _restart(self, workers: List[Worker], worker: Worker, kill: bool = False):
+        worker.kill() if kill else worker.close()
+        workers[workers.index(worker)] = self._start_worker()
+
+    def _admit(self, pending: List[Job], workers: List[Worker], usage: Dict):
+        """Start jobs on idle workers, largest first, while they fit in the budget."""
+        running = [w for w in workers if w.job is not None]
+        if any(w.job.alone for w in running):
+            return
+        idle = [w for w in workers if w.job is None]
+        # Running jobs are assumed to grow to their estimate.
+        committed = sum(
+            (
+                max(usage[w], w.baseline + self.estimate_memory(w.job))
+                if w.job is not None
+                else usage[w]
+            )
+            for w in workers
+        )
+        i = 0
+        while idle and i < len(pending):
+            job = pending[i]
+            if job.alone:
+                # Wait for everything else to finish.
+                if running:
+                    break
+            elif running and committed + self.estimate_memory(job) > self.memory_budget:
+                # Look for a smaller job that fits.
+                i += 1
+                continue
+            worker = idle.pop()
+            worker.start(pending.pop(i), usage[worker])
+            committed += self.estimate_memory(job)
+            running.append(worker)
+            if job.alone:
+                break
+
+    def _over_memory(self, workers: List[Worker], usage: Dict) -> List[Worker]:
+        running = [w for w in workers if w.job is not None]
+        over = [
+            w
+            for w in running
+            if self.max_worker_memory and usage[w] > self.max_worker_memory
+        ]
+        if running and not over and sum(usage.values()) > self.memory_budget:
+            over.append(max(running, key=lambda w: usage[w]))
+        return over
+
+    def run(self, jobs: Iterable[Job]) -> Iterator[Result]:
+        """Convert all the jobs, results are yielded as they finish."""
+        pending = sorted(jobs, key=lambda j: j.cost, reverse=True)
+        workers = [self._start_worker() for _ in range(self.num_workers)]
+        try:
+            while pending or any(w.job is not None for w in workers):
+                usage = {w: w.memory() for w in workers}
+                self._admit(pending, workers, usage)
+
+                busy = {w.conn: w for w in workers if w.job is not None}
+                for conn in wait(list(busy), timeout=self.poll_interval):
+                    worker = busy[conn]
+                    job, worker.job = worker.job, None
+                    try:
+                        text, error = conn.recv()
+                    except (EOFError, OSError):
+                        self.logger.error(f"Worker died converting {job.path}")
+                        self._restart(workers, worker, kill=True)
+                        yield Result(job, None, "crash")
+                        continue
+                    yield Result(job, text, error)
+                    worker.tasks += 1
+                    if (
+                        self.max_tasks_per_worker
+                        and worker.tasks >= self.max_tasks_per_worker
+                    ):
+                        self._restart(workers, worker)
+
+                usage = {w: w.memory() for w in workers}
+                for worker in self._over_memory(workers, usage):
+                    job = worker.job
+                    self.logger.warning(
+                        f"Worker used {usage[worker] / 2**30:.2f}GB converting "
+                        f"{job.path}, restarting it."
+                    )
+                    self._restart(workers, worker, kill=True)
+                    if job.attempts <= self.max_retries:
+                        job.alone = True
+                        pending.insert(0, job)
+                    else:
+                        yield Result(job, None, "memory")
+        finally:
+            for worker in workers:
+                worker.close() if worker.job is None else worker.kill()
+
+
+def mock_converter(memory_per_page: int = 0, seconds_per_page: float = 0.0):
+    """A stand in for marker that uses memory and time based on the page count."""
+
+    def convert(path: str) -> str:
+        pages = count_page_objects(path) or 1
+        # Write to the memory so it is actually used.
+        ballast = b"\x01" * (memory_per_page * pages)
+        time.sleep(seconds_per_page * pages)
+        del ballast
+        return f"Converted {os.path.basename(path)} ({pages} pages)"
+
+    return convert
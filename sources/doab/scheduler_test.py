@@ -0,0 +1,80 @@
+"""Tests for the PDF conversion scheduler, using the mock converter."""
+
+import os
+
+import pytest
+from scheduler import Job, Scheduler, count_pages, is_pdf, mock_converter
+
+MB = 2**20
+
+
+def make_pdf(path, pages):
+    path.write_bytes(b"%PDF-1.4\n" + b"<< /Type /Page >>\n" * pages + b"%%EOF\n")
+    return str(path)
+
+
+def crashing_converter():
+    def convert(path):
+        name = os.path.basename(path)
+        if name == "crash.pdf":
+            os._exit(1)
+        if name == "error.pdf":
+            raise ValueError("bad pdf")
+        return path
+
+    return convert
+
+
+def test_jobs(tmp_path):
+    pdf = make_pdf(tmp_path / "a.pdf", 3)
+    (tmp_path / "b.pdf").write_text("<html>Not a pdf</html>")
+    assert is_pdf(pdf)
+    assert not is_pdf(str(tmp_path / "b.pdf"))
+    job = Job.from_path(pdf)
+    assert job.size == os.path.getsize(pdf)
+    if job.pages is not None:
+        assert job.pages == count_pages(pdf)
+
+
+def test_largest_jobs_first(tmp_path):
+    pages = [1, 7, 3, 12, 5]
+    jobs = [Job(make_pdf(tmp_path / f"{p}.pdf", p), 0, p) for p in pages]
+    scheduler = Scheduler(mock_converter, num_workers=1, poll_interval=0.01)
+    results = list(scheduler.run(jobs))
+    assert [r.job.pages for r in results] == sorted(pages, reverse=True)
+    assert all(r.error is None for r in results)
+    assert results[0].text == "Converted 12.pdf (12 pages)"
+
+
+def test_errors_and_crashes(tmp_path):
+    jobs = [
+        Job(make_pdf(tmp_path / f"{name}.pdf", 1), 0, 1)
+        for name in ("ok", "crash", "error", "fine")
+    ]
+    scheduler = Scheduler(crashing_converter, num_workers=2, poll_interval=0.01)
+    results = {os.path.basename(r.job.path): r for r in scheduler.run(jobs)}
+    assert results["crash.pdf"].error == "crash"
+    assert results["error.pdf"].error == "ValueError: bad pdf"
+    assert results["ok.pdf"].text == results["ok.pdf"].job.path
+    assert results["fine.pdf"].text == results["fine.pdf"].job.path
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="Needs /proc.")
+def test_workers_over_memory_are_restarted(tmp_path):
+    jobs = [Job(make_pdf(tmp_path / "huge.pdf", 20), 0, 20)] + [
+        Job(make_pdf(tmp_path / f"{i}.pdf", 1), 0, 1) for i in range(4)
+    ]
+    scheduler = Scheduler(
+        mock_converter,
+        num_workers=2,
+        max_worker_memory=150 * MB,
+        memory_per_page=MB,
+        poll_interval=0.05,
+        converter_kwargs={"memory_per_page": 10 * MB, "seconds_per_page": 0.1},
+    )
+    results = list(scheduler.run(jobs))
+    errors = {os.path.basename(r.job.path): r.error for r in results}
+    assert errors.pop("huge.pdf") == "memory"
+    assert all(error is None for error in errors.values())
+    # It was retried on its own before giving up.
+    assert jobs[0].attempts == 2 and jobs[0].alone
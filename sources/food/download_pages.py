@@ -6,11 +6,8 @@ be skipped).
 """
 
 import argparse
-import functools
 import json
-import multiprocessing.dummy as mp
 import os
-import time
 
 from common_pile import logs, scrape
 
@@ -33,7 +30,7 @@ parser.add_argument(
     "--num_threads",
     type=int,
     default=64,
-    help="The number of threads to use when downloaded, mostly I/O bound so threads are ok.",
+    help="The number of requests that can be in flight at once.",
 )
 parser.add_argument(
     "--test_run",
@@ -42,30 +39,34 @@ parser.add_argument(
 )
 parser.add_argument(
     "--wait",
-    type=int,
+    type=float,
     default=2,
-    help="Time to wait between requests on a single thread.",
+    help="Seconds each of the --num_threads request slots waits between requests, "
+    "the site sees about num_threads / wait requests per second.",
+)
+parser.add_argument(
+    "--refresh",
+    action="store_true",
+    help="Re-request pages in the manifest and only save the ones that changed.",
+)
+parser.add_argument(
+    "--manifest",
+    help="Where the crawl manifest lives, defaults to ${output_dir}/manifest.jsonl",
 )
 
 
-def download_page(page_info, output_dir, overwrite: bool = True, wait: int = 0):
-    """Download the page and save it to disk, unless it is already there."""
+def save_page(response, pages, output_dir):
+    """Save a downloaded page to disk."""
     logger = logs.get_logger("food")
-    page_path = os.path.join(output_dir, page_info["filename"])
-
-    if not overwrite and os.path.exists(page_path):
-        logger.info(f"{page_path} already exists, not downloading {page_info['url']}")
+    if not response.changed:
+        logger.debug(f"{response.url} hasn't changed, not saving.")
         return
-    try:
-        logger.info(f"Downloading {page_info['url']}")
-        page = scrape.get_page(page_info["url"])
-        with open(page_path, "wb") as f:
-            f.write(page.content)
-    except Exception as err:
-        logger.error(f"Failed to fetch {page_info['url']}: {err}")
-    if wait:
-        # time.sleep releases the GIL so we can use it in threads.
-        time.sleep(wait)
+    if not response.ok:
+        logger.error(f"Failed to fetch {response.url}: {response.error}")
+        return
+    page_path = os.path.join(output_dir, pages[response.url]["filename"])
+    with open(page_path, "wb") as f:
+        f.write(response.content)
 
 
 def main(args):
@@ -85,20 +86,35 @@ def main(args):
         logger.info(f"Test Run, only downloading {args.test_run} pages.")
         page_index = page_index[: args.test_run]
 
-    # Download all the pages
-    # We don't process the results, just write them to disk, so we use map over
-    # imap to ensure it actually gets run.
-    # Downloading pages is mostly I/O bound so we use threads.
-    logger.info(f"Saving pages to {args.output_dir}")
-    with mp.Pool(args.num_threads) as pool:
-        _ = pool.map(
-            functools.partial(
-                download_page,
-                output_dir=args.output_dir,
-                overwrite=args.overwrite,
-                wait=args.wait,
-            ),
-            page_index,
+    manifest_path = args.manifest or os.path.join(args.output_dir, "manifest.jsonl")
+    with scrape.CrawlManifest(manifest_path) as manifest:
+        pages = {}
+        for page_info in page_index:
+            page_path = os.path.join(args.output_dir, page_info["filename"])
+            if not os.path.exists(page_path):
+                manifest.discard(page_info["url"])
+            # When refreshing, pages we have fetched before are requested again
+            # conditionally and only saved if they changed.
+            elif not args.overwrite and not (
+                args.refresh and page_info["url"] in manifest
+            ):
+                logger.info(
+                    f"{page_path} already exists, not downloading {page_info['url']}"
+                )
+                continue
+            pages[page_info["url"]] = page_info
+
+        # Download all the pages, the crawler spaces requests out so the site
+        # sees the same rate as `--num_threads` workers that each wait `--wait`
+        # seconds between requests.
+        logger.info(f"Requesting {len(pages)} pages for {args.output_dir}")
+        scrape.crawl(
+            pages,
+            lambda response: save_page(response, pages, args.output_dir),
+            concurrency=args.num_threads,
+            requests_per_second=args.num_threads / args.wait if args.wait else 1000,
+            burst=1,
+            manifest=manifest,
         )
 
 
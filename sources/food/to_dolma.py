@@ -7,7 +7,7 @@ import functools
 import json
 import os
 
-from common_pile import licenses, logs
+from common_pile import licenses, logs, scrape
 from common_pile.write import to_dolma
 
 SOURCE_NAME = "foodista"
@@ -42,6 +42,14 @@ parser.add_argument(
     type=lambda l: LICENSE_MAP[l],
     help="The license the site is distributed under.",
 )
+parser.add_argument(
+    "--manifest",
+    help="The crawl manifest, defaults to ${input_dir}/manifest.jsonl",
+)
+parser.add_argument(
+    "--changed_since",
+    help="Only convert pages that changed at or after this ISO timestamp according to the manifest.",
+)
 
 
 def format_page(
@@ -86,6 +94,16 @@ def main(args):
     with open(args.index_path) as f:
         page_index = [json.loads(l) for l in f]
 
+    if args.changed_since:
+        manifest = scrape.CrawlManifest(
+            args.manifest or os.path.join(args.input_dir, "manifest.jsonl")
+        )
+        changed = manifest.changed_since(args.changed_since)
+        page_index = [p for p in page_index if p["url"] in changed]
+        logs.get_logger("food").info(
+            f"{len(page_index)} pages changed since {args.changed_since}"
+        )
+
     os.makedirs(args.output_dir, exist_ok=True)
     today = datetime.datetime.utcnow()
 
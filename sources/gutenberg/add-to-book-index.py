@@ -6,8 +6,7 @@ import json
 import os
 import urllib.parse
 
-from rdflib import Graph
-from utils import file_type, parse_id
+from rdf import parse_rdf
 
 from common_pile import logs
 
@@ -25,32 +24,6 @@ parser.add_argument(
 parser.add_argument(
     "--index", default="data/books.json", help="Path to the book index we are updating."
 )
-parser.add_argument("--format", default="xml", help="The format of the rdf metadata.")
-
-QUERY = """
-SELECT DISTINCT ?id ?title ?file ?format ?lang
-WHERE {
-  ?p dcterms:language ?l .
-  ?l rdf:value ?lang .
-
-  ?p dcterms:hasFormat ?file .
-  ?file dcterms:format ?format_ .
-    FILTER (!regex(str(?file), ".zip$", "i")) .
-    FILTER (!regex(str(?file), "README", "i")) .
-
-  {?format_ rdf:value "text/plain"^^<http://purl.org/dc/terms/IMT> }
-  UNION
-  {?format_ rdf:value "text/plain; charset=utf-8"^^<http://purl.org/dc/terms/IMT> }
-  UNION
-  {?format_ rdf:value "text/plain; charset=us-ascii"^^<http://purl.org/dc/terms/IMT> }
-  UNION
-  {?format_ rdf:value "text/plain; charset=iso-8859-1"^^<http://purl.org/dc/terms/IMT> } .
-
-  ?format_ rdf:value ?format .
-  ?p dcterms:title ?title
-  BIND(?p as ?id)
-}
-"""
 
 
 def main(args):
@@ -58,14 +31,13 @@ def main(args):
     logger.info("Parsing metadata.")
     results = []
     for book in args.books:
-        g = Graph()
-        g.parse(
-            source=os.path.join(args.data, book, f"pg{book}.rdf"), format=args.format
+        # These books aren't marked as public domain, so don't filter on rights.
+        results.extend(
+            parse_rdf(
+                os.path.join(args.data, str(book), f"pg{book}.rdf"),
+                public_domain_only=False,
+            )
         )
-        results.extend(file_type(g.query(QUERY)))
-
-    results = map(lambda x: x.asdict(), results)
-    results = list(map(parse_id, results))
     logger.info(f"Built {len(results)} extra metadata entries.")
 
     logger.info("Adding new metadata to the index.")
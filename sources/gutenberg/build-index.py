@@ -2,16 +2,20 @@
 
 import argparse
 import glob
+import hashlib
+import io
 import json
+import multiprocessing as mp
 import os
-import urllib.parse
 
 import tqdm
-from rdflib import Graph
-from utils import file_type, parse_id
+from rdf import parse_rdf
 
 from common_pile import logs
 
+# Bump this when the parsing changes, so cached entries are rebuilt.
+CACHE_VERSION = 1
+
 # These books are not good data for Language Modeling, they are boilerplate
 # descriptions for data formats for recorded music and how PG books were
 # distributed on disk. We skip adding these to the index these.
@@ -24,69 +28,104 @@ parser.add_argument(
     default="data/cache/epub/**/*.rdf",
     help="Glob pattern that matches all metadata files.",
 )
-parser.add_argument("--format", default="xml", help="The format of the rdf metadata.")
 parser.add_argument(
     "--output", default="data/books.json", help="Path to save the book index to."
 )
 parser.add_argument(
     "--skip", default=SKIP, nargs="+", help="Known bad book ids to skip."
 )
+parser.add_argument(
+    "--cache",
+    default="data/books-cache.json",
+    help="Path to the entries parsed from each metadata file, only files that "
+    "have changed since the last run are parsed again.",
+)
+parser.add_argument(
+    "--processes",
+    type=int,
+    default=mp.cpu_count(),
+    help="Number of processes to parse metadata files with.",
+)
 
-# Add this line to the language part of the query to filter to English only.
-# ?l rdf:value "en"^^<http://purl.org/dc/terms/RFC4646> .
 
-# TODO Update query to prefer zip files for faster dl?
-QUERY = """
-SELECT DISTINCT ?id ?title ?file ?format ?lang
-WHERE {
-  ?p dcterms:rights ?rights .
-    FILTER regex(?rights, "^Public domain", "i") .
+def file_hash(data: bytes) -> str:
+    return hashlib.md5(data).hexdigest()
 
-  ?p dcterms:language ?l .
-  ?l rdf:value ?lang .
 
-  ?p dcterms:hasFormat ?file .
-  ?file dcterms:format ?format_ .
-    FILTER (!regex(str(?file), ".zip$", "i")) .
-    FILTER (!regex(str(?file), "README", "i")) .
+def index_file(path_and_hash):
+    """Parse a metadata file, unless its contents match the cached version."""
+    path, cached_hash = path_and_hash
+    stat = os.stat(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    entry = {"mtime": stat.st_mtime, "size": stat.st_size, "md5": file_hash(data)}
+    if entry["md5"] != cached_hash:
+        entry["books"] = parse_rdf(io.BytesIO(data))
+    return path, entry
 
-  {?format_ rdf:value "text/plain"^^<http://purl.org/dc/terms/IMT> }
-  UNION
-  {?format_ rdf:value "text/plain; charset=utf-8"^^<http://purl.org/dc/terms/IMT> }
-  UNION
-  {?format_ rdf:value "text/plain; charset=us-ascii"^^<http://purl.org/dc/terms/IMT> }
-  UNION
-  {?format_ rdf:value "text/plain; charset=iso-8859-1"^^<http://purl.org/dc/terms/IMT> } .
 
-  ?format_ rdf:value ?format .
-  ?p dcterms:title ?title
-  BIND(?p as ?id)
-}
-"""
+def load_cache(path):
+    if os.path.exists(path):
+        with open(path) as f:
+            cache = json.load(f)
+        if cache.get("version") == CACHE_VERSION:
+            return cache["files"]
+    return {}
 
 
-def main(args):
-    results = []
-    skip = set(args.skip)
+def save_cache(path, files):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.tmp", "w") as wf:
+        json.dump({"version": CACHE_VERSION, "files": files}, wf)
+    os.replace(f"{path}.tmp", path)
 
+
+def main(args):
     logger = logs.get_logger("gutenberg")
-    logger.info("Parsing metadata")
-    for i, filename in enumerate(tqdm.tqdm(glob.iglob(args.data))):
+    skip = set(map(str, args.skip))
+    cache = load_cache(args.cache)
+
+    filenames = sorted(glob.iglob(args.data))
+    # Files whose mtime and size haven't changed are used as is, the others
+    # are hashed (in the workers) and only re-parsed if their contents changed,
+    # i.e., re-extracting the catalog doesn't cause a full rebuild.
+    stale = []
+    for filename in filenames:
+        cached = cache.get(filename)
+        stat = os.stat(filename)
+        if cached and (cached["mtime"], cached["size"]) == (
+            stat.st_mtime,
+            stat.st_size,
+        ):
+            continue
+        stale.append((filename, cached["md5"] if cached else None))
+    logger.info(
+        f"Parsing metadata for {len(stale)} new or changed files, "
+        f"{len(filenames) - len(stale)} are cached."
+    )
+
+    files = {filename: cache[filename] for filename in filenames if filename in cache}
+    with mp.Pool(args.processes) as pool:
+        for filename, entry in tqdm.tqdm(
+            pool.imap_unordered(index_file, stale, chunksize=64), total=len(stale)
+        ):
+            if "books" not in entry:
+                entry["books"] = files[filename]["books"]
+            files[filename] = entry
+    save_cache(args.cache, files)
+
+    results = []
+    for filename in filenames:
         id = os.path.basename(os.path.dirname(filename))
         if id in skip:
             continue
-        g = Graph()
-        g.parse(source=filename, format=args.format)
-        results.extend(file_type(g.query(QUERY)))
+        results.extend(files[filename]["books"])
 
     logger.info(f"There are {len(results)} public-domain books.")
     logger.info(f"Writing index to {args.output}")
 
-    results = map(lambda x: x.asdict(), results)
-    results = map(parse_id, results)
-
     with open(args.output, "w") as wf:
-        json.dump(list(results), wf)
+        json.dump(results, wf)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,146 @@
+"""Check the streaming rdf parser against the SPARQL query it replaced."""
+
+import io
+import os
+import urllib.parse
+
+import pytest
+from rdf import parse_rdf
+from utils import FILE_ORDERING
+
+TEMPLATE = """<?xml version="1.0" encoding="utf-8"?>
+<rdf:RDF xml:base="http://www.gutenberg.org/"
+  xmlns:dcam="http://purl.org/dc/dcam/"
+  xmlns:dcterms="http://purl.org/dc/terms/"
+  xmlns:pgterms="http://www.gutenberg.org/2009/pgterms/"
+  xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+  xmlns:cc="http://web.resource.org/cc/">
+  <pgterms:ebook rdf:about="ebooks/{id}">
+    <dcterms:title>{title}</dcterms:title>
+    <dcterms:rights>{rights}</dcterms:rights>
+    <dcterms:language>
+      <rdf:Description rdf:nodeID="Nlang">
+        <rdf:value rdf:datatype="http://purl.org/dc/terms/RFC4646">en</rdf:value>
+      </rdf:Description>
+    </dcterms:language>
+    {files}
+  </pgterms:ebook>
+  <cc:Work rdf:about="">
+    <cc:license rdf:resource="https://creativecommons.org/publicdomain/zero/1.0/"/>
+  </cc:Work>
+</rdf:RDF>
+"""
+
+FILE = """<dcterms:hasFormat>
+      <pgterms:file rdf:about="{url}">
+        <dcterms:format>
+          <rdf:Description rdf:nodeID="N{i}">
+            <dcam:memberOf rdf:resource="http://purl.org/dc/terms/IMT"/>
+            <rdf:value rdf:datatype="http://purl.org/dc/terms/IMT">{format}</rdf:value>
+          </rdf:Description>
+        </dcterms:format>
+        <dcterms:isFormatOf rdf:resource="ebooks/{id}"/>
+      </pgterms:file>
+    </dcterms:hasFormat>"""
+
+QUERY = """
+SELECT DISTINCT ?id ?title ?file ?format ?lang
+WHERE {
+  ?p dcterms:rights ?rights .
+    FILTER regex(?rights, "^Public domain", "i") .
+
+  ?p dcterms:language ?l .
+  ?l rdf:value ?lang .
+
+  ?p dcterms:hasFormat ?file .
+  ?file dcterms:format ?format_ .
+    FILTER (!regex(str(?file), ".zip$", "i")) .
+    FILTER (!regex(str(?file), "README", "i")) .
+
+  {?format_ rdf:value "text/plain"^^<http://purl.org/dc/terms/IMT> }
+  UNION
+  {?format_ rdf:value "text/plain; charset=utf-8"^^<http://purl.org/dc/terms/IMT> }
+  UNION
+  {?format_ rdf:value "text/plain; charset=us-ascii"^^<http://purl.org/dc/terms/IMT> }
+  UNION
+  {?format_ rdf:value "text/plain; charset=iso-8859-1"^^<http://purl.org/dc/terms/IMT> } .
+
+  ?format_ rdf:value ?format .
+  ?p dcterms:title ?title
+  BIND(?p as ?id)
+}
+"""
+
+
+def make_rdf(id, rights, files, title="A Book &amp; Its Title"):
+    files = "\n    ".join(
+        FILE.format(url=url, format=format, i=i, id=id)
+        for i, (url, format) in enumerate(files)
+    )
+    return TEMPLATE.format(id=id, title=title, rights=rights, files=files)
+
+
+BOOKS = {
+    "utf8": make_rdf(
+        1342,
+        "Public domain in the USA.",
+        [
+            ("https://www.gutenberg.org/ebooks/1342.html.images", "text/html"),
+            (
+                "https://www.gutenberg.org/ebooks/1342.txt.utf-8",
+                "text/plain; charset=us-ascii",
+            ),
+            (
+                "https://www.gutenberg.org/files/1342/1342-0.txt",
+                "text/plain; charset=utf-8",
+            ),
+            ("https://www.gutenberg.org/files/1342/1342-0.zip", "text/plain"),
+            ("https://www.gutenberg.org/files/1342/README.txt", "text/plain"),
+        ],
+    ),
+    "relative": make_rdf(
+        11, "public domain in the USA.", [("files/11/11.txt", "text/plain")]
+    ),
+    "copyrighted": make_rdf(378, "Copyrighted.", [("files/378/378.txt", "text/plain")]),
+    "no_text": make_rdf(
+        99, "Public domain in the USA.", [("files/99/99.epub", "application/epub+zip")]
+    ),
+}
+
+
+def sparql(rdf):
+    rdflib = pytest.importorskip("rdflib")
+    g = rdflib.Graph()
+    g.parse(data=rdf, format="xml")
+    results = sorted(g.query(QUERY), key=lambda x: FILE_ORDERING[str(x["format"])])
+    return [
+        {
+            k: str(v) if k != "id" else os.path.basename(urllib.parse.urlparse(v).path)
+            for k, v in r.asdict().items()
+        }
+        for r in results[0:1]
+    ]
+
+
+@pytest.mark.parametrize("rdf", BOOKS.values(), ids=BOOKS.keys())
+def test_parse_rdf_matches_sparql(rdf):
+    assert parse_rdf(io.BytesIO(rdf.encode("utf-8"))) == sparql(rdf)
+
+
+def test_parse_rdf():
+    [book] = parse_rdf(io.BytesIO(BOOKS["utf8"].encode("utf-8")))
+    assert book == {
+        "id": "1342",
+        "title": "A Book & Its Title",
+        "file": "https://www.gutenberg.org/files/1342/1342-0.txt",
+        "format": "text/plain; charset=utf-8",
+        "lang": "en",
+    }
+
+
+def test_parse_rdf_without_rights_filter(tmp_path):
+    path = tmp_path / "pg378.rdf"
+    path.write_text(BOOKS["copyrighted"])
+    assert parse_rdf(str(path)) == []
+    [book] = parse_rdf(str(path), public_domain_only=False)
+    assert book["file"] == "http://www.gutenberg.org/files/378/378.txt"
@@ -8,8 +8,6 @@ import click
 import pandas as pd
 import requests
 from furl import furl
-from pyrate_limiter import Duration, Limiter, RequestRate
-from requests_ratelimiter import LimiterSession
 from tenacity import (
     RetryError,
     Retrying,
@@ -19,7 +17,7 @@ from tenacity import (
 )
 from tqdm import tqdm
 
-from common_pile import logs
+from common_pile import logs, scrape
 from common_pile.licenses import PermissiveLicenses
 from common_pile.write import to_dolma
 
@@ -42,11 +40,11 @@ class LocBooksDownloader:
         metadata_path = Path(metadata_exports_path) / f"{snapshot}.csv"
         self.metadata_file = metadata_path.absolute()
 
-        self.concurrent_rate = RequestRate(10, Duration.SECOND)
-        self.burst_rate = RequestRate(80, Duration.SECOND * 10)
-        self.crawl_rate = RequestRate(400, Duration.MINUTE)
-        self.limiter = Limiter(self.concurrent_rate, self.burst_rate, self.crawl_rate)
-        self.session = LimiterSession(limiter=self.limiter)
+        # At most 400 requests a minute, in bursts of at most 10, shared by the
+        # download threads, which all back off if loc.gov rate limits us. The
+        # burst counts towards the minute, so the steady rate is 390 a minute.
+        self.limiter = scrape.RateLimiter(390 / 60, capacity=10)
+        self.session = scrape.RateLimitedSession(self.limiter)
 
         self.progress_bar = tqdm(total=0, position=0, delay=1, desc="Downloading books")
 
@@ -8,12 +8,10 @@ import pandas as pd
 import requests
 from dateutil.parser import parse
 from furl import furl
-from pyrate_limiter import Duration, Limiter, RequestRate
-from requests_ratelimiter import LimiterSession
 from titlecase import titlecase
 from tqdm import tqdm
 
-from common_pile import logs
+from common_pile import logs, scrape
 
 data_path = Path(__file__).resolve().parent / "data"
 metadata_downloads_path = data_path / "downloads/metadata"
@@ -33,10 +31,12 @@ class LocBooksMetadataDownloader:
         self.snapshot = snapshot
         self.download_path = metadata_downloads_path / snapshot
 
-        self.burst_rate = RequestRate(10, Duration.SECOND * 10)
-        self.crawl_rate = RequestRate(60, Duration.MINUTE)
-        self.limiter = Limiter(self.burst_rate, self.crawl_rate)
-        self.session = LimiterSession(limiter=self.limiter)
+        # At most 10 requests per 10 seconds and 60 a minute, shared by the
+        # download threads, which all back off if loc.gov rate limits us. A
+        # token bucket allows `capacity + rate * t` requests in any `t` seconds,
+        # so there is no saved up burst on top of the steady rate.
+        self.limiter = scrape.RateLimiter(59 / 60, capacity=1)
+        self.session = scrape.RateLimitedSession(self.limiter)
 
         self.date_facets = []
         self.items_per_page = 100
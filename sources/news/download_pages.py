@@ -1,12 +1,10 @@
 """Download all the files from a site."""
 
 import argparse
-import functools
 import json
-import multiprocessing.dummy as mp
 import os
 import random
-import time
+from typing import Optional
 
 import utils
 
@@ -31,7 +29,7 @@ parser.add_argument(
     "--num_workers",
     type=int,
     default=32,
-    help="Number of workers",
+    help="Number of requests that can be in flight at once.",
 )
 parser.add_argument(
     "--test_run",
@@ -40,44 +38,61 @@ parser.add_argument(
 )
 parser.add_argument(
     "--wait",
-    type=int,
-    default=1,
-    help="Time to wait between requests.",
+    type=float,
+    default=0.05,
+    help="Time to wait between requests to the same site.",
+)
+parser.add_argument(
+    "--refresh",
+    action="store_true",
+    help="Re-request pages in the manifest and only save the ones that changed.",
+)
+parser.add_argument(
+    "--manifest",
+    help="Where the crawl manifest lives, defaults to ${output_dir}/manifest.jsonl",
 )
 parser.add_argument(
     "--dry_run", action="store_true", help="Don't actually download anything."
 )
 
 
-def get_pages(
-    page_index, output_dir, overwrite: bool = True, wait: int = 0, dry_run: bool = False
+def pages_to_download(
+    page_index,
+    output_dir,
+    overwrite: bool = True,
+    manifest: Optional[scrape.CrawlManifest] = None,
+    refresh: bool = False,
 ):
-    idx = page_index["idx"]
-    url = page_index["url"]
-    filename = page_index["filename"]
+    """Filter the index down to the pages we actually need to request.
 
-    page_file_path = os.path.join(output_dir, filename)
+    When `refresh` is set, pages that are already downloaded are requested
+    again if they are in the `manifest`, the crawler makes these conditional
+    requests so only pages that changed are downloaded.
+    """
     logger = logs.get_logger("news")
-
-    if not utils.filter_url(url):
-        return
-
-    if not overwrite and os.path.exists(page_file_path):
-        logger.info(f"{page_file_path} already exists, not downloading.")
+    for page in page_index:
+        page_file_path = os.path.join(output_dir, page["filename"])
+        if not utils.filter_url(page["url"]):
+            continue
+        if not os.path.exists(page_file_path):
+            if manifest is not None:
+                manifest.discard(page["url"])
+        elif not overwrite and not (refresh and page["url"] in manifest):
+            logger.info(f"{page_file_path} already exists, not downloading.")
+            continue
+        yield page
+
+
+def save_page(response, pages, output_dir):
+    logger = logs.get_logger("news")
+    if not response.changed:
+        logger.debug(f"{response.url} hasn't changed, not saving.")
         return
-
-    if dry_run:
-        logger.info(f"Not downloading {url} as --dry_run was set.")
+    if not response.ok:
+        logger.error(f"Failed to fetch {response.url}: {response.error}")
         return
-    try:
-        logger.info(f"Downloading {url}")
-        page = scrape.get_page(url)
-        with open(page_file_path, "wb") as fp:
-            fp.write(page.content)
-    except Exception as err:
-        logger.error(f"Failed to fetch {url}")
-    if wait:
-        time.sleep(wait)
+    with open(os.path.join(output_dir, pages[response.url]["filename"]), "wb") as fp:
+        fp.write(response.content)
 
 
 def main(args):
@@ -103,20 +118,28 @@ def main(args):
         random.shuffle(page_index)
         page_index = page_index[: args.test_run]
 
-    # Download all pages
-    # We don't process the results, they are just written to disk, so we
-    # use map to make sure it actually gets run.
-    logger.info(f"Saving pages to {args.output_dir}")
-    with mp.Pool(args.num_workers) as p:
-        _ = p.map(
-            functools.partial(
-                get_pages,
-                output_dir=args.output_dir,
-                overwrite=args.overwrite,
-                wait=args.wait,
-                dry_run=args.dry_run,
-            ),
-            page_index,
+    manifest_path = args.manifest or os.path.join(args.output_dir, "manifest.jsonl")
+    with scrape.CrawlManifest(manifest_path) as manifest:
+        pages = {
+            page["url"]: page
+            for page in pages_to_download(
+                page_index, args.output_dir, args.overwrite, manifest, args.refresh
+            )
+        }
+        if args.dry_run:
+            for url in pages:
+                logger.info(f"Not downloading {url} as --dry_run was set.")
+            return
+
+        # Download all pages, writing each one to disk as soon as it arrives.
+        logger.info(f"Requesting {len(pages)} pages for {args.output_dir}")
+        scrape.crawl(
+            pages,
+            lambda response: save_page(response, pages, args.output_dir),
+            concurrency=args.num_workers,
+            requests_per_second=1 / args.wait if args.wait else 1000,
+            connections_per_host=args.num_workers,
+            manifest=manifest,
         )
 
 
@@ -10,7 +10,7 @@ from datetime import datetime
 import utils
 from charset_normalizer import from_bytes
 
-from common_pile import licenses, logs
+from common_pile import licenses, logs, scrape
 from common_pile.write import to_dolma
 
 parser = argparse.ArgumentParser(description="Parse pages downloaded from a News Sites")
@@ -38,6 +38,14 @@ parser.add_argument(
     "--tag", type=str, default="div", help="Tag for the article or content"
 )
 parser.add_argument("--attrs", type=json.loads, default=None, help="dict of attributes")
+parser.add_argument(
+    "--manifest",
+    help="The crawl manifest, defaults to ${input_dir}/manifest.jsonl",
+)
+parser.add_argument(
+    "--changed_since",
+    help="Only parse pages that changed at or after this ISO timestamp according to the manifest.",
+)
 parser.add_argument(
     "--num_workers",
     default=mp.cpu_count(),
@@ -108,6 +116,14 @@ def main(args):
         logger.error(f"{args.index_path} is empty.")
         raise ValueError(f"{args.index_path} is empty.")
 
+    if args.changed_since:
+        manifest = scrape.CrawlManifest(
+            args.manifest or os.path.join(args.input_dir, "manifest.jsonl")
+        )
+        changed = manifest.changed_since(args.changed_since)
+        page_index = [p for p in page_index if p["url"] in changed]
+        logger.info(f"{len(page_index)} pages changed since {args.changed_since}")
+
     os.makedirs(args.output_dir, exist_ok=True)
     today = datetime.utcnow()
 
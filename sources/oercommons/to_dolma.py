@@ -1,20 +1,16 @@
 import argparse
-import csv
 import datetime
 import glob
 import json
 import logging
+import multiprocessing as mp
 import os
-import sys
 
 import trafilatura
-from bs4 import BeautifulSoup
 
+from common_pile.csv_ranges import csv_to_dolma
+from common_pile.html import parse as parse_html
 from common_pile.licenses import PermissiveLicenses
-from common_pile.write import to_dolma
-
-csv.field_size_limit(sys.maxsize)
-
 
 logging.basicConfig(
     level=logging.INFO,
@@ -36,52 +32,64 @@ parser.add_argument(
     help="The base filename for the BHL data",
 )
 parser.add_argument(
-    "--shard_size", type=int, default=1, help="Size, in GB, for each shard."
+    "--chunk_size",
+    type=int,
+    default=256,
+    help="Size, in MB, of the csv each worker converts into a shard.",
+)
+parser.add_argument(
+    "--processes",
+    type=int,
+    default=mp.cpu_count(),
+    help="Number of processes to extract text with.",
 )
 
 
-def get_records():
-    with open("oercommons_content.csv", "r") as f:
-        reader = csv.reader(f)
-        header = next(reader)
-        for row in reader:
-            title, search_result_link, content_link, content_html, metadata_html = row
-            metadata = {}
-            metadata_soup = BeautifulSoup(metadata_html, "html.parser")
-            for dt, dd in zip(
-                metadata_soup.find_all("dt"), metadata_soup.find_all("dd")
-            ):
-                key = dt.get_text(strip=True).rstrip(":")
-                value = dd.get_text(strip=True)
-                if key in ["Subject", "Material Type", "Author", "Date Added"]:
-                    metadata[key] = value
-
-            license = LICENSE_MAP[metadata_soup.find_all("span")[0].get_text().strip()]
-            text = trafilatura.extract(content_html)
-            if text:
-                text_lines = text.split("\n")
-                while len(text_lines) > 0 and text_lines[0].startswith("- "):
-                    text_lines.pop(0)
-                text = "\n".join(text_lines)
-
-                yield {
-                    "id": content_link,
-                    "text": text,
-                    "source": SOURCE_NAME,
-                    "added": datetime.datetime.utcnow().isoformat(),
-                    "created": metadata.get("Date Added"),
-                    "metadata": {
-                        "license": str(license),
-                        "url": content_link,
-                        "title": title,
-                        "author": metadata.get("Author"),
-                    },
-                }
+def get_record(row):
+    title, search_result_link, content_link, content_html, metadata_html = row
+    metadata = {}
+    metadata_soup = parse_html(metadata_html)
+    for dt, dd in zip(metadata_soup.find_all("dt"), metadata_soup.find_all("dd")):
+        key = dt.get_text(strip=True).rstrip(":")
+        value = dd.get_text(strip=True)
+        if key in ["Subject", "Material Type", "Author", "Date Added"]:
+            metadata[key] = value
+
+    license = LICENSE_MAP[metadata_soup.find_all("span")[0].get_text().strip()]
+    text = trafilatura.extract(content_html)
+    if not text:
+        return None
+    text_lines = text.split("\n")
+    while len(text_lines) > 0 and text_lines[0].startswith("- "):
+        text_lines.pop(0)
+    text = "\n".join(text_lines)
+
+    return {
+        "id": content_link,
+        "text": text,
+        "source": SOURCE_NAME,
+        "added": datetime.datetime.utcnow().isoformat(),
+        "created": metadata.get("Date Added"),
+        "metadata": {
+            "license": str(license),
+            "url": content_link,
+            "title": title,
+            "author": metadata.get("Author"),
+        },
+    }
 
 
 def main(args):
-    # Use iterators so we don't have to load the whole dataset in memory.
-    to_dolma(get_records(), "./data/oercommons", args.filename, args.shard_size)
+    # Each worker reads its own byte range of the csv, so we don't have to
+    # load the whole dataset in memory.
+    csv_to_dolma(
+        "oercommons_content.csv",
+        get_record,
+        "./data/oercommons",
+        args.filename,
+        chunk_size=args.chunk_size * 1000 * 1000,
+        processes=args.processes,
+    )
 
 
 if __name__ == "__main__":
@@ -5,9 +5,8 @@ import multiprocessing as mp
 import re
 from datetime import datetime
 
-import pypandoc
-
 from common_pile import logs, utils
+from common_pile.pandoc import get_pool, pandoc_version
 from common_pile.write import ShardParallelProcessor
 
 parser = argparse.ArgumentParser(description="Preprocess raw peps in the dolma format.")
@@ -68,7 +67,8 @@ def process_pep(text):
 
 
 def clean_rst(text):
-    return pypandoc.convert_text(text, "plain", format="rst").strip()
+    # A long lived pandoc worker, instead of starting pandoc for each PEP.
+    return get_pool().convert(text, "plain", "rst").strip()
 
 
 class PEPParallel(ShardParallelProcessor):
@@ -88,7 +88,7 @@ class PEPParallel(ShardParallelProcessor):
             example["metadata"]["authors"] = parse_authors(authors)
 
             # Update this if the implementation of clean_rst changes.
-            example["metadata"]["pandoc_version"] = pypandoc.get_pandoc_version()
+            example["metadata"]["pandoc_version"] = pandoc_version()
 
             pep = process_pep(pep)
             example["text"] = clean_rst(pep)
@@ -13,7 +13,6 @@ import time
 from urllib.parse import urljoin
 
 import requests
-from bs4 import BeautifulSoup
 from utils import (
     BASE_URL,
     SOURCE_NAME,
@@ -26,6 +25,7 @@ from utils import (
 )
 
 from common_pile import logs
+from common_pile.html import parse as parse_html
 from common_pile.licenses import PermissiveLicenses
 from common_pile.utils import removeprefix
 from common_pile.write import to_dolma
@@ -88,7 +88,7 @@ def generate_example_links(starting_url, example_regex, pagination_regex):
         logger.info(f"Scraping {page} to find links to examples.")
         html = get_content(page)
         if html:
-            links = get_outbound_links(BeautifulSoup(html, "html.parser"), page)
+            links = get_outbound_links(parse_html(html), page)
 
             essay_links = [link for link in links if example_regex.match(link)]
             for link in essay_links:
@@ -108,7 +108,9 @@ def generate_example_links(starting_url, example_regex, pagination_regex):
 
 
 def parse_collection_html(html):
-    document = BeautifulSoup(html, "html.parser")
+    # The bs4 backend is used for text so whitespace matches earlier versions
+    # of the dataset, lxml is only used to find links while crawling.
+    document = parse_html(html, backend="bs4")
 
     header = get_elements(document, "div", "collection-header")[0]
     title = get_elements_text(header, "h1", None)[0]
@@ -142,7 +144,9 @@ def parse_collection_html(html):
 
 
 def parse_essay_html(html):
-    document = BeautifulSoup(html, "html.parser")
+    # The bs4 backend is used for text so whitespace matches earlier versions
+    # of the dataset, lxml is only used to find links while crawling.
+    document = parse_html(html, backend="bs4")
     essay = get_elements(document, "div", "essay-view")[0]
 
     title = get_elements_text(essay, "span", "title")[0]
@@ -2,10 +2,8 @@
 
 import datetime
 import logging
-from urllib.parse import urljoin
 
 import requests
-from bs4 import BeautifulSoup
 
 from common_pile import logs
 from common_pile.scrape import get_page
@@ -18,15 +16,11 @@ def get_outbound_links(soup, url: str = ""):
     """Find all links in a webpage.
 
     Args:
-      soup: The parsed webpage.
+      soup: The parsed webpage, from `common_pile.html.parse`.
       url: A base url, if a link is an absolute link, urljoin will return just
         that link, if it is relative, it will be added to this base url.
     """
-    links = soup.find_all("a")
-    outbound_links = [
-        urljoin(url, link.get("href")) for link in links if link.get("href")
-    ]
-    return set(outbound_links)
+    return soup.links(url)
 
 
 def get_content(url):
@@ -1,24 +1,31 @@
 import argparse
 import functools
-import json
+import io
+import itertools
 import multiprocessing as mp
 import os
-import re
-import shutil
-import subprocess
 import tarfile
-import traceback
 import xml.etree.ElementTree as ET
+from typing import Dict, Iterator, List, Optional
 
 from tqdm import tqdm
 
 from common_pile import logs
+from common_pile.pandoc import get_pool
 from common_pile.scrape import get_page
+from common_pile.write import to_dolma
 
 parser = argparse.ArgumentParser(description="Convert xml documents to markdown.")
 parser.add_argument("--filelist", help="The path to the filelist.txt file.")
 parser.add_argument(
-    "--output_dir", default="data/md/", help="Where the markdown files go."
+    "--output_dir",
+    default="data/records/",
+    help="Where the converted articles, with their metadata, go.",
+)
+parser.add_argument(
+    "--filename",
+    default="pubmedcentral.jsonl.gz",
+    help="The base filename for the converted article shards.",
 )
 parser.add_argument(
     "--total_docs",
@@ -27,7 +34,10 @@ parser.add_argument(
     help="Total number of documents to convert, for debugging.",
 )
 parser.add_argument(
-    "--metadata_dir", default="data/metadata/", help="Where the metadata files go."
+    "--batch_size",
+    default=64,
+    type=int,
+    help="Number of articles each process downloads and converts at a time.",
 )
 parser.add_argument(
     "--processes",
@@ -114,12 +124,12 @@ def get_date_from_tree(tree):
     return date_created
 
 
-def get_authors_and_date(nxml_file: str, pmcid: str):
+def get_authors_and_date(nxml: bytes, pmcid: str):
     # get authors from nxml file
     authors = []
     date_created = None
 
-    tree = ET.parse(nxml_file)
+    tree = ET.fromstring(nxml)
 
     # search for author tags
     for author in tree.findall(".//contrib[@contrib-type='author']"):
@@ -143,125 +153,103 @@ def get_authors_and_date(nxml_file: str, pmcid: str):
     return authors, date_created
 
 
-def download(f_url: str, output_dir: str):
-    # download file from f_url to output_dir
+def download(f_url: str) -> Optional[bytes]:
+    # download the tarball from f_url, it is kept in memory
     try:
-        # get the tarball
-        r = get_page(f_url)
-
-        # write tarball to disk
-        with open(os.path.join(output_dir, f_url.split("/")[-1]), "wb") as fh:
-            fh.write(r.content)
+        return get_page(f_url).content
     except:
         logger = logs.get_logger("pubmedcentral")
-        logger.error(f"Error downloading {f_url}")
-        logger.error(traceback.print_exc())
+        logger.exception(f"Error downloading {f_url}")
+        return None
 
 
-def extract_and_convert_tarball(t: str, output_dir: str):
-    if not os.path.exists(t):
-        return
-    try:
-        with tarfile.open(t) as tar:
-            nxml = [f for f in tar.getnames() if f.endswith(".nxml")]
-
-            # make sure there's only one nxml file
-            if len(nxml) > 1:
-                # haven't seen an example with more than one nxml file, but just in case
-                error_message = f"More than one nxml file in {t}"
-                logger = logs.get_logger("pubmedcentral")
-                logger.error(error_message)
-                raise ValueError(error_message)
-            nxml = nxml[0]
-
-            # extract nxml file
-            tar.extract(nxml)
-
-        # get pmcid
-        pmcid = nxml.split("/")[0]
-
-        # get metadata from nxml file
-        authors, date_created = get_authors_and_date(nxml, pmcid)
-        metadata = {"authors": authors, "created": date_created}
-        # write to file
-        with open(
-            f"{os.path.join(args.metadata_dir, pmcid)}.json", "w", encoding="utf-8"
-        ) as f:
-            json.dump(metadata, f, ensure_ascii=False)
-
-        # convert nxml to markdown
-        # pandoc options:
-        #   --quiet is to suppress messages
-        #   --from jats specifies the input format as Journal Article Tag Suite (https://jats.nlm.nih.gov/)
-        #   -o is the output file
-        #   --wrap=none is to prevent pandoc from wrapping lines
-        options = [
-            "pandoc",
-            "--quiet",
-            "--from",
-            "jats",
-            nxml,
-            "-o",
-            f"{pmcid}.md",
-            "--wrap=none",
-        ]
-        subprocess.run(options)
-
-        # remove extracted files
-        os.rename(f"{pmcid}.md", f"{output_dir}/{pmcid}.md")
-        shutil.rmtree(nxml.split("/")[0], ignore_errors=True)
+def read_nxml(tarball: bytes, name: str) -> bytes:
+    """Read the article's nxml file out of the tarball without extracting anything."""
+    with tarfile.open(fileobj=io.BytesIO(tarball)) as tar:
+        nxml = [m for m in tar.getmembers() if m.name.endswith(".nxml")]
 
-    except:
-        logger = logs.get_logger("pubmedcentral")
-        logger.error(f"Error extracting {t}")
-        logger.error(traceback.print_exc())
+        # make sure there's only one nxml file
+        if len(nxml) != 1:
+            # haven't seen an example with more than one nxml file, but just in case
+            raise ValueError(f"Found {len(nxml)} nxml files in {name}")
+        return tar.extractfile(nxml[0]).read()
 
 
 def download_and_convert(
-    line: str, output_dir: str, base_url="https://ftp.ncbi.nlm.nih.gov/pub/pmc/"
-):
-    # split line into parts
-    partial_path = line.split("\t")[0]
-
-    # create paths for the url and the destination of the markdown file
-    f_url = os.path.join(base_url, partial_path)
-    f_dest = os.path.join(output_dir, partial_path.split("/")[-1])
-
-    try:
-        download(f_url, output_dir)
-        extract_and_convert_tarball(f_dest, output_dir)
-
-        # delete the tarball
-        os.remove(f_dest)
-
-    except Exception as e:
-        logger = logs.get_logger("pubmedcentral")
-        logger.error(e)
+    lines: List[str], base_url="https://ftp.ncbi.nlm.nih.gov/pub/pmc/"
+) -> List[Dict]:
+    """Download and convert a batch of articles, returning a record for each.
+
+    Everything happens in memory, the nxml is sent straight to pandoc and
+    the metadata goes into the returned records, so there are no per-article
+    files.
+    """
+    logger = logs.get_logger("pubmedcentral")
+    articles = []
+    for line in lines:
+        # split line into parts
+        partial_path, journal, accession_id, _, lic = line.split("\t")
+        f_url = os.path.join(base_url, partial_path)
+        if (tarball := download(f_url)) is None:
+            continue
+        try:
+            nxml = read_nxml(tarball, partial_path)
+            # get metadata from nxml file
+            authors, date_created = get_authors_and_date(nxml, accession_id)
+            articles.append(
+                {
+                    "id": accession_id,
+                    "nxml": nxml.decode("utf-8"),
+                    "created": date_created,
+                    "journal": journal,
+                    "license": lic,
+                    "authors": authors,
+                }
+            )
+        except:
+            logger.exception(f"Error extracting {partial_path}")
+
+    # convert nxml to markdown, as a batch, with long lived pandoc workers
+    #   jats is the Journal Article Tag Suite (https://jats.nlm.nih.gov/)
+    #   wrap_text="none" is to prevent pandoc from wrapping lines
+    markdowns = get_pool().convert_batch(
+        [article.pop("nxml") for article in articles],
+        "markdown",
+        "jats",
+        {"wrap_text": "none"},
+        raise_errors=False,
+    )
+    return [
+        {"text": markdown, **article}
+        for article, markdown in zip(articles, markdowns)
+        if markdown is not None
+    ]
+
+
+def batched(iterable, n: int) -> Iterator[List]:
+    it = iter(iterable)
+    while batch := list(itertools.islice(it, n)):
+        yield batch
 
 
 def main(args):
-    os.makedirs(args.output_dir, exist_ok=True)
-    os.makedirs(args.metadata_dir, exist_ok=True)
-
     with open(args.filelist) as fh:
         files = fh.read().split("\n")
 
-    # ignore the header
-    files = files[1:]
+    # ignore the header, and empty lines
+    files = [f for f in files[1:] if f]
 
     if args.total_docs > 0:
         files = files[: args.total_docs]
 
     with mp.Pool(args.processes) as p:
-        # use list to force the execution of the imap iterable within the context of the multiprocessing pool
-        _ = list(
-            tqdm(
-                p.imap(
-                    functools.partial(download_and_convert, output_dir=args.output_dir),
-                    files,
-                ),
-                total=len(files),
-            )
+        batches = p.imap(download_and_convert, batched(files, args.batch_size))
+        records = itertools.chain.from_iterable(batches)
+        to_dolma(
+            tqdm(records, total=len(files)),
+            args.output_dir,
+            args.filename,
+            quiet=True,
         )
 
 
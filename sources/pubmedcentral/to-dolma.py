@@ -1,24 +1,20 @@
 import argparse
 import datetime
-import functools
+import glob
 import json
 import os
+from typing import Dict, Iterator
+
+import smart_open
 
-from common_pile import logs
 from common_pile.licenses import PermissiveLicenses
 from common_pile.write import to_dolma
 
 parser = argparse.ArgumentParser(description="Collect PubMedCentral into Dolma format.")
 parser.add_argument(
-    "--filelist",
-    default="data/permissive_filelist.txt",
-    help="The path to the filelist.txt file.",
-)
-parser.add_argument(
-    "--data_dir", default="data/md/", help="Path to the directory of markdown files."
-)
-parser.add_argument(
-    "--metadata_dir", default="data/metadata/", help="Where the metadata files go."
+    "--data_dir",
+    default="data/records/",
+    help="Path to the directory of converted article records.",
 )
 parser.add_argument(
     "--output_dir",
@@ -44,52 +40,37 @@ SOURCE_NAME = "PubMed Central"
 
 
 def format_dolma(
-    file: str,
-    data_dir: str,
+    record: Dict,
     source_name: str = SOURCE_NAME,
     base_url: str = "https://www.ncbi.nlm.nih.gov/pmc/articles",
 ):
-    file, journal, accessionID, _, lic = file.split("\t")
-    file = os.path.basename(file).replace("tar.gz", "md")
-    try:
-        with open(os.path.join(data_dir, file)) as f:
-            text = f.read()
-    except FileNotFoundError:
-        logger = logs.get_logger("pubmedcentral")
-        logger.error(f"File {os.path.join(data_dir, file)} does not exist")
-
-    with open(
-        os.path.join(args.metadata_dir, f"{os.path.splitext(file)[0]}.json"),
-        encoding="utf-8",
-    ) as f:
-        metadata = json.load(f)
-
+    accession_id = record["id"]
     return {
-        "id": accessionID,
-        "text": text,
+        "id": accession_id,
+        "text": record["text"],
         "source": source_name,
         "added": datetime.datetime.utcnow().isoformat(),
-        "created": metadata["created"],
+        "created": record["created"],
         "metadata": {
-            "license": str(LICENSE_MAP[lic]),
-            "url": f"{base_url}/{accessionID}/",
-            "journal": journal,
-            "authors": metadata["authors"],
+            "license": str(LICENSE_MAP[record["license"]]),
+            "url": f"{base_url}/{accession_id}/",
+            "journal": record["journal"],
+            "authors": record["authors"],
         },
     }
 
 
-def main(args):
-    os.makedirs(args.output_dir, exist_ok=True)
-
-    with open(args.filelist) as f:
-        files = f.read().split("\n")
+def read_records(data_dir: str) -> Iterator[Dict]:
+    for path in sorted(glob.glob(os.path.join(data_dir, "*.jsonl.gz"))):
+        with smart_open.open(path) as f:
+            for line in f:
+                yield json.loads(line)
 
-    # Remove the header
-    files = files[1:]
 
-    files = map(functools.partial(format_dolma, data_dir=args.data_dir), files)
-    to_dolma(files, args.output_dir, args.filename, args.shard_size)
+def main(args):
+    os.makedirs(args.output_dir, exist_ok=True)
+    records = map(format_dolma, read_records(args.data_dir))
+    to_dolma(records, args.output_dir, args.filename, args.shard_size)
 
 
 if __name__ == "__main__":
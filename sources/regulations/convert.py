@@ -1,19 +1,22 @@
-"""Convert documents from Regulations.gov to plaintext"""
+"""Convert documents from Regulations.gov to plaintext dolma records"""
 
 import argparse
+import datetime
+import functools
 import html
 import itertools
 import json
 import os
-import shutil
 import subprocess
 from collections import defaultdict
 
-import requests
-from bs4 import BeautifulSoup
 from tqdm.auto import tqdm
+from utils import converted_path, decode, iter_converted, truncate_partial_line
 
-from common_pile import logs
+from common_pile import logs, scrape
+from common_pile.html import parse as parse_html
+
+SOURCE_NAME = "regulations"
 
 
 def parse_args():
@@ -21,7 +24,12 @@ def parse_args():
     parser.add_argument(
         "--input-dir", required=True, help="Path to directory containing files"
     )
-    parser.add_argument("--output-dir", required=True, help="Path to output directory")
+    parser.add_argument(
+        "--output-dir",
+        required=True,
+        help="Path to output directory, converted documents are written as "
+        "<year>/<agency>.jsonl dolma records",
+    )
     parser.add_argument(
         "--years",
         nargs="+",
@@ -53,98 +61,154 @@ def parse_args():
         "--file-types",
         nargs="+",
         default=[".txt", ".htm", ".doc", ".docx"],
-        help="File types to convert to .txt",
+        help="File types to convert to text, when a document has multiple, "
+        "the first one in this list is used",
     )
     parser.add_argument(
         "--overwrite",
         action="store_true",
         default=False,
-        help="Overwrite existing files in output directory",
+        help="Re-convert documents that were already converted",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of files to convert at once",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=60,
+        help="Seconds to wait for the conversion of a single file",
     )
     return parser.parse_args()
 
 
-def convert_html(input_path, output_path):
-    try:
-        with open(input_path, "r") as f:
-            text = f.read()
-    except UnicodeDecodeError:
-        try:
-            with open(input_path, "r", encoding="windows-1252") as f:
-                text = f.read()
-        except:
-            logger.error(f"Failed to read {input_path}")
-            return
-    soup = BeautifulSoup(text, "html.parser")
-    pre_tag = soup.find("pre")
+def convert_html(input_path, timeout):
+    with open(input_path, "rb") as f:
+        text = decode(f.read())
+    # lxml normalizes the \r\n line endings inside <pre>, bs4 keeps them.
+    pre_tag = parse_html(text, backend="bs4").find("pre")
     if pre_tag:
         parsed_text = pre_tag.get_text()
     else:
         parsed_text = text
+    return html.unescape(parsed_text)
+
 
-    parsed_text = html.unescape(parsed_text)
+def run(command, timeout):
+    """Run a conversion tool, its output is the text of the document."""
+    output = subprocess.run(command, capture_output=True, timeout=timeout, check=True)
+    return decode(output.stdout)
 
-    with open(output_path, "w") as f:
-        f.write(parsed_text)
 
+def convert_doc(input_path, timeout):
+    return run(["catdoc", input_path], timeout)
 
-def convert_doc(input_path, output_path):
-    with open(output_path, "w") as f:
-        try:
-            subprocess.run(["catdoc", input_path], stdout=f, timeout=60)
-        except subprocess.TimeoutExpired:
-            logger.error(f"catdoc timed out for {input_path}")
-            return
 
+def convert_docx(input_path, timeout):
+    # Write the text to stdout instead of a .txt file next to the input.
+    return run(["docx2txt", input_path, "-"], timeout)
 
-def convert_docx(input_path, output_path):
-    try:
-        # Produces a plain text file with the same name as the input file
-        subprocess.run(["docx2txt", input_path], timeout=60)
-    except subprocess.TimeoutExpired:
-        logger.error(f"docx2txt timed out for {input_path}")
-        return
-    os.rename(f"{os.path.splitext(input_path)[0]}.txt", output_path)
 
+def convert_txt(input_path, timeout):
+    with open(input_path, "rb") as f:
+        return decode(f.read())
 
-def convert_txt(input_path, output_path):
-    shutil.copyfile(input_path, output_path)
+
+CONVERT_FUNCS = {
+    ".txt": convert_txt,
+    ".htm": convert_html,
+    ".doc": convert_doc,
+    ".docx": convert_docx,
+}
+
+
+def convert(job, year, agency, timeout):
+    """Convert a single `(doc_id, input_file)` to a record, runs in the thread pool."""
+    doc_id, input_file = job
+    file_type = os.path.splitext(input_file)[1]
+    return {
+        "id": doc_id,
+        "text": CONVERT_FUNCS[file_type](input_file, timeout),
+        "source": SOURCE_NAME,
+        "added": datetime.datetime.utcnow().isoformat(),
+        "metadata": {
+            "year": year,
+            "agency": agency,
+            "file": os.path.basename(input_file),
+            "mtime": os.path.getmtime(input_file),
+        },
+    }
+
+
+def find_files(input_dir, file_types, converted, postfix):
+    """Pick a file to convert for each document that needs it."""
+    logger = logs.get_logger("regulations")
+    files = defaultdict(dict)
+    for file in os.listdir(input_dir):
+        doc_id, file_type = os.path.splitext(file)
+        if file_type not in file_types:
+            postfix["Skipped"] += 1
+            logger.error(f"Unsupported file type {file_type} for {file}")
+            continue
+        files[doc_id][file_type] = os.path.join(input_dir, file)
+
+    for doc_id, by_type in files.items():
+        input_file = next(by_type[t] for t in file_types if t in by_type)
+        # Files re-downloaded by a refresh are newer than their conversion.
+        if doc_id in converted and converted[doc_id] >= os.path.getmtime(input_file):
+            postfix["Skipped"] += 1
+            logger.info(f"Skipping {doc_id} (already converted)")
+            continue
+        yield doc_id, input_file
 
 
 def main(args):
     logger = logs.get_logger("regulations")
-    convert_funcs = {
-        ".txt": convert_txt,
-        ".htm": convert_html,
-        ".doc": convert_doc,
-        ".docx": convert_docx,
-    }
 
     pbar = tqdm()
     postfix = defaultdict(lambda: 0)
     for year, agency in tqdm(itertools.product(args.years, args.agencies)):
         logger.info(f"Converting {agency} files from {year}")
         input_dir = os.path.join(args.input_dir, year, agency)
-        output_dir = os.path.join(args.output_dir, year, agency)
-        os.makedirs(output_dir, exist_ok=True)
-
-        for file in os.listdir(input_dir):
-            file_name, file_type = os.path.splitext(file)
-            input_file = os.path.join(input_dir, file)
-            output_file = os.path.join(output_dir, f"{file_name}.txt")
-
-            if os.path.exists(output_file) and not args.overwrite:
-                postfix["Skipped"] += 1
-                logger.info(f"Skipping {output_file} (already exists)")
-            elif file_type in args.file_types:
-                func = convert_funcs[file_type]
-                func(input_file, output_file)
-                postfix[file_type] += 1
-            else:
-                postfix["Skipped"] += 1
-                logger.error(f"Unsupported file type {file_type} for {input_file}")
-
-            pbar.set_postfix(postfix)
+        if not os.path.exists(input_dir):
+            logger.error(f"Missing files for {agency} in {year}")
+            continue
+        output_file = converted_path(args.output_dir, year, agency)
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        if args.overwrite and os.path.exists(output_file):
+            os.remove(output_file)
+        # Records are appended as they are converted, if we crashed while
+        # writing one, remove it, and skip the documents we already have.
+        truncate_partial_line(output_file)
+        converted = {
+            record["id"]: record["metadata"]["mtime"]
+            for record in iter_converted(output_file)
+        }
+
+        jobs = find_files(input_dir, args.file_types, converted, postfix)
+        func = functools.partial(
+            convert, year=year, agency=agency, timeout=args.timeout
+        )
+        with open(output_file, "a") as wf:
+            for (_, input_file), future in scrape.bounded_map(func, jobs, args.workers):
+                try:
+                    record = future.result()
+                except subprocess.TimeoutExpired:
+                    logger.error(f"Timed out converting {input_file}")
+                    postfix["Errors"] += 1
+                    continue
+                except Exception:
+                    logger.exception(f"Failed to convert {input_file}")
+                    postfix["Errors"] += 1
+                    continue
+                wf.write(json.dumps(record) + "\n")
+                wf.flush()
+                postfix[os.path.splitext(input_file)[1]] += 1
+                pbar.update(1)
+                pbar.set_postfix(postfix)
 
 
 if __name__ == "__main__":
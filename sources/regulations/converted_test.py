@@ -0,0 +1,63 @@
+"""Tests for reading and resuming the converted Regulations.gov records."""
+
+import importlib.util
+import json
+import os
+
+# Other sources also have a `utils` module, so load ours by path.
+_spec = importlib.util.spec_from_file_location(
+    "regulations_utils", os.path.join(os.path.dirname(__file__), "utils.py")
+)
+utils = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(utils)
+
+
+def record(doc_id, text, mtime=0):
+    return json.dumps({"id": doc_id, "text": text, "metadata": {"mtime": mtime}})
+
+
+def test_truncate_partial_line(tmp_path):
+    path = tmp_path / "epa.jsonl"
+    complete = record("a", "first") + "\n" + record("b", "second") + "\n"
+    path.write_text(complete + record("c", "crashed")[:20])
+    utils.truncate_partial_line(str(path))
+    assert path.read_text() == complete
+    # Files that end with a newline are left alone.
+    utils.truncate_partial_line(str(path))
+    assert path.read_text() == complete
+
+
+def test_truncate_partial_line_without_newline(tmp_path):
+    path = tmp_path / "epa.jsonl"
+    path.write_text(record("a", "crashed")[:20])
+    utils.truncate_partial_line(str(path))
+    assert path.read_text() == ""
+    # Missing files are fine, there is nothing to resume.
+    utils.truncate_partial_line(str(tmp_path / "missing.jsonl"))
+
+
+def test_truncate_partial_line_spans_chunks(tmp_path):
+    path = tmp_path / "epa.jsonl"
+    complete = record("a", "x" * 10) + "\n"
+    path.write_text(complete + record("b", "y" * 2**17))
+    utils.truncate_partial_line(str(path))
+    assert path.read_text() == complete
+
+
+def test_iter_converted_latest_record_wins(tmp_path):
+    path = tmp_path / "epa.jsonl"
+    path.write_text(
+        record("a", "old a", 1)
+        + "\n"
+        + record("b", "only b", 1)
+        + "\n"
+        + record("a", "new a", 2)
+        + "\n"
+        + record("c", "partial")[:10]
+    )
+    records = list(utils.iter_converted(str(path)))
+    assert [(r["id"], r["text"], r["metadata"]["mtime"]) for r in records] == [
+        ("b", "only b", 1),
+        ("a", "new a", 2),
+    ]
+    assert list(utils.iter_converted(str(tmp_path / "missing.jsonl"))) == []
@@ -1,14 +1,14 @@
 """Download Regulations.gov documents"""
 
 import argparse
+import collections
 import itertools
 import json
 import os
 
-import requests
 from tqdm.auto import tqdm
 
-from common_pile import logs
+from common_pile import logs, scrape
 
 
 def parse_args():
@@ -58,26 +58,50 @@ def parse_args():
         default=False,
         help="Overwrite existing files in output directory",
     )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Re-request files in the manifest and only re-download those that changed",
+    )
+    parser.add_argument(
+        "--manifest",
+        help="Path to the crawl manifest, defaults to ${output-dir}/manifest.jsonl",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=8, help="Number of concurrent downloads"
+    )
+    parser.add_argument(
+        "--requests-per-second",
+        type=float,
+        default=10.0,
+        help="Maximum number of requests per second to each host",
+    )
     return parser.parse_args()
 
 
-def download_file(url, filename):
-    try:
-        response = requests.get(url)
-    except:
-        return -1
-    if response.status_code == 200:
-        with open(filename, "wb") as file:
-            file.write(response.content)
-        return response.status_code
-    else:
-        return -1
-
-
-def main(args):
+def save_file(response, files, stats, pbar):
+    # The same file can be attached to multiple documents, it is saved for each.
+    for output_file in files.pop(response.url):
+        if not response.changed:
+            logs.get_logger("regulations").debug(f"File {output_file} is unchanged")
+            stats["Unchanged"] += 1
+        elif response.ok:
+            with open(output_file, "wb") as wf:
+                wf.write(response.content)
+            logs.get_logger("regulations").debug(f"Downloaded {output_file}")
+            stats["Downloaded"] += 1
+        else:
+            logs.get_logger("regulations").error(
+                f"Failed to download {output_file} -- {response.error}"
+            )
+            stats["Errors"] += 1
+        pbar.update(1)
+    pbar.set_postfix(stats)
+
+
+def files_to_download(args, files, stats, manifest):
+    """Yield the url of each file to download, `files` maps them to their output paths."""
     logger = logs.get_logger("regulations")
-
-    args.file_types = set(args.file_types)
     for year, agency in itertools.product(args.years, args.agencies):
         os.makedirs(os.path.join(args.output_dir, year, agency), exist_ok=True)
         input_file = os.path.join(args.input_dir, year, f"{agency}.json")
@@ -92,41 +116,54 @@ def main(args):
         with open(input_file, "r") as f:
             index = json.load(f)
 
-        pbar_stats = {
-            "Downloaded": 0,
-            "Errors": 0,
-            "Already Exists": 0,
-            "Wrong File Type": 0,
-        }
-
         # Iterate through index---each key is a document ID, and each value is a list of metadata dictionaries containing lists of content files
-        pbar = tqdm(index.items())
-        for doc_id, metadatas in pbar:
+        for doc_id, metadatas in index.items():
             for metadata in metadatas:
                 for file in metadata["Content Files"]:
                     output_file = os.path.join(
                         output_dir, f"{doc_id}{file['File Type']}"
                     )
-                    if os.path.exists(output_file):
-                        logger.debug(f"File {output_file} already exists")
-                        pbar_stats["Already Exists"] += 1
-                        continue
                     if file["File Type"] not in args.file_types:
                         logger.debug(
                             f"Skipping {output_file} -- wrong file type: {file['File Type']}"
                         )
-                        pbar_stats["Wrong File Type"] += 1
+                        stats["Wrong File Type"] += 1
                         continue
-                    ret = download_file(file["URL"], output_file)
-                    if ret == 200:
-                        logger.debug(f"Downloaded {output_file}")
-                        pbar_stats["Downloaded"] += 1
-                    else:
-                        logger.error(
-                            f"Failed to download {output_file} -- status code: {ret}"
-                        )
-                        pbar_stats["Errors"] += 1
-                    pbar.set_postfix(pbar_stats)
+                    if not os.path.exists(output_file):
+                        manifest.discard(file["URL"])
+                    # When refreshing, files we have a manifest entry for are
+                    # requested again, but only downloaded if they changed.
+                    elif not args.overwrite and not (
+                        args.refresh and file["URL"] in manifest
+                    ):
+                        logger.debug(f"File {output_file} already exists")
+                        stats["Already Exists"] += 1
+                        continue
+                    # Only request a url once while it is in flight, when it
+                    # finishes it is saved for every document that uses it.
+                    if file["URL"] in files:
+                        files[file["URL"]].append(output_file)
+                        continue
+                    files[file["URL"]] = [output_file]
+                    yield file["URL"]
+
+
+def main(args):
+    args.file_types = set(args.file_types)
+    manifest_path = args.manifest or os.path.join(args.output_dir, "manifest.jsonl")
+    stats = collections.Counter(
+        {"Downloaded": 0, "Unchanged": 0, "Errors": 0, "Already Exists": 0}
+    )
+    files = {}
+    with scrape.CrawlManifest(manifest_path) as manifest, tqdm() as pbar:
+        scrape.crawl(
+            files_to_download(args, files, stats, manifest),
+            lambda r: save_file(r, files, stats, pbar),
+            concurrency=args.workers,
+            requests_per_second=args.requests_per_second,
+            connections_per_host=args.workers,
+            manifest=manifest,
+        )
 
 
 if __name__ == "__main__":
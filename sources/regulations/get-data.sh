@@ -13,8 +13,8 @@ python build-index.py --input-dir ${REGULATIONS_DIRECTORY}/raw --output-dir ${RE
 echo "Downloading Files"
 python download-files.py --input-dir ${REGULATIONS_DIRECTORY}/indexes --output-dir ${REGULATIONS_DIRECTORY}/files
 
-echo "Converting to Text Files"
-python convert.py --input-dir ${REGULATIONS_DIRECTORY}/files --output-dir ${REGULATIONS_DIRECTORY}/text_files
+echo "Converting to Text"
+python convert.py --input-dir ${REGULATIONS_DIRECTORY}/files --output-dir ${REGULATIONS_DIRECTORY}/converted
 
 echo "Creating Dolma Dataset"
-python to-dolma.py --file-dir ${REGULATIONS_DIRECTORY}/text_files --index-dir ${REGULATIONS_DIRECTORY}/indexes --output-dir ${REGULATIONS_DIRECTORY}/v0
+python to-dolma.py --file-dir ${REGULATIONS_DIRECTORY}/converted --index-dir ${REGULATIONS_DIRECTORY}/indexes --output-dir ${REGULATIONS_DIRECTORY}/v0
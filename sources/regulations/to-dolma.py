@@ -5,7 +5,9 @@ import itertools
 import json
 import os
 
-from common_pile import logs
+from utils import converted_path, iter_converted
+
+from common_pile import logs, scrape
 from common_pile.licenses import PermissiveLicenses
 from common_pile.write import to_dolma
 
@@ -17,7 +19,7 @@ def parse_args():
     parser.add_argument(
         "--file-dir",
         required=True,
-        help="Path to directory containing downloaded and converted files",
+        help="Path to directory containing converted documents, from convert.py",
     )
     parser.add_argument(
         "--index-dir",
@@ -65,12 +67,27 @@ def parse_args():
         "--shard-size", type=int, default=1, help="Size, in GB, for each shard"
     )
     parser.add_argument("--workers", type=int, default=10, help="Number of threads")
+    parser.add_argument(
+        "--manifest",
+        help="Path to the crawl manifest written by download-files.py",
+    )
+    parser.add_argument(
+        "--changed-since",
+        help="Only output documents whose files changed at or after this ISO timestamp, "
+        "according to --manifest",
+    )
     args = parser.parse_args()
+    if args.changed_since and not args.manifest:
+        parser.error("--changed-since requires --manifest")
     return args
 
 
 def generate_records(args):
     logger = logs.get_logger("regulations")
+    changed = None
+    if args.changed_since:
+        changed = scrape.CrawlManifest(args.manifest).changed_since(args.changed_since)
+        logger.info(f"{len(changed)} files changed since {args.changed_since}")
     for year, agency in itertools.product(args.years, args.agencies):
         index_path = os.path.join(args.index_dir, year, f"{agency}.json")
         if not os.path.exists(index_path):
@@ -79,21 +96,13 @@ def generate_records(args):
         with open(index_path, "r") as f:
             index = json.load(f)
 
-        for doc_id, metadata_list in index.items():
-            for metadata in metadata_list:
-                file_path = os.path.join(args.file_dir, year, agency, f"{doc_id}.txt")
-                if not os.path.exists(file_path):
+        for converted in iter_converted(converted_path(args.file_dir, year, agency)):
+            doc_id, text = converted["id"], converted["text"]
+            for metadata in index.get(doc_id, []):
+                if changed is not None and not any(
+                    f["URL"] in changed for f in metadata["Content Files"]
+                ):
                     continue
-                try:
-                    with open(file_path, "r") as f:
-                        text = f.read()
-                except UnicodeDecodeError:
-                    try:
-                        with open(file_path, "r", encoding="windows-1252") as f:
-                            text = f.read()
-                    except UnicodeDecodeError:
-                        logger.error(f"Failed to decode file {file_path}")
-                        continue
 
                 url = None
                 for file_metadata in metadata["Content Files"]:
@@ -0,0 +1,62 @@
+"""Shared tools for the converted Regulations.gov documents."""
+
+import json
+import os
+from typing import Dict, Iterator
+
+
+def converted_path(output_dir: str, year: str, agency: str) -> str:
+    """Converted documents are stored as a jsonl file of dolma records per agency and year."""
+    return os.path.join(output_dir, year, f"{agency}.jsonl")
+
+
+def decode(data: bytes) -> str:
+    """Most documents are utf-8, but older ones are often windows-1252."""
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode("windows-1252", errors="replace")
+
+
+def _complete_lines(path: str) -> Iterator[str]:
+    with open(path) as f:
+        for line in f:
+            # A partial last line is from a run that crashed while writing it.
+            if not line.endswith("\n"):
+                break
+            yield line
+
+
+def iter_converted(path: str) -> Iterator[Dict]:
+    """Read converted records, when an id was converted again only the latest is used.
+
+    Records are streamed, so we only keep the line number of the latest
+    record for each id in memory, not the texts.
+    """
+    if not os.path.exists(path):
+        return
+    latest = {}
+    for i, line in enumerate(_complete_lines(path)):
+        latest[json.loads(line)["id"]] = i
+    for i, line in enumerate(_complete_lines(path)):
+        record = json.loads(line)
+        if latest[record["id"]] == i:
+            yield record
+
+
+def truncate_partial_line(path: str):
+    """Remove a partial last line so new records can be appended."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        # Look backwards for the last newline.
+        while end > 0:
+            start = max(end - 2**16, 0)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline != -1:
+                f.truncate(start + newline + 1)
+                return
+            end = start
+        f.truncate(0)
@@ -18,13 +18,13 @@ from dataclasses import dataclass
 from io import StringIO
 from typing import Dict, List, Sequence
 
-import bs4
 import tqdm
 from lxml import etree
 from markdown_it import MarkdownIt
 
 import common_pile.xml as xml
 from common_pile import logs
+from common_pile.html import parse as parse_html
 from common_pile.licenses import PermissiveLicenses
 from common_pile.write import to_dolma
 
@@ -136,8 +136,9 @@ def get_attr(xml_obj, key):
 
 
 def get_html_text(html):
-    soup = bs4.BeautifulSoup(html, "html.parser")
-    return soup.get_text()
+    # lxml keeps whitespace between block tags that html.parser drops, use bs4
+    # so the text matches earlier versions of the dataset.
+    return parse_html(html, backend="bs4").get_text()
 
 
 def get_body_text(xml_obj):
@@ -1,15 +1,15 @@
 """Downloads plaintext files from the USGPO GovInfo API"""
 import argparse
 import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import functools
 
 import jsonlines
 import trafilatura
 from bs4 import BeautifulSoup
+from govinfo import api_query, set_rate_limit
 from tqdm.auto import tqdm
-from utils import api_query
 
-from common_pile import logs
+from common_pile import logs, scrape
 from common_pile.licenses import PermissiveLicenses
 from common_pile.write import to_dolma
 
@@ -36,14 +36,32 @@ def parse_args():
         "--shard-size", type=int, default=1, help="Size, in GB, for each shard"
     )
     parser.add_argument("--workers", type=int, default=10, help="Number of threads")
+    parser.add_argument(
+        "--requests-per-second",
+        type=float,
+        default=10,
+        help="Rate limit shared by all threads, it is lowered automatically when "
+        "the API says we are over the limit",
+    )
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        help="Maximum number of files in flight at once, defaults to 2 * --workers",
+    )
     args = parser.parse_args()
     return args
 
 
 def download_file(api_key, file_url):
+    logger = logs.get_logger("usgpo")
     response = api_query(file_url, headers=None, params={"api_key": api_key})
-    text = response.text
-    return text
+    # Don't turn an error page, or the last rate limited response, into a record.
+    if response.status_code != 200:
+        logger.error(
+            f"download_file received status code {response.status_code} for {file_url}"
+        )
+        return None
+    return response.text
 
 
 def parse_html(html):
@@ -74,6 +92,8 @@ def construct_record(api_key, file):
             return None
 
         html = download_file(api_key, file_url)
+        if html is None:
+            return None
         text = parse_html(html)
 
         if text is None or len(text) == 0:
@@ -101,18 +121,20 @@ def construct_record(api_key, file):
 
 
 def generate_records(args):
+    # Links are read lazily and only a window of them are in flight, so we
+    # don't queue up a future for every file before writing anything out.
+    construct = functools.partial(construct_record, args.api_key)
     with jsonlines.open(args.links_file, mode="r") as reader:
-        with ThreadPoolExecutor(max_workers=args.workers) as executor:
-            futures = [
-                executor.submit(construct_record, args.api_key, file) for file in reader
-            ]
-            for future in as_completed(futures):
-                record = future.result()
-                if record is not None:
-                    yield record
+        for _, future in scrape.bounded_map(
+            construct, reader, args.workers, args.max_pending
+        ):
+            record = future.result()
+            if record is not None:
+                yield record
 
 
 def main(args):
+    set_rate_limit(args.requests_per_second)
     to_dolma(generate_records(args), args.output_dir, args.filename, args.shard_size)
 
 
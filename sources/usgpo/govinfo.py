@@ -0,0 +1,134 @@
+"""Tools for querying the GovInfo API, listing packages, and fetching their metadata."""
+
+import functools
+import time
+from typing import Dict, Iterator, Optional, Sequence
+
+import jsonlines
+from tqdm.auto import tqdm
+
+from common_pile import logs, scrape
+
+API_URL = "https://api.govinfo.gov"
+
+# GovInfo goes through api.data.gov, which rate limits each API key. All threads
+# share this limiter so they back off together when we hit the limit.
+LIMITER = scrape.RateLimiter(requests_per_second=10)
+
+
+def set_rate_limit(requests_per_second: float):
+    global LIMITER
+    LIMITER = scrape.RateLimiter(requests_per_second)
+
+
+def api_query(endpoint, headers, params, max_attempts: int = 10):
+    """Query the API, rate limited responses are retried once the limiter allows."""
+    logger = logs.get_logger("usgpo")
+    session = scrape.get_session()
+    for _ in range(max_attempts):
+        LIMITER.acquire()
+        response = session.get(endpoint, headers=headers, params=params)
+        LIMITER.update(response.status_code, response.headers)
+        if response.status_code not in scrape.RateLimiter.THROTTLE_STATUSES:
+            return response
+    logger.error(f"Still rate-limited after {max_attempts} attempts for {endpoint}")
+    return response
+
+
+def get_packages(
+    api_key: str,
+    collections: Sequence[str],
+    start_date: str,
+    api_url: str = API_URL,
+    page_delay: float = 5,
+) -> Iterator[Dict]:
+    """Yield the packages published since `start_date`, one page of results at a time."""
+    logger = logs.get_logger("usgpo")
+
+    url = f"{api_url}/published/{start_date}"
+    # offset mark is initially "*" to denote no offset
+    offset_mark = "*"
+    while url is not None:
+        response = api_query(
+            url,
+            headers={"accept": "application/json"},
+            params={
+                "api_key": api_key,
+                "offsetMark": offset_mark,
+                "pageSize": 1000,
+                "collection": ",".join(collections),
+            },
+        )
+        if response.status_code != 200:
+            logger.error(
+                f"get_packages received status code {response.status_code} for query {url}"
+            )
+            return
+        output = response.json()
+        yield from output["packages"]
+
+        url = output["nextPage"]
+        offset_mark = None
+        # Sleep since a sudden burst of requests seems to result in erroneous rate-limiting
+        if url is not None:
+            time.sleep(page_delay)
+
+
+def get_file_links(
+    api_key: str, package: Dict, api_url: str = API_URL
+) -> Optional[Dict]:
+    package_id = package["packageId"]
+    response = api_query(
+        f"{api_url}/packages/{package_id}/summary",
+        headers={"accept": "application/json"},
+        params={"api_key": api_key},
+    )
+    if response.status_code == 200:
+        output = response.json()
+        return output.get("download")
+    return None
+
+
+def get_package_metadata(api_key: str, package: Dict, api_url: str = API_URL) -> Dict:
+    record = {
+        "title": package.get("title"),
+        "package_id": package.get("packageId"),
+        "date": package.get("dateIssued"),
+        "category": package.get("category"),
+        "author": package.get("governmentAuthor1"),
+        "publisher": package.get("publisher"),
+        "links": get_file_links(api_key, package, api_url),
+    }
+    return record
+
+
+def write_links(
+    api_key: str,
+    packages: Iterator[Dict],
+    path: str,
+    workers: int,
+    max_pending: Optional[int] = None,
+    api_url: str = API_URL,
+    quiet: bool = False,
+) -> int:
+    """Fetch the metadata for each package and append it to the jsonl file at `path`.
+
+    Packages are consumed as they are listed and records are written as soon
+    as their request finishes, so only `max_pending` packages are held in
+    memory. Returns the number of records written.
+    """
+    logger = logs.get_logger("usgpo")
+    fetch = functools.partial(get_package_metadata, api_key, api_url=api_url)
+    written = 0
+    with jsonlines.open(path, mode="w", flush=True) as writer:
+        for package, future in tqdm(
+            scrape.bounded_map(fetch, packages, workers, max_pending), disable=quiet
+        ):
+            try:
+                record = future.result()
+            except Exception as e:
+                logger.error(f"Package {package.get('packageId')} raised exception {e}")
+                continue
+            writer.write(record)
+            written += 1
+    return written
@@ -0,0 +1,81 @@
+"""Tests for fetching package metadata, run against a local stand-in for the GovInfo API."""
+
+import http.server
+import json
+import threading
+import urllib.parse
+
+import jsonlines
+import pytest
+from govinfo import get_packages, write_links
+
+PACKAGES = [{"packageId": f"PKG-{i}", "title": f"Package {i}"} for i in range(7)]
+
+
+class GovInfoHandler(http.server.BaseHTTPRequestHandler):
+    limited = set()
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        if url.path.startswith("/published/"):
+            # Two pages of results, the second is linked from the first.
+            if query.get("offsetMark") == ["*"]:
+                next_page = f"http://{self.headers['Host']}/published/page2"
+                return self.reply(
+                    200, {"packages": PACKAGES[:4], "nextPage": next_page}
+                )
+            return self.reply(200, {"packages": PACKAGES[4:], "nextPage": None})
+        if url.path.startswith("/packages/"):
+            package_id = url.path.split("/")[2]
+            if package_id == "PKG-5":
+                return self.reply(500, {})
+            # Rate limit the first request for this package, it should be retried.
+            if package_id == "PKG-2" and package_id not in self.limited:
+                self.limited.add(package_id)
+                return self.reply(429, {}, {"Retry-After": "0"})
+            return self.reply(200, {"download": {"txtLink": f"/{package_id}.htm"}})
+        return self.reply(404, {})
+
+    def reply(self, status, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    GovInfoHandler.limited.clear()
+    httpd = http.server.ThreadingHTTPServer(("localhost", 0), GovInfoHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://localhost:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def test_write_links(server, tmp_path):
+    packages = get_packages(
+        "key", ["BILLS"], "2000-01-01", api_url=server, page_delay=0
+    )
+    path = tmp_path / "links.jsonl"
+    written = write_links(
+        "key", packages, str(path), workers=2, max_pending=2, api_url=server, quiet=True
+    )
+    assert written == len(PACKAGES)
+    with jsonlines.open(path) as reader:
+        records = {r["package_id"]: r for r in reader}
+    assert set(records) == {p["packageId"] for p in PACKAGES}
+    assert records["PKG-0"]["links"] == {"txtLink": "/PKG-0.htm"}
+    assert records["PKG-0"]["title"] == "Package 0"
+    assert records["PKG-2"]["links"] == {"txtLink": "/PKG-2.htm"}
+    assert GovInfoHandler.limited == {"PKG-2"}
+    # A failed summary request is recorded without links.
+    assert records["PKG-5"]["links"] is None
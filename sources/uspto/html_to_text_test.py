@@ -0,0 +1,57 @@
+"""Tests that stripping patent html with polars matches converting it with pandoc."""
+
+import importlib.util
+import os
+
+import polars as pl
+import pytest
+
+from common_pile import pandoc
+
+# Other sources also have a `utils` module, so load ours by path.
+_spec = importlib.util.spec_from_file_location(
+    "uspto_utils", os.path.join(os.path.dirname(__file__), "utils.py")
+)
+utils = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(utils)
+
+ROWS = {
+    "paragraphs": "<p>A widget comprising a frame.</p>\n<p>The frame is\nmade of steel.</p>",
+    "heading": "<heading>BACKGROUND</heading><p>Widgets are known.</p>"
+    "<heading>SUMMARY</heading><p>This is new.</p>",
+    "claims": "<p>1. A widget comprising a frame. 2. The widget of claim 1, wherein "
+    "the frame is steel. 3. The widget of claim 2.</p>",
+    "entities": "<p>A &lt; B &amp; C &gt; D, &quot;quoted&quot; and it&#39;s &amp;lt; fine.</p>",
+    "nbsp": "<p>Ten&nbsp;mm wide and 5&nbsp;&nbsp;cm long.</p>",
+    "br": "<p>First line<br>second line<br/>third line</p>",
+    "inline": '<p>A <b>bold</b> and <i>italic</i> <span class="x">span</span> word.</p>',
+    # Needs pandoc.
+    "subsup": "<p>H<sub>2</sub>O at 10<sup>3</sup> Pa.</p>",
+    "list": "<ul><li>one</li><li>two</li></ul>",
+    "unknown_entity": "<p>An angle of 30&deg;.</p>",
+}
+PANDOC_ROWS = {"subsup", "list", "unknown_entity"}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def has_pandoc():
+    try:
+        pandoc.pandoc_path()
+    except pandoc.PandocError:
+        pytest.skip("pandoc isn't installed.")
+
+
+def test_needs_pandoc():
+    df = pl.DataFrame({"html": list(ROWS.values())})
+    needs = df.select(utils.needs_pandoc(pl.col("html")))["html"].to_list()
+    assert {name for name, need in zip(ROWS, needs) if need} == PANDOC_ROWS
+
+
+@pytest.mark.parametrize("claims", [False, True])
+def test_html_to_text_matches_pandoc(claims):
+    df = pl.DataFrame({"html": list(ROWS.values()) + [None, ""]})
+    texts = df.select(utils.html_to_text("html", claims, 2))["html"].to_list()
+    expected = [utils.parse_html(claims, html) for html in ROWS.values()] + ["", ""]
+    assert dict(zip(list(ROWS) + ["null", "empty"], texts)) == dict(
+        zip(list(ROWS) + ["null", "empty"], expected)
+    )
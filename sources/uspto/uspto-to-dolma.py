@@ -1,14 +1,13 @@
 import argparse
 import os
 import sys
-from functools import partial
 from pathlib import Path
 from typing import Iterator
 
 import polars as pl
 from polars import col
 from tqdm import tqdm
-from utils import parallel_apply
+from utils import html_to_text
 
 from common_pile.licenses import PermissiveLicenses
 from common_pile.logs import configure_logging
@@ -53,8 +52,11 @@ def process_datasets(
     logger.info(f"Processing files in {data_path}")
     file_names = list(data_path.glob("*.parquet"))
     for i, file_name in enumerate(file_names):
-        for x in scan_dataset(file_name, limit, max_concurrency).iter_rows(named=True):
-            yield x
+        # Batches stream out of the query, so the whole file is never in memory.
+        for batch in scan_dataset(file_name, limit, max_concurrency).collect_batches(
+            engine="streaming"
+        ):
+            yield from batch.iter_rows(named=True)
 
 
 def to_parquet(
@@ -67,15 +69,18 @@ def to_parquet(
     )
     for i, files in enumerate(tqdm(datapath.glob("*.parquet"))):
         file_path = output_dir.joinpath(f"uspto{i}.parquet")
-        scan_dataset(files, limit, max_concurrency).write_parquet(file_path)
+        scan_dataset(files, limit, max_concurrency).sink_parquet(file_path)
 
 
-def scan_dataset(file_name, limit, max_concurrency) -> pl.DataFrame:
+def scan_dataset(file_name, limit, max_concurrency) -> pl.LazyFrame:
     """
-    Scans an individual parquet file and returns a processed DataFrame.
+    Scans an individual parquet file and returns a processed LazyFrame.
+
+    The html is stripped with polars expressions, only rows with markup that
+    needs pandoc are sent to it, so the query can run on the streaming engine.
 
     Returns:
-        DataFrame: A processed DataFrame containing the selected columns from the dataset.
+        LazyFrame: A query for the selected, processed, columns from the dataset.
 
     Example Usage:
         file_name = "dataset.parquet"
@@ -84,8 +89,6 @@ def scan_dataset(file_name, limit, max_concurrency) -> pl.DataFrame:
 
         result = scan_dataset((file_name, limit, max_concurrency))
     """
-    parallel_apply_desc = partial(parallel_apply, False, max_concurrency)
-    parallel_apply_claims = partial(parallel_apply, True, max_concurrency)
     columns = (
         "title_text",
         "title_language",
@@ -119,15 +122,9 @@ def scan_dataset(file_name, limit, max_concurrency) -> pl.DataFrame:
                 ignore_nulls=False,
             ).alias("abstract_text"),
         )
-        .with_columns_seq(
-            col("description_html").map_batches(
-                parallel_apply_desc,
-                return_dtype=pl.String,
-            ),
-            col("claims_html").map_batches(
-                parallel_apply_claims,
-                return_dtype=pl.String,
-            ),
+        .with_columns(
+            html_to_text("description_html", False, max_concurrency),
+            html_to_text("claims_html", True, max_concurrency),
         )
         .with_columns(
             pl.concat_str(
@@ -149,8 +146,8 @@ def scan_dataset(file_name, limit, max_concurrency) -> pl.DataFrame:
         )
     ).select(["id", "text", "added", "created", "source", "metadata"])
     if limit > 0:
-        df = df.fetch(limit).lazy()
-    return df.collect()
+        df = df.head(limit)
+    return df
 
 
 def create_args_parser() -> argparse.ArgumentParser:
@@ -175,7 +172,7 @@ def create_args_parser() -> argparse.ArgumentParser:
         "--max-concurrency",
         type=int,
         default=int(os.cpu_count()) - 1,
-        help="Maximum number of multiprocessing for pandoc conversions",
+        help="Maximum number of pandoc workers, for rows that can't be converted with polars",
     )
     parser.add_argument(
         "--to-parquet",
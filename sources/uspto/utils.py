@@ -1,11 +1,10 @@
-import multiprocessing
+import os
 import re
-from functools import partial
 from itertools import islice
 
 import polars as pl
-import pypandoc
-from rich.progress import track
+
+from common_pile.pandoc import get_pool
 
 
 def batched(iterable, n):
@@ -14,29 +13,106 @@ def batched(iterable, n):
         yield batch
 
 
-def parse_html(claims: bool, html_string: str) -> str:
-    if not html_string:
-        return ""
-    text = pypandoc.convert_text(html_string, "plain", "html", extra_args=["--quiet"])
+# Most of the patent html is paragraphs and a few inline tags, which polars can
+# strip with regexes on the arrow buffers directly. Rows with markup that pandoc
+# renders in a special way (lists, tables, sub/superscripts, ...) or with
+# entities we don't decode are converted with pandoc instead.
+COMMENT = r"(?s)<!--.*?-->"
+WHITESPACE = r"[ \t\r\n]+"
+BREAK_TAG = r"(?i)<br\b[^>]*>"
+# `heading` is used for section titles in the descriptions.
+BLOCK_TAG = r"(?i)</?(?:p|div|h[1-6]|heading|blockquote|address|section|article|header|footer|hr)\b[^>]*>"
+TAG = r"<[^>]*>"
+PARAGRAPH_BREAK = r" *\n[\n ]*"
+PANDOC_TAG = r"(?i)<(?:table|ol|ul|dl|li|sup|sub|pre|code|math|img)\b"
+ENTITY = r"&[#A-Za-z0-9]+;"
+# &amp; is last so we don't decode things like &amp;lt; twice.
+ENTITIES = {
+    "&lt;": "<",
+    "&gt;": ">",
+    "&quot;": '"',
+    "&apos;": "'",
+    "&#39;": "'",
+    "&nbsp;": " ",
+    "&amp;": "&",
+}
+KNOWN_ENTITY = "|".join(ENTITIES)
+# Add line-breaks before <number><periods> for claims (as they are all numbered).
+CLAIM_NUMBER = r"(\s\d+\.\s)"
+
+
+def clean_text(claims: bool, text: str) -> str:
     # remove single newlines that are not surrounded by other newlines as those are likely line length formatting.
     new_line_pattern = r"(?<!\n)\n(?!\n)"
-    # also add line-breaks after <number><periods> for claims (as they are all numbered).
-    list_pattern = r"(\s\d+\.\s)"
-    text = re.sub(new_line_pattern, " ", text)
+    text = re.sub(new_line_pattern, " ", text).strip()
     if claims:
-        text = re.sub(list_pattern, r"\n\1", text)
+        text = re.sub(CLAIM_NUMBER, r"\n\1", text)
     return text
 
 
-# from: https://stackoverflow.com/a/74749075/19355181
-def parallel_apply(claims: bool, max_concurrency: int, column: pl.Series) -> pl.Series:
+def parse_html(claims: bool, html_string: str) -> str:
+    if not html_string:
+        return ""
+    return clean_text(claims, get_pool().convert(html_string, "plain", "html"))
+
+
+def needs_pandoc(html: pl.Expr) -> pl.Expr:
+    """Rows whose markup can't be stripped with regexes."""
+    return html.str.contains(PANDOC_TAG) | (
+        html.str.count_matches(ENTITY) > html.str.count_matches(KNOWN_ENTITY)
+    )
+
+
+def strip_html(html: pl.Expr, claims: bool) -> pl.Expr:
+    """Convert html to text like pandoc does, as a vectorized polars expression.
+
+    Whitespace is collapsed, block tags become paragraph breaks and all other
+    tags are removed, without adding spaces, like pandoc does for inline tags.
+    """
+    text = (
+        html.str.replace_all(COMMENT, "")
+        .str.replace_all(WHITESPACE, " ")
+        .str.replace_all(BREAK_TAG, " ")
+        .str.replace_all(BLOCK_TAG, "\n\n")
+        .str.replace_all(TAG, "")
+    )
+    for entity, char in ENTITIES.items():
+        text = text.str.replace_all(entity, char, literal=True)
+    text = text.str.replace_all(PARAGRAPH_BREAK, "\n\n").str.strip_chars(" \n")
     if claims:
-        fn = partial(parse_html, True)
-    else:
-        fn = partial(parse_html, False)
+        text = text.str.replace_all(CLAIM_NUMBER, "\n${1}")
+    return text
+
+
+def pandoc_batch(claims: bool, max_concurrency: int, column: pl.Series) -> pl.Series:
+    """Convert the non-null rows with the shared pandoc workers."""
     if max_concurrency == 0:
-        max_concurrency = None
-    # polars mainly handles the concurrency but the pandoc calls add as a blocker. This is a workaround to
-    # increase the concurrency of the pandoc calls.
-    with multiprocessing.get_context("spawn").Pool(max_concurrency) as pool:
-        return pl.Series(pool.imap(fn, track(column, description="Processing column")))
+        max_concurrency = os.cpu_count()
+    htmls = [(i, html) for i, html in enumerate(column) if html]
+    texts = get_pool(max_concurrency).convert_batch(
+        [html for _, html in htmls], "plain", "html", raise_errors=False
+    )
+    results = [None] * len(column)
+    for (i, _), text in zip(htmls, texts):
+        if text is not None:
+            results[i] = clean_text(claims, text)
+    return pl.Series(results, dtype=pl.String)
+
+
+def html_to_text(column: str, claims: bool, max_concurrency: int) -> pl.Expr:
+    """Strip html with polars, only rows that need it are sent to pandoc.
+
+    Everything is an expression, so the query can still run on the streaming
+    engine. If pandoc fails, the regex version is used.
+    """
+    html = pl.col(column)
+    fallback = (
+        pl.when(needs_pandoc(html))
+        .then(html)
+        .map_batches(
+            lambda s: pandoc_batch(claims, max_concurrency, s),
+            return_dtype=pl.String,
+            is_elementwise=True,
+        )
+    )
+    return pl.coalesce(fallback, strip_html(html, claims)).fill_null("").alias(column)
@@ -45,7 +45,7 @@ parser.add_argument(
 )
 parser.add_argument("--meta", help="Location to save dolma processing metadata.")
 
-logs.configure_logging(level="DEBUG")
+logs.configure_logging(level="DEBUG", asynchronous=True)
 
 
 class CaptureMatches:
@@ -0,0 +1,78 @@
+"""Benchmark the multi-process jsonl reader used for tokenizer training.
+
+Writes synthetic .jsonl.gz shards to a temp dir and reports docs/sec for each
+number of reader processes, i.e.,
+
+    python benchmark_reader.py --num_files 32 --workers 1 2 4 8
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import string
+import tempfile
+import time
+import zlib
+
+from train import load_jsonl_data
+
+from common_pile import logs
+
+parser = argparse.ArgumentParser(description="Benchmark the tokenizer data reader.")
+parser.add_argument("--num_files", default=16, type=int, help="Number of shards.")
+parser.add_argument(
+    "--docs_per_file", default=5_000, type=int, help="Documents in each shard."
+)
+parser.add_argument(
+    "--doc_length", default=2_000, type=int, help="Characters in each document."
+)
+parser.add_argument("--batch_size", default=100, type=int, help="Reader batch size.")
+parser.add_argument(
+    "--workers",
+    nargs="+",
+    default=[1, 2, 4, 8],
+    type=int,
+    help="The numbers of reader processes to time.",
+)
+parser.add_argument("--seed", default=42, type=int, help="Seed for shard order.")
+
+
+def make_shards(data_dir: str, num_files: int, docs_per_file: int, doc_length: int):
+    rng = random.Random(0)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=6)) for _ in range(1000)]
+    for i in range(num_files):
+        with gzip.open(os.path.join(data_dir, f"{i:05d}.jsonl.gz"), "wt") as wf:
+            for j in range(docs_per_file):
+                text = " ".join(rng.choices(words, k=doc_length // 7))
+                wf.write(json.dumps({"id": f"{i}-{j}", "text": text}) + "\n")
+
+
+def main():
+    args = parser.parse_args()
+    logs.configure_logging(level="WARNING")
+    with tempfile.TemporaryDirectory() as data_dir:
+        make_shards(data_dir, args.num_files, args.docs_per_file, args.doc_length)
+        pattern = os.path.join(data_dir, "*.jsonl.gz")
+        baseline = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            docs = 0
+            checksum = 0
+            for batch in load_jsonl_data(
+                pattern, args.batch_size, num_workers=workers, seed=args.seed
+            ):
+                docs += len(batch)
+                checksum = zlib.crc32(batch[0].encode(), checksum)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or docs / elapsed
+            print(
+                f"workers={workers:<3d} docs={docs} seconds={elapsed:.2f} "
+                f"docs/sec={docs / elapsed:,.0f} speedup={docs / elapsed / baseline:.2f}x "
+                f"order={checksum:08x}"
+            )
+
+
+if __name__ == "__main__":
+    main()
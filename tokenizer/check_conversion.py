@@ -0,0 +1,188 @@
+"""Check that a converted tiktoken tokenizer matches the HuggingFace original.
+
+Streams a local dolma sample through both tokenizers in parallel, with batch
+encoding, and reports mismatches and the throughput of each tokenizer, i.e.,
+
+    python check_conversion.py --hf tokenizer.json --data_pattern "sample/*.jsonl.gz"
+
+Unlike `verify_conversion.py`, this doesn't need the reference llama code.
+"""
+
+import argparse
+import functools
+import glob
+import json
+import multiprocessing as mp
+import sys
+import time
+from typing import Dict, List
+
+import hf_to_tiktoken
+import smart_open
+import tokenizers
+
+from common_pile import logs
+
+parser = argparse.ArgumentParser(
+    description="Compare a HuggingFace tokenizer to its tiktoken conversion."
+)
+parser.add_argument("--hf", required=True, help="Path to the HF tokenizer.json.")
+parser.add_argument(
+    "--data_pattern", required=True, help="A glob of jsonl.gz files to check with."
+)
+parser.add_argument(
+    "--batch_size", type=int, default=256, help="Documents encoded at once."
+)
+parser.add_argument(
+    "--limit",
+    type=int,
+    default=-1,
+    help="Max documents to check from each file. Use -1 for all of them.",
+)
+parser.add_argument(
+    "--max_mismatches",
+    type=int,
+    default=20,
+    help="How many mismatched examples to include in the report.",
+)
+parser.add_argument(
+    "--processes",
+    type=int,
+    default=mp.cpu_count(),
+    help="Number of processes, each checks whole files.",
+)
+
+
+def first_difference(a: List[int], b: List[int]) -> int:
+    for i, (x, y) in enumerate(zip(a, b)):
+        if x != y:
+            return i
+    return min(len(a), len(b))
+
+
+@functools.cache
+def load_tokenizers(hf_path: str):
+    """Load (once per worker) the HF tokenizer and convert it."""
+    hf = tokenizers.Tokenizer.from_file(hf_path)
+    with open(hf_path) as f:
+        tt = hf_to_tiktoken.convert_hf_config_to_tiktoken("converted", json.load(f))
+    return hf, tt
+
+
+def check_batch(hf, tt, batch, stats, max_mismatches):
+    texts = [text for _, text in batch]
+    start = time.perf_counter()
+    hf_tokens = [e.ids for e in hf.encode_batch(texts, add_special_tokens=False)]
+    stats["hf_seconds"] += time.perf_counter() - start
+    start = time.perf_counter()
+    # The worker processes are our parallelism, don't also use threads.
+    tt_tokens = tt.encode_ordinary_batch(texts, num_threads=1)
+    stats["tt_seconds"] += time.perf_counter() - start
+    for (example_id, text), h, t in zip(batch, hf_tokens, tt_tokens):
+        stats["documents"] += 1
+        stats["bytes"] += len(text.encode("utf-8"))
+        stats["tokens"] += len(h)
+        if h != t:
+            stats["mismatches"] += 1
+            if len(stats["examples"]) < max_mismatches:
+                i = first_difference(h, t)
+                stats["examples"].append(
+                    {
+                        "id": example_id,
+                        "position": i,
+                        "hf": h[max(i - 2, 0) : i + 3],
+                        "tt": t[max(i - 2, 0) : i + 3],
+                        "text": hf.decode(h[max(i - 2, 0) : i + 3]),
+                    }
+                )
+
+
+def check_file(
+    file_path: str,
+    hf_path: str,
+    batch_size: int = 256,
+    limit: int = -1,
+    max_mismatches: int = 20,
+) -> Dict:
+    """Encode a file with both tokenizers, returning counts, timings, and mismatches."""
+    logger = logs.get_logger()
+    logger.info(f"Checking {file_path}")
+    hf, tt = load_tokenizers(hf_path)
+    stats = {
+        "documents": 0,
+        "bytes": 0,
+        "tokens": 0,
+        "mismatches": 0,
+        "hf_seconds": 0.0,
+        "tt_seconds": 0.0,
+        "examples": [],
+    }
+    batch = []
+    with smart_open.open(file_path) as f:
+        for i, line in enumerate(f):
+            if i == limit:
+                break
+            if not line.strip():
+                continue
+            example = json.loads(line)
+            batch.append((example.get("id"), example["text"]))
+            if len(batch) == batch_size:
+                check_batch(hf, tt, batch, stats, max_mismatches)
+                batch = []
+    if batch:
+        check_batch(hf, tt, batch, stats, max_mismatches)
+    for example in stats["examples"]:
+        example["file"] = file_path
+    return stats
+
+
+def main(args):
+    logger = logs.configure_logging()
+    file_paths = sorted(glob.glob(args.data_pattern))
+    if not file_paths:
+        raise ValueError(f"No files match {args.data_pattern}")
+    report = {
+        "files": 0,
+        "documents": 0,
+        "bytes": 0,
+        "tokens": 0,
+        "mismatches": 0,
+        "hf_seconds": 0.0,
+        "tt_seconds": 0.0,
+        "examples": [],
+    }
+    start = time.perf_counter()
+    check = functools.partial(
+        check_file,
+        hf_path=args.hf,
+        batch_size=args.batch_size,
+        limit=args.limit,
+        max_mismatches=args.max_mismatches,
+    )
+    with mp.Pool(args.processes) as pool:
+        for stats in pool.imap_unordered(check, file_paths):
+            report["files"] += 1
+            for key, value in stats.items():
+                if key == "examples":
+                    report[key].extend(value[: args.max_mismatches - len(report[key])])
+                else:
+                    report[key] += value
+    elapsed = time.perf_counter() - start
+    report["seconds"] = elapsed
+    report["documents_per_second"] = report["documents"] / elapsed
+    # Per tokenizer rates are for a single process.
+    for name in ("hf", "tt"):
+        seconds = report[f"{name}_seconds"]
+        report[f"{name}_bytes_per_second"] = report["bytes"] / seconds if seconds else 0
+    print(json.dumps(report, indent=2))
+    if report["mismatches"]:
+        logger.error(
+            f"{report['mismatches']} of {report['documents']} documents don't match."
+        )
+        sys.exit(1)
+    logger.info(f"All {report['documents']} documents match.")
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    main(args)
@@ -107,6 +107,15 @@ class HFTokenizer(l_tokenizer.Tokenizer):
             encoded = encoded + [self.eos_id]
         return encoded
 
+    def encode_batch(
+        self, strings: Sequence[str], add_bos: bool, add_eos: bool
+    ) -> List[List[int]]:
+        """Convert many strings to tokens at once, the encoding is done in parallel in rust."""
+        encoded = self.hf_tokenizer.encode_batch(strings, add_special_tokens=False)
+        bos = [self.bos_id] if add_bos else []
+        eos = [self.eos_id] if add_eos else []
+        return [bos + e.ids + eos for e in encoded]
+
     def decode(self, tokens: List[int]):
         """Convert a list of tokens to a stirng."""
         return self.hf_tokenizer.decode(tokens)
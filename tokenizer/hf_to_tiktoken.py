@@ -5,6 +5,7 @@ tiktoken.load.dump_tiktoken_bpe function.
 """
 
 import argparse
+import functools
 import json
 import os
 import tempfile
@@ -51,6 +52,7 @@ def extract_special_tokens(config):
 
 
 # Copied from transformers.models.gpt2.tokenization_gpt2.bytes_to_unicode
+@functools.cache
 def bytes_to_unicode():
     """
     Returns list of utf-8 byte and a mapping to unicode strings. We specifically avoids mapping to whitespace/control
@@ -77,21 +79,27 @@ def bytes_to_unicode():
     return dict(zip(bs, cs))
 
 
+@functools.cache
+def unicode_to_bytes_table():
+    """A `str.translate` table that maps the proxy unicode values back to bytes.
+
+    Each byte `b` is mapped to `chr(b)` so that encoding with latin-1 gives
+    the raw bytes.
+    """
+    return {ord(v): k for k, v in bytes_to_unicode().items()}
+
+
 def extract_merges(config):
-    """Create the merges from the vocabulary."""
-    unicode_to_bytes = {v: k for k, v in bytes_to_unicode().items()}
-
-    merges = {}
-    for word in config["model"]["vocab"]:
-        tt_word = []
-        # Undo the monkeying they do that maps tiktoken byte level things into
-        # proxy unicode values.
-        for c in word:
-            if c != " ":
-                c = chr(unicode_to_bytes[c])
-            tt_word.append(c.encode("latin-1"))
-        merges[b"".join(tt_word)] = len(merges)
-    return merges
+    """Create the merges from the vocabulary.
+
+    Undo the monkeying they do that maps tiktoken byte level things into
+    proxy unicode values. Using a translation table does this for each word
+    in a single C level pass instead of character by character.
+    """
+    table = unicode_to_bytes_table()
+    words = (w.translate(table).encode("latin-1") for w in config["model"]["vocab"])
+    # Duplicates keep their first rank.
+    return {word: rank for rank, word in enumerate(dict.fromkeys(words))}
 
 
 def extract_hf_config(tokenizer: tokenizers.Tokenizer) -> dict:
@@ -148,7 +156,8 @@ if __name__ == "__main__":
     )
     parser.add_argument("--hf", help="Path to the HuggingFace tokenizer.")
     parser.add_argument("--tt", help="Where to save the TikToken tokenizer.")
+    args = parser.parse_args()
 
-    hf = tokenizers.Tokenizers.from_file(args.hf)
+    hf = tokenizers.Tokenizer.from_file(args.hf)
     tt = convert_hf_to_tiktoken("this-is-not-saved-so-it-doesn't-matter", hf)
-    tiktoken.load.dump_tiktoken_bpe(tt._mergable_ranks, args.tt)
+    tiktoken.load.dump_tiktoken_bpe(tt._mergeable_ranks, args.tt)
@@ -0,0 +1,277 @@
+"""Tokenize dolma shards into numpy token files so they only need to be tokenized once.
+
+Each input shard `x.jsonl.gz` becomes
+
+  * `x.bin`: The tokens of every document, back to back, as a flat array.
+  * `x.idx.npy`: int64 offsets into `x.bin`, document `i` is `tokens[offsets[i]:offsets[i + 1]]`.
+  * `x.ids.jsonl`: The id of each document, in the same order.
+  * `x.json`: The dtype and counts, written last so it marks the shard as done.
+
+`TokenShard` reads these back with `np.memmap`, so there is no parsing.
+"""
+
+import argparse
+import functools
+import json
+import multiprocessing as mp
+import os
+import re
+from queue import Queue
+from typing import Callable, Dict, Iterator, List, Sequence
+
+import numpy as np
+import smart_open
+
+from common_pile import logs, utils
+from common_pile.write import ShardParallelProcessor, create_shadow
+
+parser = argparse.ArgumentParser(description="Tokenize dolma data into numpy files.")
+parser.add_argument(
+    "--input",
+    required=True,
+    help="The input version, this directory should be where the `documents` dir lives.",
+)
+parser.add_argument(
+    "--output",
+    required=True,
+    help="Where the token files are saved, mirroring the input shard names.",
+)
+parser.add_argument("--tokenizer", required=True, help="Path to the HF tokenizer.")
+parser.add_argument(
+    "--filename",
+    default="*.jsonl.gz",
+    help="The filename to match with globs, probably needs to be escaped.",
+)
+parser.add_argument(
+    "--batch_size", type=int, default=512, help="Documents to encode at once."
+)
+parser.add_argument(
+    "--add_bos", action="store_true", help="Add a bos token to each document."
+)
+parser.add_argument(
+    "--add_eos", action="store_true", help="Add an eos token to each document."
+)
+parser.add_argument(
+    "--overwrite",
+    action="store_true",
+    help="Should we overwrite previously tokenized shards?",
+)
+parser.add_argument(
+    "--processes",
+    type=int,
+    default=mp.cpu_count(),
+    help="Number of processors for multicore.",
+)
+parser.add_argument("--meta", help="Location to save dolma processing metadata.")
+
+
+def token_dtype(vocab_size: int) -> np.dtype:
+    """The smallest unsigned dtype that fits every token id."""
+    return np.dtype(np.uint16 if vocab_size <= 2**16 else np.uint32)
+
+
+def shard_base(path: str) -> str:
+    """`.../x.jsonl.gz` -> `.../x`, the prefix for all of a shard's token files."""
+    return re.sub(r"\.jsonl?(\.gz)?$", "", path)
+
+
+@functools.cache
+def load_hf_tokenizer(path: str):
+    """Load the HFTokenizer once per worker process."""
+    from hf_lingua import HFTokenizer
+
+    return HFTokenizer(path)
+
+
+class TokenShard:
+    """Read the token files for a single shard without parsing anything."""
+
+    def __init__(self, base: str):
+        self.base = shard_base(base)
+        with open(f"{self.base}.json") as f:
+            self.meta = json.load(f)
+        self.offsets = np.load(f"{self.base}.idx.npy", mmap_mode="r")
+        if self.meta["tokens"]:
+            self.tokens = np.memmap(
+                f"{self.base}.bin", dtype=self.meta["dtype"], mode="r"
+            )
+        else:
+            # Empty files can't be memory mapped.
+            self.tokens = np.zeros(0, dtype=self.meta["dtype"])
+        self._ids = None
+        self._index = None
+
+    @property
+    def ids(self) -> List:
+        if self._ids is None:
+            with open(f"{self.base}.ids.jsonl") as f:
+                self._ids = [json.loads(line) for line in f]
+        return self._ids
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        return self.tokens[self.offsets[i] : self.offsets[i + 1]]
+
+    def get(self, doc_id) -> np.ndarray:
+        """The tokens for the document with id `doc_id`."""
+        if self._index is None:
+            self._index = {d: i for i, d in enumerate(self.ids)}
+        return self[self._index[doc_id]]
+
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+
+class TokenizeParallel(ShardParallelProcessor):
+    """Batch encode each shard and write the tokens to numpy files.
+
+    Unlike other `ShardParallelProcessor`s, the output isn't dolma, so
+    `process_single` is replaced and `process_example` is only used to pick
+    the text to tokenize.
+    """
+
+    @classmethod
+    def increment_progressbar(
+        cls,
+        queue: Queue,
+        /,
+        shards: int = 0,
+        documents: int = 0,
+        tokens: int = 0,
+    ):
+        return super(ShardParallelProcessor, cls).increment_progressbar(
+            queue, shards=shards, documents=documents, tokens=tokens
+        )
+
+    @classmethod
+    def process_example(cls, example, **kwargs):
+        return example
+
+    @classmethod
+    def encode(cls, tokenizer, batch: Sequence[Dict], add_bos: bool, add_eos: bool):
+        return tokenizer.encode_batch(
+            [example["text"] for example in batch], add_bos=add_bos, add_eos=add_eos
+        )
+
+    @classmethod
+    def read_batches(
+        cls, source_path: str, batch_size: int, **kwargs
+    ) -> Iterator[List[Dict]]:
+        logger = cls.get_logger()
+        batch = []
+        with smart_open.open(source_path) as f:
+            for i, line in enumerate(f):
+                with logger(line=i):
+                    try:
+                        data = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(
+                            "Failed to parse JSON from `%s...`",
+                            line[:80],
+                            exc_info=True,
+                        )
+                        continue
+                    data = cls.process_example(
+                        data, source_file=source_path, line_number=i, **kwargs
+                    )
+                    if data is None:
+                        continue
+                    batch.append(data)
+                    if len(batch) == batch_size:
+                        yield batch
+                        batch = []
+        if batch:
+            yield batch
+
+    @classmethod
+    def process_single(
+        cls,
+        source_path: str,
+        destination_path: str,
+        queue: Queue,
+        **kwargs,
+    ):
+        logger = cls.get_logger()
+        overwrite = kwargs.pop("overwrite", False)
+        shadow = kwargs.pop("shadow", True)
+        tokenizer_path = kwargs.pop("tokenizer")
+        load_tokenizer: Callable = kwargs.pop("load_tokenizer", load_hf_tokenizer)
+        batch_size = kwargs.pop("batch_size", 512)
+        add_bos = kwargs.pop("add_bos", False)
+        add_eos = kwargs.pop("add_eos", False)
+        # These only make sense for the jsonl.gz outputs of the parent.
+        for key in ("update_interval", "debug", "report_metrics", "profile_dir"):
+            kwargs.pop(key, None)
+        if kwargs.pop("profile", False):
+            logger.warning("Profiling isn't supported when tokenizing, ignoring.")
+        base = shard_base(destination_path)
+        with logger(file=source_path):
+            if not overwrite and os.path.exists(f"{base}.json"):
+                logger.info("%s already exists, skipping", base)
+                cls.increment_progressbar(queue, shards=1)
+                return
+            os.makedirs(os.path.dirname(base), exist_ok=True)
+            tokenizer = load_tokenizer(tokenizer_path)
+            dtype = token_dtype(tokenizer.n_words)
+            tmp = create_shadow(base) if shadow else base
+            offsets = [0]
+            ids = []
+            with open(f"{tmp}.bin", "wb") as wf:
+                for batch in cls.read_batches(source_path, batch_size, **kwargs):
+                    encoded = cls.encode(tokenizer, batch, add_bos, add_eos)
+                    for example, tokens in zip(batch, encoded):
+                        np.asarray(tokens, dtype=dtype).tofile(wf)
+                        offsets.append(offsets[-1] + len(tokens))
+                        ids.append(example.get("id"))
+                    cls.increment_progressbar(
+                        queue,
+                        documents=len(batch),
+                        tokens=sum(len(t) for t in encoded),
+                    )
+            np.save(f"{tmp}.idx.npy", np.asarray(offsets, dtype=np.int64))
+            with open(f"{tmp}.ids.jsonl", "w") as wf:
+                wf.writelines(json.dumps(i) + "\n" for i in ids)
+            if shadow:
+                for suffix in (".bin", ".idx.npy", ".ids.jsonl"):
+                    os.rename(f"{tmp}{suffix}", f"{base}{suffix}")
+            with open(f"{base}.json", "w") as wf:
+                json.dump(
+                    {
+                        "dtype": dtype.name,
+                        "documents": len(ids),
+                        "tokens": offsets[-1],
+                        "tokenizer": tokenizer_path,
+                        "add_bos": add_bos,
+                        "add_eos": add_eos,
+                    },
+                    wf,
+                )
+            logger.info("Tokenized %d documents into %d tokens", len(ids), offsets[-1])
+            cls.increment_progressbar(queue, shards=1)
+
+
+def main(args):
+    with utils.maybe_temp_dir(args.meta) as meta_dir:
+        processor = TokenizeParallel(
+            source_prefix=utils.dolma_input(args.input, args.filename),
+            destination_prefix=args.output,
+            metadata_prefix=meta_dir,
+            num_processes=args.processes,
+        )
+        processor(
+            tokenizer=args.tokenizer,
+            batch_size=args.batch_size,
+            add_bos=args.add_bos,
+            add_eos=args.add_eos,
+            overwrite=args.overwrite,
+        )
+
+
+if __name__ == "__main__":
+    # Dolma examples use spawn over fork, unsure why but lets follow them.
+    mp.set_start_method("spawn")
+    args = parser.parse_args()
+    logs.configure_logging()
+    main(args)
@@ -0,0 +1,116 @@
+"""Tests for tokenizing dolma shards into numpy files."""
+
+import gzip
+import json
+import queue
+
+import pytest
+
+tokenizers = pytest.importorskip("tokenizers")
+
+from pack_tokens import TokenizeParallel, TokenShard
+
+
+class LocalTokenizer:
+    """Same interface as `HFTokenizer` without needing lingua."""
+
+    def __init__(self, path):
+        self.hf_tokenizer = tokenizers.Tokenizer.from_file(path)
+        self.n_words = self.hf_tokenizer.get_vocab_size()
+        self.bos_id = self.hf_tokenizer.token_to_id("<bos>")
+        self.eos_id = self.hf_tokenizer.token_to_id("</s>")
+
+    def encode_batch(self, strings, add_bos, add_eos):
+        encoded = self.hf_tokenizer.encode_batch(strings, add_special_tokens=False)
+        return [
+            [self.bos_id] * add_bos + e.ids + [self.eos_id] * add_eos for e in encoded
+        ]
+
+
+@pytest.fixture
+def tokenizer_path(tmp_path):
+    tokenizer = tokenizers.Tokenizer(tokenizers.models.BPE(unk_token="<unk>"))
+    tokenizer.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    trainer = tokenizers.trainers.BpeTrainer(
+        vocab_size=100, special_tokens=["<unk>", "<bos>", "</s>"]
+    )
+    tokenizer.train_from_iterator(["the cat sat on the mat"] * 10, trainer=trainer)
+    path = str(tmp_path / "tokenizer.json")
+    tokenizer.save(path)
+    return path
+
+
+def test_tokenize_shard_round_trips(tmp_path, tokenizer_path):
+    texts = ["the cat", "sat on the mat", "", "the mat"]
+    source = tmp_path / "documents" / "00000_test.jsonl.gz"
+    source.parent.mkdir()
+    with gzip.open(source, "wt") as wf:
+        for i, text in enumerate(texts):
+            wf.write(json.dumps({"id": f"doc-{i}", "text": text}) + "\n")
+
+    TokenizeParallel.process_single(
+        str(source),
+        str(tmp_path / "tokens" / "00000_test.jsonl.gz"),
+        queue.Queue(),
+        tokenizer=tokenizer_path,
+        load_tokenizer=LocalTokenizer,
+        batch_size=3,
+        add_eos=True,
+    )
+
+    tokenizer = LocalTokenizer(tokenizer_path)
+    shard = TokenShard(str(tmp_path / "tokens" / "00000_test"))
+    assert len(shard) == len(texts)
+    assert shard.tokens.dtype.name == "uint16"
+    assert shard.ids == [f"doc-{i}" for i in range(len(texts))]
+    for i, text in enumerate(texts):
+        expected = tokenizer.encode_batch([text], add_bos=False, add_eos=True)[0]
+        assert shard[i].tolist() == expected
+    assert shard.get("doc-1").tolist()[-1] == tokenizer.eos_id
+    assert shard.lengths().tolist() == [len(shard[i]) for i in range(len(texts))]
+
+
+@pytest.fixture
+def hf_tokenizer(tokenizer_path):
+    """The real `HFTokenizer`, which needs lingua and transformers."""
+    pytest.importorskip("transformers")
+    hf_lingua = pytest.importorskip("hf_lingua")
+    return hf_lingua.HFTokenizer(tokenizer_path)
+
+
+@pytest.mark.parametrize("add_bos", [False, True])
+@pytest.mark.parametrize("add_eos", [False, True])
+def test_hf_tokenizer_encode_batch(hf_tokenizer, add_bos, add_eos):
+    assert hf_tokenizer.bos_id == hf_tokenizer.hf_tokenizer.token_to_id("<bos>")
+    assert hf_tokenizer.eos_id == hf_tokenizer.hf_tokenizer.token_to_id("</s>")
+    texts = ["the cat", "", "sat on the mat", "the mat"]
+    batch = hf_tokenizer.encode_batch(texts, add_bos=add_bos, add_eos=add_eos)
+    assert batch == [hf_tokenizer.encode(t, add_bos, add_eos) for t in texts]
+    for text, tokens in zip(texts, batch):
+        assert (tokens[:1] == [hf_tokenizer.bos_id]) == add_bos
+        assert (tokens[-1:] == [hf_tokenizer.eos_id]) == add_eos
+        assert hf_tokenizer.decode(tokens) == text
+
+
+def test_tokenize_shard_with_hf_tokenizer(tmp_path, tokenizer_path, hf_tokenizer):
+    texts = ["the cat", "sat on the mat", "", "the mat", "the cat sat"]
+    source = tmp_path / "documents" / "00000_test.jsonl.gz"
+    source.parent.mkdir()
+    with gzip.open(source, "wt") as wf:
+        for i, text in enumerate(texts):
+            wf.write(json.dumps({"id": f"doc-{i}", "text": text}) + "\n")
+
+    # The default loader, with batches that don't divide the shard evenly.
+    TokenizeParallel.process_single(
+        str(source),
+        str(tmp_path / "tokens" / "00000_test.jsonl.gz"),
+        queue.Queue(),
+        tokenizer=tokenizer_path,
+        batch_size=2,
+        add_eos=True,
+    )
+
+    shard = TokenShard(str(tmp_path / "tokens" / "00000_test"))
+    assert [shard[i].tolist() for i in range(len(texts))] == [
+        hf_tokenizer.encode(text, add_bos=False, add_eos=True) for text in texts
+    ]
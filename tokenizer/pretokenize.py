@@ -0,0 +1,276 @@
+"""Cache pre-token frequency counts so tokenizers can be retrained without re-reading the corpus.
+
+Pre-tokenization (normalization, digit splitting and the `PATTERN_STRINGS`
+regex) doesn't depend on the vocab size or special tokens, so a sweep over
+those can reuse the counts. The cache is keyed by the data files (their
+names, sizes, and modification times) and the pre-tokenization settings, i.e.,
+
+    python pretokenize.py --data_pattern "data/*.jsonl.gz" --cache_dir cache --pattern_string tiktoken
+
+and `train.py --pretoken_cache cache` with the same settings will use it (or
+build it if it doesn't exist yet).
+
+For unigram, SentencePiece is trained on these pre-tokens, so unlike training
+from raw text (where `train.py` ignores `--pattern_string` for unigram) the
+regex does shape the vocabulary.
+"""
+
+import argparse
+import collections
+import functools
+import glob
+import hashlib
+import json
+import multiprocessing as mp
+import os
+from typing import Dict, Iterator, List, Tuple
+
+import smart_open
+
+from common_pile import logs
+
+# Bump if the way counts are made changes so old caches aren't used.
+CACHE_VERSION = 3
+
+# How many tokens, per unique pre-token, are replayed to the BPE trainer by default.
+REPLAY_FACTOR = 10
+
+parser = argparse.ArgumentParser(description="Build a pre-token frequency cache.")
+parser.add_argument(
+    "--data_pattern", required=True, help="A glob of jsonl.gz files to count."
+)
+parser.add_argument(
+    "--cache_dir", required=True, help="Where pre-token caches are stored."
+)
+parser.add_argument(
+    "--pattern_string",
+    choices=["none", "tiktoken", "gpt2", "tiktoken+digits"],
+    default="tiktoken",
+    help="The regex used to pre-split text.",
+)
+parser.add_argument(
+    "--split_digits",
+    action="store_true",
+    help="Should we split numbers into individual digits, i.e., 1234 -> 1 2 3 4",
+)
+parser.add_argument(
+    "--normalize",
+    action="store_true",
+    help="Should we apply NFKC Unicode normalization before pre-tokenization?",
+)
+parser.add_argument(
+    "--processes",
+    type=int,
+    default=mp.cpu_count(),
+    help="Number of processes used to count shards.",
+)
+
+
+def cache_settings(
+    data_pattern: str,
+    pattern_string: str | None,
+    split_digits: bool,
+    normalize: bool,
+) -> Dict:
+    files = sorted(glob.glob(data_pattern))
+    return {
+        "version": CACHE_VERSION,
+        "files": files,
+        # Shards regenerated in place keep their names, so they are also
+        # keyed by their size and modification time.
+        "stats": [[os.path.getsize(f), os.path.getmtime(f)] for f in files],
+        "pattern_string": pattern_string,
+        "split_digits": split_digits,
+        "normalize": normalize,
+    }
+
+
+def cache_path(cache_dir: str, settings: Dict) -> str:
+    """The cache for some settings lives in a directory named by their hash."""
+    key = hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return os.path.join(cache_dir, key.hexdigest()[:16])
+
+
+def build_pre_tokenizer(
+    pattern_string: str | None, split_digits: bool, normalize: bool
+):
+    """The normalizer and pre-tokenizer `train_bpe` uses, minus the ByteLevel mapping."""
+    from tokenizers import Regex, normalizers, pre_tokenizers
+
+    steps = []
+    if split_digits:
+        steps.append(pre_tokenizers.Digits(individual_digits=True))
+    if pattern_string is not None:
+        steps.append(pre_tokenizers.Split(Regex(pattern_string), behavior="isolated"))
+    normalizer = normalizers.NFKC() if normalize else None
+    return normalizer, pre_tokenizers.Sequence(steps)
+
+
+def count_shard(
+    file_path: str,
+    pattern_string: str | None,
+    split_digits: bool,
+    normalize: bool,
+) -> Tuple[collections.Counter, int]:
+    """Count the pre-tokens in a single .jsonl.gz file."""
+    logger = logs.get_logger()
+    logger.info(f"Counting pre-tokens in {file_path}")
+    normalizer, pre_tokenizer = build_pre_tokenizer(
+        pattern_string, split_digits, normalize
+    )
+    counts = collections.Counter()
+    documents = 0
+    with smart_open.open(file_path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            text = json.loads(line)["text"]
+            if normalizer is not None:
+                text = normalizer.normalize_str(text)
+            counts.update(t for t, _ in pre_tokenizer.pre_tokenize_str(text))
+            documents += 1
+    return counts, documents
+
+
+def build_cache(
+    cache_dir: str,
+    settings: Dict,
+    processes: int = 1,
+) -> str:
+    """Count pre-tokens over all files in parallel and save them to the cache."""
+    logger = logs.get_logger()
+    path = cache_path(cache_dir, settings)
+    if settings["pattern_string"] is None:
+        raise ValueError("Caching pre-tokens requires a --pattern_string.")
+    if not settings["files"]:
+        raise ValueError("No files to build the pre-token cache from.")
+    logger.info(f"Building pre-token cache in {path}")
+    counts = collections.Counter()
+    documents = 0
+    count = functools.partial(
+        count_shard,
+        pattern_string=settings["pattern_string"],
+        split_digits=settings["split_digits"],
+        normalize=settings["normalize"],
+    )
+    with mp.Pool(processes) as pool:
+        for shard_counts, shard_documents in pool.imap_unordered(
+            count, settings["files"]
+        ):
+            counts.update(shard_counts)
+            documents += shard_documents
+    os.makedirs(path, exist_ok=True)
+    # The settings are written last, so their existence marks a complete cache.
+    with smart_open.open(os.path.join(path, "counts.jsonl.gz"), "w") as wf:
+        for token, c in counts.most_common():
+            wf.write(json.dumps([token, c]) + "\n")
+    with open(os.path.join(path, "settings.json"), "w") as wf:
+        json.dump(
+            {
+                **settings,
+                "documents": documents,
+                "pre_tokens": len(counts),
+                "tokens": sum(counts.values()),
+            },
+            wf,
+        )
+    logger.info(f"Saved {len(counts)} unique pre-tokens from {documents} documents.")
+    return path
+
+
+def get_cache(cache_dir: str, settings: Dict, processes: int = 1) -> str:
+    """Find the cache for these settings, building it if needed."""
+    path = cache_path(cache_dir, settings)
+    if os.path.exists(os.path.join(path, "settings.json")):
+        logs.get_logger().info(f"Using pre-token cache {path}")
+        return path
+    return build_cache(cache_dir, settings, processes)
+
+
+def load_counts(path: str) -> Iterator[Tuple[str, int]]:
+    """Read (pre-token, count) pairs from a cache, most frequent first."""
+    with smart_open.open(os.path.join(path, "counts.jsonl.gz")) as f:
+        for line in f:
+            token, count = json.loads(line)
+            yield token, count
+
+
+def replay_scale(path: str, replay_factor: int = REPLAY_FACTOR) -> int:
+    """Pick a `scale` so about `replay_factor` tokens are replayed per unique pre-token.
+
+    Replaying the counts as is still feeds the trainer every token in the
+    corpus, this makes the work proportional to the number of unique
+    pre-tokens instead.
+    """
+    with open(os.path.join(path, "settings.json")) as f:
+        settings = json.load(f)
+    return max(
+        1, settings["tokens"] // (replay_factor * max(settings["pre_tokens"], 1))
+    )
+
+
+def pretokenized_iterator(
+    path: str, batch_size: int = 1000, scale: int = 1
+) -> Iterator[List[str]]:
+    """Replay the cached counts for `train_from_iterator`.
+
+    The HF trainers only take text, so each pre-token is repeated `count`
+    times (the trainer counts them back up). With `scale == 1` this gives the
+    same merges as training on the text, but every token in the corpus is
+    replayed. With `scale > 1` the counts are divided (rounding down) first.
+    This is an approximation: relative frequencies are kept, so the frequent
+    merges are the same, but pre-tokens seen fewer than `scale` times are
+    dropped and ties between rare pairs can be broken differently.
+    """
+    batch = []
+    for token, count in load_counts(path):
+        count //= scale
+        if not count:
+            # Counts are sorted, so everything after is also 0.
+            break
+        while count:
+            n = min(count, batch_size - len(batch))
+            batch.extend([token] * n)
+            count -= n
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def write_sentencepiece_tsv(path: str) -> str:
+    """Write the counts in the `word\\tcount` format SentencePiece can train from."""
+    tsv_path = os.path.join(path, "sentencepiece.tsv")
+    if os.path.exists(tsv_path):
+        return tsv_path
+    skipped = 0
+    with open(f"{tsv_path}.tmp", "w") as wf:
+        for token, count in load_counts(path):
+            # These would break the format, SentencePiece splits on whitespace
+            # anyway and the newlines are user defined symbols.
+            if "\t" in token or "\n" in token or "\r" in token:
+                skipped += 1
+                continue
+            wf.write(f"{token}\t{count}\n")
+    os.replace(f"{tsv_path}.tmp", tsv_path)
+    logs.get_logger().info(f"Skipped {skipped} pre-tokens with tabs or newlines.")
+    return tsv_path
+
+
+def main():
+    from train import PATTERN_STRINGS
+
+    args = parser.parse_args()
+    logs.configure_logging()
+    settings = cache_settings(
+        args.data_pattern,
+        PATTERN_STRINGS.get(args.pattern_string, None),
+        args.split_digits,
+        args.normalize,
+    )
+    print(get_cache(args.cache_dir, settings, args.processes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Tests for the pre-token count cache."""
+
+import gzip
+import json
+import os
+import random
+
+import pytest
+
+tokenizers = pytest.importorskip("tokenizers")
+
+import pretokenize
+from train import PATTERN_STRINGS, load_jsonl_data, train_bpe, training_generator
+
+PATTERN = PATTERN_STRINGS["tiktoken"]
+WORDS = ["the", "quick", "brown", "fox", "jumps", "over", "lazy", "dog", "1234"]
+WORDS += ["tokenizer", "héllo", "naïve", "日本"]
+
+
+@pytest.fixture
+def data(tmp_path):
+    rng = random.Random(0)
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    for i in range(3):
+        with gzip.open(data_dir / f"{i}.jsonl.gz", "wt") as f:
+            for _ in range(50):
+                text = " ".join(rng.choice(WORDS) for _ in range(30)) + "\n"
+                f.write(json.dumps({"text": text}) + "\n")
+    return str(data_dir / "*.jsonl.gz")
+
+
+def settings(data, pattern=PATTERN):
+    return pretokenize.cache_settings(data, pattern, True, False)
+
+
+def test_cache_is_reused(data, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    path = pretokenize.get_cache(cache_dir, settings(data))
+    counts = dict(pretokenize.load_counts(path))
+    assert counts["the"] > 0
+    assert counts["1"] > 0
+
+    def build_cache(*args, **kwargs):
+        raise AssertionError("The cache should have been reused.")
+
+    monkeypatch.setattr(pretokenize, "build_cache", build_cache)
+    assert pretokenize.get_cache(cache_dir, settings(data)) == path
+
+
+def test_cache_key_changes(data, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    path = pretokenize.cache_path(cache_dir, settings(data))
+    assert pretokenize.cache_path(cache_dir, settings(data)) == path
+    assert (
+        pretokenize.cache_path(cache_dir, settings(data, PATTERN_STRINGS["gpt2"]))
+        != path
+    )
+
+    shard = str(tmp_path / "data" / "0.jsonl.gz")
+    stat = os.stat(shard)
+    os.utime(shard, (stat.st_atime, stat.st_mtime + 10))
+    touched = pretokenize.cache_path(cache_dir, settings(data))
+    assert touched != path
+
+    # Regenerated in place with the same mtime, but a different size.
+    with gzip.open(shard, "at") as f:
+        f.write(json.dumps({"text": "more text"}) + "\n")
+    os.utime(shard, (stat.st_atime, stat.st_mtime + 10))
+    assert pretokenize.cache_path(cache_dir, settings(data)) not in (path, touched)
+
+
+def merges(path):
+    with open(path) as f:
+        model = json.load(f)["model"]
+    return model["merges"], model["vocab"]
+
+
+def test_replayed_counts_match_training_on_text(data, tmp_path):
+    cache = pretokenize.get_cache(str(tmp_path / "cache"), settings(data))
+    cached_path = str(tmp_path / "cached.json")
+    train_bpe(
+        pretokenize.pretokenized_iterator(cache, scale=1),
+        cached_path,
+        300,
+        pattern_string=PATTERN,
+        split_digits=True,
+        pretokenized=True,
+    )
+    text_path = str(tmp_path / "text.json")
+    train_bpe(
+        training_generator(load_jsonl_data(data, 10), 10, data_limit=-1),
+        text_path,
+        300,
+        pattern_string=PATTERN,
+        split_digits=True,
+    )
+    assert merges(cached_path) == merges(text_path)
+
+
+def test_replay_scale(data, tmp_path):
+    cache = pretokenize.get_cache(str(tmp_path / "cache"), settings(data))
+    unique = sum(1 for _ in pretokenize.load_counts(cache))
+    scale = pretokenize.replay_scale(cache, replay_factor=2)
+    assert scale > 1
+    replayed = sum(
+        len(b) for b in pretokenize.pretokenized_iterator(cache, scale=scale)
+    )
+    assert replayed <= 2 * unique * 2
+    assert pretokenize.replay_scale(cache, replay_factor=10**9) == 1
@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
 
 import argparse
+import glob
 import json
 import logging
 import multiprocessing as mp
 import os
 import re
+import traceback
 from queue import Queue
+from typing import Iterator, Sequence
 
 import smart_open
 from dolma.core.parallel import BaseParallelProcessor
@@ -42,6 +45,115 @@ parser.add_argument("--meta", help="Location to save dolma processing metadata."
 
 logs.configure_logging(level="DEBUG")
 
+# Newlines end a sentence for SentencePiece, so we replace them with a symbol.
+NEWLINE = "<n>"
+
+
+def preprocess_text(text: str) -> str:
+    return re.sub(r"\n", NEWLINE, text)
+
+
+def split_sentences(text: str, max_length: int = 50_000) -> Iterator[str]:
+    """Split text into chunks of at most `max_length` UTF-8 bytes, at `<n>` if possible.
+
+    SentencePiece skips sentences longer than its `max_sentence_length`, which
+    it measures in bytes, so long documents would otherwise be dropped from
+    training entirely.
+    """
+    data = text.encode("utf-8")
+    newline = NEWLINE.encode("utf-8")
+    while len(data) > max_length:
+        split = data.rfind(newline, 0, max_length - len(newline) + 1)
+        if split > 0:
+            split += len(newline)
+        else:
+            split = max_length
+            # Don't cut a character in half, continuation bytes are 0b10xxxxxx.
+            while data[split] & 0xC0 == 0x80:
+                split -= 1
+        yield data[:split].decode("utf-8")
+        data = data[split:]
+    if data:
+        yield data.decode("utf-8")
+
+
+class ReaderError:
+    """Sent by a worker that failed, holds the formatted traceback."""
+
+    def __init__(self, traceback: str):
+        self.traceback = traceback
+
+
+def _read_sentences(
+    file_paths: Sequence[str], max_length: int, batch_size: int, queue: mp.Queue
+):
+    """Worker that decompresses and preprocesses files, sending sentences back in batches."""
+    logger = logs.get_logger()
+    batch = []
+    try:
+        for file_path in file_paths:
+            logger.debug("Streaming sentences from %s", file_path)
+            with smart_open.open(file_path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    text = preprocess_text(json.loads(line)["text"])
+                    batch.extend(split_sentences(text, max_length))
+                    if len(batch) >= batch_size:
+                        queue.put(batch)
+                        batch = []
+        if batch:
+            queue.put(batch)
+    except Exception:
+        # Don't end the stream quietly, or the trainer would use partial data.
+        queue.put(ReaderError(traceback.format_exc()))
+    queue.put(None)
+
+
+def stream_sentences(
+    pattern: str,
+    processes: int = 1,
+    max_length: int = 50_000,
+    batch_size: int = 256,
+    queue_size: int = 64,
+) -> Iterator[str]:
+    """Stream preprocessed sentences from dolma files for `sentence_iterator`.
+
+    This does the same thing as `SentencePieceProcessor`, but instead of
+    writing text files for `spm_train`, sentences are passed straight to the
+    trainer. Files are split between `processes` workers and their output is
+    passed back through a bounded queue, so memory use stays flat and no
+    intermediate files are written.
+    """
+    file_paths = sorted(glob.glob(pattern))
+    processes = max(min(processes, len(file_paths)), 1)
+    queue = mp.Queue(maxsize=queue_size)
+    workers = [
+        mp.Process(
+            target=_read_sentences,
+            args=(file_paths[i::processes], max_length, batch_size, queue),
+            daemon=True,
+        )
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        running = processes
+        while running:
+            batch = utils.queue_get(queue, workers)
+            if batch is None:
+                running -= 1
+                continue
+            if isinstance(batch, ReaderError):
+                raise RuntimeError(f"Sentence reader failed:\n{batch.traceback}")
+            yield from batch
+    finally:
+        # The trainer may stop reading early (i.e. `input_sentence_size`).
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
 
 def create_shadow(path):
     h, t = os.path.split(path)
@@ -105,7 +217,7 @@ class SentencePieceProcessor(BaseParallelProcessor):
                                 )
                                 continue
 
-                            processed = re.sub(r"\n", "<n>", data["text"])
+                            processed = preprocess_text(data["text"])
 
                             if processed is None:
                                 logger.warning(
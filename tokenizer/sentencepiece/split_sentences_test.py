@@ -0,0 +1,41 @@
+"""Tests for splitting long documents into chunks SentencePiece will train on."""
+
+import importlib.util
+import os
+
+import pytest
+
+# The stackexchange source also has a `preprocess` module, so load ours by path.
+_spec = importlib.util.spec_from_file_location(
+    "spm_preprocess", os.path.join(os.path.dirname(__file__), "preprocess.py")
+)
+preprocess = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(preprocess)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Short text.",
+        "Plain ascii words. " * 100,
+        # 3 bytes per character, no newlines to split at.
+        "日本語のテキスト" * 200,
+        # 2 byte characters with some newlines.
+        ("Привет, как дела?" * 20 + preprocess.NEWLINE) * 10,
+        # Mixed 1, 2, 3 and 4 byte characters.
+        "aé中😀" * 300,
+    ],
+)
+@pytest.mark.parametrize("max_length", [64, 101, 1000])
+def test_split_sentences_bytes(text, max_length):
+    chunks = list(preprocess.split_sentences(text, max_length))
+    assert all(len(c.encode("utf-8")) <= max_length for c in chunks)
+    assert all(chunks)
+    assert "".join(chunks) == text
+
+
+def test_split_sentences_prefers_newlines():
+    text = preprocess.NEWLINE.join(["ä" * 20] * 5)
+    chunks = list(preprocess.split_sentences(text, 100))
+    assert all(c.endswith(preprocess.NEWLINE) for c in chunks[:-1])
+    assert "".join(chunks) == text
@@ -1,40 +1,82 @@
-import json
+"""Train a SentencePiece model with sentences streamed from dolma files.
+
+Unlike `preprocess.py` + `train_spm.sh`, nothing is written to disk besides
+the model, the `<n>` substitution happens as the files are read.
+"""
+
+import argparse
+import multiprocessing as mp
 
 import sentencepiece as spm
-import smart_open
-
-
-def sp_training_generator():
-    with smart_open.open(
-        "../../pep/data/peps-dolma/v0/documents/00000_peps.jsonl.gz"
-    ) as f:
-        for line in f:
-            if line:
-                yield json.loads(line)["text"]
-
-
-print(next(sp_training_generator()))
-
-spm.SentencePieceTrainer.train(
-    sentence_iterator=sp_training_generator(),
-    model_prefix="common-pile",
-    vocab_size=20000,
-    character_coverage=0.99,
-    model_type="unigram",
-    split_digits=True,
-    user_defined_symbols=["\n", "\r"],
-    byte_fallback=True,
-    normalization_rule_name="nfkc",
-    allow_whitespace_only_pieces=True,
-    remove_extra_whitespaces=False,
-    max_sentence_length=50000,
-    unk_id=1,
-    bos_id=2,
-    eos_id=3,
-    pad_id=0,
-    pad_piece="<pad>",
-    unk_piece="<unk>",
-    bos_piece="<bos>",
-    eos_piece="</s>",
-    train_extremely_large_corpus=True,
+from preprocess import NEWLINE, stream_sentences
+
+from common_pile import logs
+
+parser = argparse.ArgumentParser(description="Train a SentencePiece tokenizer.")
+parser.add_argument(
+    "--data_pattern",
+    default="../../pep/data/peps-dolma/v0/documents/*.jsonl.gz",
+    help="A glob of jsonl.gz files to train on.",
+)
+parser.add_argument(
+    "--model_prefix", default="common-pile", help="Where to save the model."
+)
+parser.add_argument(
+    "--vocab_size", type=int, default=20000, help="The size of the vocab."
+)
+parser.add_argument(
+    "--max_sentence_length",
+    type=int,
+    default=50000,
+    help="Documents are split into sentences of at most this many UTF-8 bytes, "
+    "SentencePiece skips longer ones.",
 )
+parser.add_argument(
+    "--input_sentence_size",
+    type=int,
+    default=0,
+    help="If set, SentencePiece samples this many sentences to train on.",
+)
+parser.add_argument(
+    "--processes",
+    type=int,
+    default=mp.cpu_count(),
+    help="Number of processes reading the data.",
+)
+
+
+def main(args):
+    spm.SentencePieceTrainer.train(
+        sentence_iterator=stream_sentences(
+            args.data_pattern,
+            processes=args.processes,
+            max_length=args.max_sentence_length,
+        ),
+        model_prefix=args.model_prefix,
+        vocab_size=args.vocab_size,
+        character_coverage=0.99,
+        model_type="unigram",
+        split_digits=True,
+        user_defined_symbols=[NEWLINE],
+        byte_fallback=True,
+        normalization_rule_name="nfkc",
+        allow_whitespace_only_pieces=True,
+        remove_extra_whitespaces=False,
+        max_sentence_length=args.max_sentence_length,
+        input_sentence_size=args.input_sentence_size,
+        shuffle_input_sentence=True,
+        unk_id=1,
+        bos_id=2,
+        eos_id=3,
+        pad_id=0,
+        pad_piece="<pad>",
+        unk_piece="<unk>",
+        bos_piece="<bos>",
+        eos_piece="</s>",
+        train_extremely_large_corpus=True,
+    )
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    main(args)
@@ -1,12 +1,18 @@
 """Tools to train common-pile tokenizers."""
 
 import argparse
+import collections
 import dataclasses
 import glob
 import json
-from typing import Iterator, List
+import multiprocessing as mp
+import os
+import random
+import traceback
+from typing import Dict, Iterator, List, Sequence
 
 import datasets
+import pretokenize
 import smart_open
 
 from common_pile import logs, utils
@@ -26,6 +32,17 @@ parser.add_argument(
     "--streaming", action="store_true", help="Should we stream the hf dataset?"
 )
 parser.add_argument("--data_pattern", help="A glob of jsonl.gz files to train on.")
+parser.add_argument(
+    "--num_readers",
+    default=1,
+    type=int,
+    help="The number of processes used to read --data_pattern files.",
+)
+parser.add_argument(
+    "--seed",
+    type=int,
+    help="If set, shuffle the --data_pattern files with this seed before reading.",
+)
 parser.add_argument(
     "--subset", default="default", help="The subset of the dataset to us."
 )
@@ -60,6 +77,40 @@ parser.add_argument(
     default=-1,
     help="The size to limit the training dataset (in GB). Use -1 for whole dataset.",
 )
+parser.add_argument(
+    "--stratify",
+    action="store_true",
+    help="Sample --data_limit GB from --data_pattern files with a quota for each dolma source.",
+)
+parser.add_argument(
+    "--source_weights",
+    type=json.loads,
+    help='JSON mapping of source to weight for --stratify, i.e. \'{"wiki": 2, "arxiv": 1}\'. '
+    "Defaults to the size of each source on disk.",
+)
+parser.add_argument(
+    "--doc_sample_rate",
+    type=float,
+    default=1.0,
+    help="With --stratify, keep each document with this probability so quotas are spread over more files.",
+)
+parser.add_argument(
+    "--pretoken_cache",
+    help="A directory of pre-token count caches, the counts for --data_pattern "
+    "and the pre-tokenization settings are built once and reused for training. "
+    "Requires a --pattern_string. Note that with --algo unigram, SentencePiece is "
+    "then trained on the regex pre-tokens, while without the cache the regex is "
+    "ignored, so the two give different tokenizers.",
+)
+parser.add_argument(
+    "--pretoken_scale",
+    type=int,
+    default=0,
+    help="Divide cached BPE counts by this much to replay fewer tokens while training. "
+    "The default (0) picks a scale that replays about 10 tokens per unique pre-token. "
+    "This is approximate, pre-tokens seen fewer times than the scale are dropped, "
+    "use 1 to get the same merges as training on the text.",
+)
 parser.add_argument(
     "--normalize",
     action="store_true",
@@ -114,11 +165,13 @@ def load_hf_data(
         yield batch
 
 
-def load_jsonl_data(pattern: str, batch_size: int, **kwargs) -> Iterator[List[str]]:
-    """Load training data from a collection of .jsonl.gz files."""
+def read_jsonl_shards(
+    file_paths: Sequence[str], batch_size: int
+) -> Iterator[List[str]]:
+    """Read the text from .jsonl.gz files in order, in batches of `batch_size`."""
     logger = logs.get_logger()
     batch = []
-    for file_path in glob.iglob(pattern):
+    for file_path in file_paths:
         logger.info(f"Reading examples from {file_path}")
         with smart_open.open(file_path) as f:
             for line in f:
@@ -132,6 +185,186 @@ def load_jsonl_data(pattern: str, batch_size: int, **kwargs) -> Iterator[List[st
         yield batch
 
 
+class ReaderError:
+    """Sent by a reader process that failed, holds the formatted traceback."""
+
+    def __init__(self, traceback: str):
+        self.traceback = traceback
+
+
+def _shard_reader(file_paths: Sequence[str], batch_size: int, queue: mp.Queue):
+    """Worker process that streams batches from its shards back through `queue`."""
+    try:
+        for batch in read_jsonl_shards(file_paths, batch_size):
+            queue.put(batch)
+    except Exception:
+        queue.put(ReaderError(traceback.format_exc()))
+    queue.put(None)
+
+
+def load_jsonl_data(
+    pattern: str,
+    batch_size: int,
+    num_workers: int = 1,
+    seed: int | None = None,
+    queue_size: int = 16,
+    **kwargs,
+) -> Iterator[List[str]]:
+    """Load training data from a collection of .jsonl.gz files.
+
+    With `num_workers > 1`, shards are dealt round-robin to reader processes
+    that decompress and parse them in parallel. Each worker has its own
+    bounded queue (`queue_size` batches) and batches are taken from the
+    workers in a fixed rotation, so the order of the data only depends on the
+    files, the `seed` used to shuffle them, `batch_size`, and `num_workers`,
+    not on how fast each worker is.
+    """
+    logger = logs.get_logger()
+    file_paths = sorted(glob.glob(pattern))
+    if seed is not None:
+        random.Random(seed).shuffle(file_paths)
+    num_workers = min(num_workers, len(file_paths))
+    if num_workers <= 1:
+        yield from read_jsonl_shards(file_paths, batch_size)
+        return
+
+    logger.info(f"Reading {len(file_paths)} files with {num_workers} processes.")
+    queues = [mp.Queue(maxsize=queue_size) for _ in range(num_workers)]
+    workers = [
+        mp.Process(
+            target=_shard_reader,
+            args=(file_paths[i::num_workers], batch_size, queues[i]),
+            daemon=True,
+        )
+        for i in range(num_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        active = list(range(num_workers))
+        while active:
+            for i in list(active):
+                batch = utils.queue_get(queues[i], [workers[i]])
+                if batch is None:
+                    active.remove(i)
+                elif isinstance(batch, ReaderError):
+                    raise RuntimeError(f"Reader process failed:\n{batch.traceback}")
+                else:
+                    yield batch
+        for worker in workers:
+            worker.join()
+    finally:
+        # The trainer can stop early (i.e. --data_limit), so the workers may
+        # still be blocked on a full queue.
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
+
+def shard_source(file_path: str) -> str:
+    """The dolma `source` of a shard, based on its first example."""
+    with smart_open.open(file_path) as f:
+        for line in f:
+            if line.strip():
+                return json.loads(line).get("source", "unknown")
+    return "unknown"
+
+
+def source_quotas(
+    sizes: Dict[str, int],
+    data_limit: float,
+    weights: Dict[str, float] | None = None,
+) -> Dict[str, float]:
+    """Split `data_limit` bytes between sources, by `weights` or by their size on disk."""
+    weights = weights if weights is not None else sizes
+    total = sum(weights.get(source, 0) for source in sizes)
+    if not total:
+        raise ValueError("None of the sources have any weight.")
+    return {source: data_limit * weights.get(source, 0) / total for source in sizes}
+
+
+def sample_source(
+    file_paths: Sequence[str],
+    quota: float,
+    rng: random.Random,
+    doc_sample_rate: float = 1.0,
+) -> Iterator[str]:
+    """Yield text from the shards of one source until `quota` characters are reached."""
+    logger = logs.get_logger()
+    size = 0
+    for file_path in file_paths:
+        with smart_open.open(file_path) as f:
+            for line in f:
+                # Skip before parsing so thinning also saves the json.loads.
+                if not line.strip() or rng.random() >= doc_sample_rate:
+                    continue
+                text = json.loads(line)["text"]
+                size += len(text)
+                yield text
+                if size >= quota:
+                    return
+    logger.warning(
+        f"Ran out of data after {size / BYTES_PER_GIGABYTE}GB of a "
+        f"{quota / BYTES_PER_GIGABYTE}GB quota."
+    )
+
+
+def load_stratified_jsonl_data(
+    pattern: str,
+    batch_size: int,
+    data_limit: float,
+    source_weights: Dict[str, float] | None = None,
+    doc_sample_rate: float = 1.0,
+    seed: int | None = None,
+) -> Iterator[List[str]]:
+    """Sample `data_limit` GB of training data, stratified by the dolma `source` field.
+
+    Each source gets a quota, proportional to its size on disk unless
+    `source_weights` are given, and reading a source stops as soon as its
+    quota is met. The shards of a source are read in a seeded random order,
+    optionally keeping each document with probability `doc_sample_rate`, so
+    quotas are filled from across the source instead of its first files.
+    Sources are interleaved document by document so every batch has a mix.
+    Shards are assumed to only hold documents from a single source.
+    """
+    logger = logs.get_logger()
+    rng = random.Random(seed)
+    shards = collections.defaultdict(list)
+    sizes = collections.Counter()
+    for file_path in sorted(glob.glob(pattern)):
+        source = shard_source(file_path)
+        shards[source].append(file_path)
+        sizes[source] += os.path.getsize(file_path)
+    quotas = source_quotas(sizes, data_limit * BYTES_PER_GIGABYTE, source_weights)
+    streams = {}
+    for source, file_paths in sorted(shards.items()):
+        logger.info(
+            f"Sampling {quotas[source] / BYTES_PER_GIGABYTE}GB from {source} "
+            f"({len(file_paths)} files)."
+        )
+        rng.shuffle(file_paths)
+        if quotas[source] > 0:
+            streams[source] = sample_source(
+                file_paths, quotas[source], rng, doc_sample_rate
+            )
+
+    batch = []
+    while streams:
+        for source in list(streams):
+            text = next(streams[source], None)
+            if text is None:
+                logger.info(f"Finished sampling from {source}.")
+                del streams[source]
+                continue
+            batch.append(text)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        logger.warning("Yielding final ragged batch")
+        yield batch
+
+
 def training_generator(data, batch_size: int, data_limit: float = -1):
     """Unify data format and add limits to training data size."""
     logger = logs.get_logger()
@@ -159,8 +392,14 @@ def train_bpe(
     pattern_string: str | None = None,
     split_digits: bool = True,
     normalize: bool = False,
+    pretokenized: bool = False,
 ):
-    """Train a BPE model using HuggingFace Tokenizers."""
+    """Train a BPE model using HuggingFace Tokenizers.
+
+    When `pretokenized`, `data_iter` yields pre-tokens that were already
+    normalized and split (see `pretokenize.py`), so only the ByteLevel mapping
+    is applied while training.
+    """
     from tokenizers import (
         Regex,
         Tokenizer,
@@ -199,6 +438,10 @@ def train_bpe(
             pre_tokenizers.Digits(individual_digits=True),
         ] + pretokenizers
     tokenizer.pre_tokenizer = pre_tokenizers.Sequence(pretokenizers)
+    if pretokenized:
+        normalizer, pre_tokenizer = tokenizer.normalizer, tokenizer.pre_tokenizer
+        tokenizer.normalizer = None
+        tokenizer.pre_tokenizer = pretokenizers[-1]
     trainer = trainers.BpeTrainer(
         vocab_size=vocab_size,
         special_tokens=[
@@ -211,6 +454,9 @@ def train_bpe(
         max_token_length=30,
     )
     tokenizer.train_from_iterator(data_iter, trainer=trainer)
+    if pretokenized:
+        tokenizer.normalizer = normalizer
+        tokenizer.pre_tokenizer = pre_tokenizer
     tokenizer.post_processor = processors.ByteLevel(trim_offsets=False)
     tokenizer.decoder = decoders.ByteLevel()
     logger.info(f"Saving tokenizer to {output_path}")
@@ -226,14 +472,21 @@ def train_unigram(
     pattern_string: str | None = None,
     split_digits: bool = True,
     normalize: bool = False,
+    input_path: str | None = None,
 ):
-    """Train a Unigram model with SentencePiece."""
+    """Train a Unigram model with SentencePiece.
+
+    If `input_path` is given it is used instead of `data_iter`, it should be a
+    tsv of `pre-token\tcount` lines (see `pretokenize.py`). Those pre-tokens
+    were split by `pattern_string`, so in that case the regex does apply,
+    pieces never cross its boundaries.
+    """
     import sentencepiece as spm
 
     logger = logs.get_logger()
     logger.info(f"Training Unigram Tokenizer with vocab_size={vocab_size}")
 
-    if pattern_string is not None:
+    if pattern_string is not None and input_path is None:
         logger.warning(
             "Regex pattern string supplied but not supported for unigram yet. Ignoring."
         )
@@ -242,7 +495,11 @@ def train_unigram(
         logger.info("Spliting numbers into individual digits.")
 
     spm.SentencePieceTrainer.train(
-        sentence_iterator=data_iter,
+        **(
+            {"input": input_path, "input_format": "tsv"}
+            if input_path is not None
+            else {"sentence_iterator": data_iter}
+        ),
         model_prefix=output_path,
         vocab_size=vocab_size,
         character_coverage=character_coverage,
@@ -297,8 +554,26 @@ def main():
         data = load_hf_data(
             args.dataset, args.batch_size, subset=args.subset, streaming=args.streaming
         )
-    if args.data_pattern is not None:
-        data = load_jsonl_data(args.data_pattern, args.batch_size)
+    if args.stratify:
+        if args.data_pattern is None or args.data_limit <= 0:
+            raise ValueError("--stratify requires --data_pattern and --data_limit.")
+        data = load_stratified_jsonl_data(
+            args.data_pattern,
+            args.batch_size,
+            args.data_limit,
+            source_weights=args.source_weights,
+            doc_sample_rate=args.doc_sample_rate,
+            seed=args.seed,
+        )
+        # The sampler already enforces the limit, split between the sources.
+        args.data_limit = -1
+    elif args.data_pattern is not None:
+        data = load_jsonl_data(
+            args.data_pattern,
+            args.batch_size,
+            num_workers=args.num_readers,
+            seed=args.seed,
+        )
 
     if args.pattern_string == "tiktoken+digits":
         logger.warning(
@@ -308,6 +583,53 @@ def main():
     # Convert nice names into ugly regex strings.
     pattern_string = PATTERN_STRINGS.get(args.pattern_string, None)
 
+    if args.pretoken_cache is not None:
+        if args.data_pattern is None:
+            raise ValueError("--pretoken_cache requires --data_pattern.")
+        if pattern_string is None:
+            # Without a regex, each document would be cached as one pre-token.
+            raise ValueError(
+                "--pretoken_cache requires a --pattern_string other than none."
+            )
+        if args.data_limit > 0 or args.stratify:
+            logger.warning(
+                "The pre-token cache counts all files, ignoring --data_limit."
+            )
+        settings = pretokenize.cache_settings(
+            args.data_pattern, pattern_string, args.split_digits, args.normalize
+        )
+        cache = pretokenize.get_cache(
+            args.pretoken_cache, settings, processes=args.num_readers
+        )
+        if args.algo == "unigram":
+            logger.warning(
+                "Training unigram on pre-tokens split by --pattern_string, without "
+                "--pretoken_cache the regex is ignored, so this gives a different "
+                "tokenizer."
+            )
+            train_unigram(
+                None,
+                args.output_path,
+                args.vocab_size,
+                pattern_string=pattern_string,
+                split_digits=args.split_digits,
+                normalize=args.normalize,
+                input_path=pretokenize.write_sentencepiece_tsv(cache),
+            )
+        else:
+            scale = args.pretoken_scale or pretokenize.replay_scale(cache)
+            logger.info(f"Replaying pre-token counts divided by {scale}.")
+            train_bpe(
+                pretokenize.pretokenized_iterator(cache, scale=scale),
+                args.output_path,
+                args.vocab_size,
+                pattern_string=pattern_string,
+                split_digits=args.split_digits,
+                normalize=args.normalize,
+                pretokenized=True,
+            )
+        return
+
     # Setup the input data.
     data_iter = training_generator(data, args.batch_size, data_limit=args.data_limit)
     # Train the tokenizer.
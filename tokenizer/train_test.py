@@ -0,0 +1,107 @@
+"""Tests for reading the tokenizer training data."""
+
+import collections
+import gzip
+import json
+import random
+
+import pytest
+from train import (
+    BYTES_PER_GIGABYTE,
+    load_jsonl_data,
+    load_stratified_jsonl_data,
+    sample_source,
+    source_quotas,
+)
+
+
+def write_shards(tmp_path, num_shards, docs_per_shard):
+    texts = []
+    for i in range(num_shards):
+        with gzip.open(tmp_path / f"{i:03}.jsonl.gz", "wt") as wf:
+            for j in range(docs_per_shard):
+                texts.append(f"shard {i} document {j}")
+                wf.write(json.dumps({"text": texts[-1]}) + "\n")
+    return str(tmp_path / "*.jsonl.gz"), texts
+
+
+@pytest.mark.parametrize("num_workers", [1, 3])
+def test_load_jsonl_data_reads_every_document(tmp_path, num_workers):
+    pattern, texts = write_shards(tmp_path, 5, 7)
+    batches = list(load_jsonl_data(pattern, 4, num_workers=num_workers, seed=1))
+    assert all(len(batch) <= 4 for batch in batches)
+    read = [text for batch in batches for text in batch]
+    assert sorted(read) == sorted(texts)
+    # The order only depends on the files and the settings.
+    again = load_jsonl_data(pattern, 4, num_workers=num_workers, seed=1)
+    assert [text for batch in again for text in batch] == read
+
+
+def test_load_jsonl_data_stops_early(tmp_path):
+    pattern, _ = write_shards(tmp_path, 4, 100)
+    data = load_jsonl_data(pattern, 2, num_workers=2, queue_size=1)
+    assert len(next(data)) == 2
+    # The readers are blocked on their full queues, closing has to stop them.
+    data.close()
+
+
+def test_load_jsonl_data_reader_failure(tmp_path):
+    pattern, _ = write_shards(tmp_path, 4, 3)
+    with gzip.open(tmp_path / "002.jsonl.gz", "wt") as wf:
+        wf.write(json.dumps({"text": "fine"}) + "\n")
+        wf.write("{not json\n")
+    with pytest.raises(RuntimeError, match="Reader process failed"):
+        list(load_jsonl_data(pattern, 2, num_workers=2))
+
+
+def write_source(tmp_path, source, num_shards, docs_per_shard, doc_length):
+    """Every document is `doc_length` characters and starts with its source."""
+    for i in range(num_shards):
+        with gzip.open(tmp_path / f"{source}-{i:03}.jsonl.gz", "wt") as wf:
+            for j in range(docs_per_shard):
+                text = f"{source} {i} {j} ".ljust(doc_length, "x")
+                wf.write(json.dumps({"text": text, "source": source}) + "\n")
+
+
+def test_sample_source_stops_at_quota(tmp_path):
+    write_source(tmp_path, "a", 3, 10, 20)
+    paths = sorted(str(path) for path in tmp_path.glob("a-*"))
+    texts = list(sample_source(paths, 150, random.Random(0)))
+    # Stops at the first document that reaches the quota.
+    assert len(texts) == 8
+    # Or runs out of data.
+    assert len(list(sample_source(paths, 10_000, random.Random(0)))) == 30
+    thinned = list(sample_source(paths, 10_000, random.Random(0), 0.5))
+    assert 0 < len(thinned) < 30
+
+
+@pytest.mark.parametrize("weights", [None, {"a": 1, "b": 3, "c": 0}])
+def test_stratified_sampling_respects_quotas(tmp_path, weights):
+    write_source(tmp_path, "a", 4, 50, 20)
+    write_source(tmp_path, "b", 2, 50, 20)
+    write_source(tmp_path, "c", 1, 50, 20)
+    pattern = str(tmp_path / "*.jsonl.gz")
+    sizes = collections.Counter()
+    for path in tmp_path.glob("*.jsonl.gz"):
+        sizes[path.name[0]] += path.stat().st_size
+    data_limit = 1200
+    quotas = source_quotas(sizes, data_limit, weights)
+
+    batches = list(
+        load_stratified_jsonl_data(
+            pattern, 8, data_limit / BYTES_PER_GIGABYTE, weights, seed=0
+        )
+    )
+    sampled = collections.Counter()
+    for batch in batches:
+        for text in batch:
+            sampled[text[0]] += len(text)
+    for source, quota in quotas.items():
+        if quota > 0:
+            assert quota <= sampled[source] < quota + 20
+        else:
+            assert sampled[source] == 0
+    # Sources are interleaved, not read one after the other.
+    assert len({text[0] for text in batches[0]}) == len(
+        [quota for quota in quotas.values() if quota > 0]
+    )